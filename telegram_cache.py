@@ -0,0 +1,172 @@
+"""
+Content-addressed cache of delivered results, so repeated identical prompts can
+be answered from the bot loop without running the workflow again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# Default number of cached results kept before least recently used ones are evicted
+DEFAULT_MAX_ENTRIES = 1000
+# Seconds a result counts as being generated if its workflow never replies
+EXPECT_TIMEOUT = 600
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize message text so trivially different prompts share a cache entry."""
+    return " ".join(text.casefold().split())
+
+
+def workflow_fingerprint(
+    prompt: Optional[Dict[str, Any]], exclude_node: Optional[str] = None
+) -> str:
+    """
+    Hash the workflow graph and its parameters, leaving out the listener node
+    itself since its inputs do not affect the result.
+    """
+    if not prompt:
+        return ""
+    graph = {
+        node_id: node
+        for node_id, node in prompt.items()
+        if str(node_id) != str(exclude_node)
+    }
+    data = json.dumps(graph, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def result_cache_key(text: str, fingerprint: str) -> str:
+    """Build the cache key for a prompt run through a given workflow."""
+    data = json.dumps([normalize_prompt(text), fingerprint])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    A TTL and LRU bounded store mapping cache keys to delivered outputs
+    (text or Telegram file_ids), backed by SQLite.
+    """
+
+    def __init__(self, path: str = ":memory:", max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pending = {}  # (bot_token, chat_id) -> (key, ttl, expected at)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached output for a key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any], ttl: float):
+        """Store an output for ttl seconds, evicting the least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += count - self.max_entries
+            self._db.commit()
+
+    def expect(self, bot_token: str, chat_id: int, key: str, ttl: float):
+        """Remember that the next result delivered to a chat answers the given key."""
+        with self._lock:
+            self._pending[(bot_token, chat_id)] = (key, ttl, time.time())
+
+    def discard(self, bot_token: str, chat_id: int):
+        """Forget the result expected for a chat, so nothing else is cached for it."""
+        with self._lock:
+            self._pending.pop((bot_token, chat_id), None)
+
+    def is_expected(self, key: str) -> bool:
+        """Check whether a result for the key is being generated."""
+        since = time.time() - EXPECT_TIMEOUT
+        with self._lock:
+            return any(
+                pending[0] == key and pending[2] > since
+                for pending in self._pending.values()
+            )
+
+    def fulfil(self, bot_token: str, chat_id: int, value: Dict[str, Any]) -> bool:
+        """Cache a delivered result if one was expected for the chat."""
+        with self._lock:
+            pending: Optional[Tuple[str, float, float]] = self._pending.pop(
+                (bot_token, chat_id), None
+            )
+        if pending is None:
+            return False
+        self.put(pending[0], value, pending[1])
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current hit rate."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Return the process-wide result cache. Set TELEGRAM_RESULT_CACHE to a file
+    path to keep cached results across restarts.
+    """
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(
+                path=os.environ.get("TELEGRAM_RESULT_CACHE", ":memory:"),
+                max_entries=int(
+                    os.environ.get("TELEGRAM_RESULT_CACHE_SIZE", DEFAULT_MAX_ENTRIES)
+                ),
+            )
+        return _result_cache
@@ -0,0 +1,129 @@
+"""
+"typing" / "upload_photo" chat actions kept alive for chats waiting for a
+reply, so users see the bot working during long generations. All chats of a
+bot are refreshed from one timer on its event loop.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict
+
+try:
+    from .telegram_outbox import is_transient_error
+except ImportError:
+    from telegram_outbox import is_transient_error
+
+CHAT_ACTIONS = ["typing", "upload_photo", "upload_video", "none"]
+
+# Seconds Telegram shows a chat action, unless a message is sent sooner
+CHAT_ACTION_SECONDS = 5.0
+
+# Seconds between refreshes of the actions of all waiting chats
+CHAT_ACTION_INTERVAL = 4.0
+
+# Seconds after which a chat's action stops even if no reply was sent
+CHAT_ACTION_MAX_DURATION = 600.0
+
+
+class ChatActionKeepalive:
+    """
+    Repeats the chat action of each waiting chat until stopped, the chat has
+    waited max_duration, or Telegram rejects the action. One timer handle
+    serves all chats; it is only scheduled while some chat is waiting.
+    """
+
+    def __init__(
+        self,
+        bot,
+        loop,
+        interval: float = CHAT_ACTION_INTERVAL,
+        max_duration: float = CHAT_ACTION_MAX_DURATION,
+    ):
+        self.bot = bot
+        self.loop = loop
+        self.interval = interval
+        self.max_duration = max_duration
+        self.sent = 0
+        self._chats: Dict[int, list] = {}  # chat_id -> [action, expires, last sent]
+        self._handle = None
+        self._tasks = set()
+
+    def start(self, chat_id: int, action: str = "typing"):
+        """Show an action in a chat until stop(); safe to call from any thread."""
+        if action and action != "none":
+            self._call(self._start, chat_id, action)
+
+    def stop(self, chat_id: int):
+        """Stop a chat's action; safe to call from any thread."""
+        self._call(self._chats.pop, chat_id, None)
+
+    def close(self):
+        """Stop all actions. Must be called on the loop."""
+        self._chats.clear()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def is_active(self, chat_id: int) -> bool:
+        """Whether a chat's action is being kept alive."""
+        return chat_id in self._chats
+
+    def _call(self, callback, *args):
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _start(self, chat_id: int, action: str):
+        now = time.monotonic()
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat[0] = action
+            chat[1] = now + self.max_duration
+            return
+        # Show the action right away; the shared timer refreshes it from then on
+        self._chats[chat_id] = [action, now + self.max_duration, now]
+        self._send(chat_id, action)
+        if self._handle is None:
+            self._handle = self.loop.call_later(self.interval, self._tick)
+
+    def _tick(self):
+        self._handle = None
+        now = time.monotonic()
+        for chat_id, chat in list(self._chats.items()):
+            action, expires, last_sent = chat
+            if now >= expires:
+                del self._chats[chat_id]
+            elif now - last_sent >= self.interval / 4:
+                # Chats started just before the tick still show their action until the
+                # next one, at most 1.25 intervals (CHAT_ACTION_SECONDS) after this send
+                chat[2] = now
+                self._send(chat_id, action)
+        if self._chats:
+            self._handle = self.loop.call_later(self.interval, self._tick)
+
+    def _send(self, chat_id: int, action: str):
+        task = self.loop.create_task(self._send_action(chat_id, action))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_action(self, chat_id: int, action: str):
+        try:
+            await self.bot.send_chat_action(chat_id=chat_id, action=action)
+            self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not is_transient_error(e):
+                # e.g. the bot was blocked: retrying cannot succeed
+                self._chats.pop(chat_id, None)
+            logging.error(f"Error sending chat action to chat {chat_id}: {e}")
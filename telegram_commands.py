@@ -0,0 +1,153 @@
+"""
+Bot commands answered directly on the bot loop from runtime state, without
+running a workflow. Further commands can be added with the command decorator.
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from .telegram_cache import get_result_cache
+    from .telegram_context import get_conversation_store
+    from .telegram_outbox import get_outbox
+    from .telegram_quota import get_usage_ledger
+except ImportError:
+    from telegram_cache import get_result_cache
+    from telegram_context import get_conversation_store
+    from telegram_outbox import get_outbox
+    from telegram_quota import get_usage_ledger
+
+# async handler(runtime, message, args) returning the reply text, or None for no reply
+CommandHandler = Callable[[Any, Any, List[str]], Awaitable[Optional[str]]]
+
+
+class CommandRegistry:
+    """Maps command names to lightweight handlers run on the bot loop."""
+
+    def __init__(self):
+        self.commands: Dict[str, Tuple[CommandHandler, str]] = {}
+
+    def command(
+        self, name: str, description: str = ""
+    ) -> Callable[[CommandHandler], CommandHandler]:
+        """Register a handler for /name; undescribed commands are left out of /help."""
+
+        def decorator(handler: CommandHandler) -> CommandHandler:
+            self.commands[name.lower()] = (handler, description)
+            return handler
+
+        return decorator
+
+    def help_text(self) -> str:
+        """List the described commands."""
+        lines = [
+            f"/{name} - {description}"
+            for name, (_, description) in sorted(self.commands.items())
+            if description
+        ]
+        return "\n".join(
+            ["Send a message to run the workflow with it as the prompt."] + lines
+        )
+
+    async def dispatch(self, runtime, update, context):
+        """Answer a command message."""
+        message = update.message
+        if not message or not message.text:
+            return
+        words = message.text.split()
+        # Commands in groups may be addressed as /name@botname
+        name = words[0][1:].split("@", 1)[0].lower()
+        entry = self.commands.get(name)
+        if entry is None:
+            reply = f"Unknown command /{name}.\n{self.help_text()}"
+        else:
+            try:
+                reply = await entry[0](runtime, message, words[1:])
+            except Exception as e:
+                logging.error(f"Error handling /{name}: {e}")
+                reply = f"Sorry, /{name} failed."
+        if reply:
+            await message.reply_text(reply)
+
+    def handler_for(self, runtime) -> Callable[[Any, Any], Awaitable[None]]:
+        """Return an update handler answering commands for a bot runtime."""
+
+        async def handle_command(update, context):
+            await self.dispatch(runtime, update, context)
+
+        return handle_command
+
+
+_registry = CommandRegistry()
+command = _registry.command
+
+
+def get_commands() -> CommandRegistry:
+    """Return the process-wide command registry."""
+    return _registry
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as e.g. '2h 5m' or '40s'."""
+    seconds = int(seconds)
+    hours, minutes = seconds // 3600, seconds // 60 % 60
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m"
+    return f"{seconds}s"
+
+
+@command("start")
+@command("help", "List the available commands")
+async def _help(runtime, message, args):
+    return get_commands().help_text()
+
+
+@command("status", "Show whether the bot is connected and how busy it is")
+async def _status(runtime, message, args):
+    if runtime.is_running and runtime.started_at is not None:
+        lines = [f"Connected for {format_duration(time.time() - runtime.started_at)}."]
+    else:
+        lines = ["Not connected."]
+    lines.append(f"Requests waiting: {runtime.message_queue.qsize()}")
+    retries = get_outbox().pending_count(runtime.token)
+    if retries:
+        lines.append(f"Replies waiting to be resent: {retries}")
+    cache = get_result_cache().stats()
+    if cache["hits"] + cache["misses"]:
+        lines.append(f"Answered from cache: {cache['hits']} ({cache['hit_rate']:.0%})")
+    return "\n".join(lines)
+
+
+@command("queue", "Show your place in the queue")
+async def _queue(runtime, message, args):
+    position = runtime.queue_position(message.chat_id)
+    if position is None:
+        return "You have no requests waiting."
+    total = runtime.message_queue.qsize()
+    return f"Your next request is number {position} of {total} in the queue."
+
+
+@command("cancel", "Withdraw your waiting requests")
+async def _cancel(runtime, message, args):
+    removed = runtime.cancel(message.chat_id)
+    if not removed:
+        return "You have no requests waiting."
+    return f"Cancelled {removed} waiting request{'s' if removed != 1 else ''}."
+
+
+@command("forget", "Start a new conversation")
+async def _forget(runtime, message, args):
+    get_conversation_store().clear(runtime.token, message.chat_id)
+    return "Earlier messages will no longer be used as context."
+
+
+@command("usage", "Show your requests and generation time in the last hour")
+async def _usage(runtime, message, args):
+    requests, seconds = get_usage_ledger().usage(message.from_user.id)
+    return (
+        f"In the last hour: {requests} request{'s' if requests != 1 else ''}, "
+        f"{format_duration(seconds)} of generation time."
+    )
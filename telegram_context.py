@@ -0,0 +1,196 @@
+"""
+Bounded per-chat conversation history, so workflows can prompt with the last
+few turns of a chat without keeping history themselves.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Tuple
+
+# Turns kept per chat; older turns fall out of the ring buffer
+DEFAULT_TURNS = 10
+
+# Chats kept in memory before the least recently active are evicted
+DEFAULT_MAX_CHATS = 1000
+
+# Characters kept in memory across all chats
+DEFAULT_MAX_CHARS = 4_000_000
+
+# Turns longer than this many characters are truncated
+MAX_TURN_CHARS = 4096
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+
+class _Conversation:
+    """The recent turns of one chat, with the rendered context kept up to date."""
+
+    __slots__ = ("turns", "chars", "rendered")
+
+    def __init__(self, turns: int, history=()):
+        self.turns = deque(maxlen=turns)
+        self.chars = 0
+        self.rendered = ""
+        for role, text in history:
+            self.append(role, text)
+
+    def append(self, role: str, text: str) -> int:
+        """Add a turn and return the change in stored characters."""
+        before = self.chars
+        if len(self.turns) == self.turns.maxlen:
+            self.chars -= len(self.turns[0][1])
+        self.turns.append((role, text))
+        self.chars += len(text)
+        # Render on write so reads only return the cached string
+        self.rendered = "\n".join(
+            f"{ROLE_LABELS.get(r, r)}: {t}" for r, t in self.turns
+        )
+        return self.chars - before
+
+
+def _chat_key(bot_token: str, chat_id: int) -> str:
+    """Key spilled chats without storing the bot token itself."""
+    digest = hashlib.sha256(bot_token.encode("utf-8")).hexdigest()[:16]
+    return f"{digest}:{chat_id}"
+
+
+class ConversationStore:
+    """
+    Ring buffers of recent turns per chat, bounded by chat count and total
+    size. The least recently active chats are evicted first, to a SQLite spill
+    file when one is configured, from which they are restored on next use.
+    """
+
+    def __init__(
+        self,
+        turns: int = DEFAULT_TURNS,
+        max_chats: int = DEFAULT_MAX_CHATS,
+        max_chars: int = DEFAULT_MAX_CHARS,
+        spill_path: Optional[str] = None,
+    ):
+        self.turns = max(1, turns)
+        self.max_chats = max(1, max_chats)
+        self.max_chars = max_chars
+        self.chars = 0
+        self.evictions = 0
+        self._chats: "OrderedDict[Tuple[str, int], _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill = None
+        if spill_path:
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "key TEXT PRIMARY KEY, turns TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._spill.commit()
+
+    def add(self, bot_token: str, chat_id: int, role: str, text: str):
+        """Append a turn ('user' or 'assistant') to a chat's history."""
+        if not text:
+            return
+        with self._lock:
+            conversation = self._get(bot_token, chat_id, create=True)
+            self.chars += conversation.append(role, text[:MAX_TURN_CHARS])
+            self._evict()
+
+    def context(self, bot_token: str, chat_id: int) -> str:
+        """Return a chat's recent turns as 'User: ...' / 'Assistant: ...' lines."""
+        with self._lock:
+            conversation = self._get(bot_token, chat_id)
+            return conversation.rendered if conversation is not None else ""
+
+    def clear(self, bot_token: str, chat_id: int):
+        """Forget a chat's history."""
+        with self._lock:
+            conversation = self._chats.pop((bot_token, chat_id), None)
+            if conversation is not None:
+                self.chars -= conversation.chars
+            if self._spill is not None:
+                self._spill.execute(
+                    "DELETE FROM conversations WHERE key = ?",
+                    (_chat_key(bot_token, chat_id),),
+                )
+                self._spill.commit()
+
+    def _get(
+        self, bot_token: str, chat_id: int, create: bool = False
+    ) -> Optional[_Conversation]:
+        """Return a chat's conversation, restoring it from the spill file if evicted."""
+        key = (bot_token, chat_id)
+        conversation = self._chats.get(key)
+        if conversation is not None:
+            self._chats.move_to_end(key)
+            return conversation
+        history = self._unspill(key)
+        if history is None and not create:
+            return None
+        conversation = _Conversation(self.turns, history or ())
+        self._chats[key] = conversation
+        self.chars += conversation.chars
+        self._evict()
+        return conversation
+
+    def _evict(self):
+        """Evict least recently active chats until within the caps."""
+        while len(self._chats) > 1 and (
+            len(self._chats) > self.max_chats or self.chars > self.max_chars
+        ):
+            key, conversation = self._chats.popitem(last=False)
+            self.chars -= conversation.chars
+            self.evictions += 1
+            if self._spill is not None:
+                self._spill.execute(
+                    "INSERT OR REPLACE INTO conversations (key, turns, updated) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        _chat_key(*key),
+                        json.dumps(list(conversation.turns)),
+                        time.time(),
+                    ),
+                )
+                self._spill.commit()
+
+    def _unspill(self, key: Tuple[str, int]):
+        """Take a chat's turns out of the spill file."""
+        if self._spill is None:
+            return None
+        spill_key = _chat_key(*key)
+        row = self._spill.execute(
+            "SELECT turns FROM conversations WHERE key = ?", (spill_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._spill.execute("DELETE FROM conversations WHERE key = ?", (spill_key,))
+        self._spill.commit()
+        return json.loads(row[0])
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """
+    Return the process-wide conversation store. TELEGRAM_CONTEXT_TURNS,
+    TELEGRAM_CONTEXT_CHATS and TELEGRAM_CONTEXT_CHARS set its bounds, and
+    TELEGRAM_CONTEXT_SPILL a file to evict idle chats to.
+    """
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            _conversation_store = ConversationStore(
+                turns=int(os.environ.get("TELEGRAM_CONTEXT_TURNS", DEFAULT_TURNS)),
+                max_chats=int(
+                    os.environ.get("TELEGRAM_CONTEXT_CHATS", DEFAULT_MAX_CHATS)
+                ),
+                max_chars=int(
+                    os.environ.get("TELEGRAM_CONTEXT_CHARS", DEFAULT_MAX_CHARS)
+                ),
+                spill_path=os.environ.get("TELEGRAM_CONTEXT_SPILL") or None,
+            )
+        return _conversation_store
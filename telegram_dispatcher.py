@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Standalone Telegram dispatcher
+
+Telegram allows only one poller per bot token. The dispatcher owns that
+connection and fans incoming text messages out to any number of ComfyUI
+workers through a file-backed queue. Workers read it with the Telegram
+Listener's remote_queue input.
+
+Usage:
+    python telegram_dispatcher.py --token <bot token> --queue /path/to/queue.db
+
+Workers claim messages under a lease. A message is removed only when the
+worker acknowledges it. If a worker dies or stalls, its lease expires and any
+idle worker takes the message over.
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# Seconds a claimed message stays reserved for its worker before others may take it
+DEFAULT_LEASE = 600
+
+# Deliveries after which a message is dropped instead of handed out again
+MAX_ATTEMPTS = 5
+
+
+class FileQueue:
+    """
+    A multi-process message queue in a SQLite file, with leased claims and
+    acknowledgments.
+    """
+
+    def __init__(
+        self, path: str, lease: float = DEFAULT_LEASE, max_attempts: int = MAX_ATTEMPTS
+    ):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+            "worker TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def put(self, message: Dict[str, Any]) -> int:
+        """Append a message and return its id."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO messages (payload) VALUES (?)", (json.dumps(message),)
+            )
+            return cursor.lastrowid
+
+    def claim(
+        self, worker: str, lease: Optional[float] = None
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Claim the oldest message that is unclaimed or whose lease has expired,
+        and return (message id, message), or None if there is none.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "DELETE FROM messages WHERE attempts >= ? AND lease_until < ?",
+                    (self.max_attempts, now),
+                )
+                row = self._db.execute(
+                    "SELECT id, payload FROM messages WHERE lease_until < ? "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE messages SET worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (worker, now + (lease or self.lease), row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def ack(self, message_id: int, worker: str) -> bool:
+        """Remove a handled message; False if the worker no longer holds it."""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM messages WHERE id = ? AND worker = ?", (message_id, worker)
+            )
+            return cursor.rowcount > 0
+
+    def release(self, message_id: int, worker: str) -> bool:
+        """Give a claimed message back for immediate redelivery."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE messages SET worker = NULL, lease_until = 0 "
+                "WHERE id = ? AND worker = ?",
+                (message_id, worker),
+            )
+            return cursor.rowcount > 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of waiting and claimed messages."""
+        now = time.time()
+        with self._lock:
+            pending, claimed = self._db.execute(
+                "SELECT SUM(lease_until < ?), SUM(lease_until >= ?) FROM messages",
+                (now, now),
+            ).fetchone()
+        return {"pending": pending or 0, "claimed": claimed or 0}
+
+    def close(self):
+        """Close the queue file."""
+        with self._lock:
+            self._db.close()
+
+
+def run_dispatcher(token: str, queue_path: str):
+    """Poll Telegram for a bot token and append every text message to the queue."""
+    from telegram import Update
+    from telegram.ext import Application, MessageHandler, filters
+
+    file_queue = FileQueue(queue_path)
+
+    async def handle_message(update: Update, context):
+        message = update.message
+        if message and message.text:
+            file_queue.put(
+                {
+                    "text": message.text,
+                    "chat_id": message.chat_id,
+                    "user_id": message.from_user.id,
+                    "username": message.from_user.username or "",
+                    "timestamp": time.time(),
+                    "update_id": update.update_id,
+                }
+            )
+
+    application = Application.builder().token(token).build()
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
+    )
+    logging.info(f"Dispatching messages to {queue_path}")
+    application.run_polling()
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description="Fan Telegram messages out to ComfyUI workers"
+    )
+    parser.add_argument("--token", required=True, help="Telegram bot token")
+    parser.add_argument(
+        "--queue", required=True, help="Path of the queue file shared with workers"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_dispatcher(args.token, args.queue)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Media helpers for the Telegram nodes: background downloads of inbound files and
+conversion between Telegram images and ComfyUI IMAGE tensors.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Any, Optional, Tuple
+
+# Downloads larger than this spill from memory to a temporary file on disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# Size of chunks read from the download stream
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Bot API limit for files uploaded with sendVideo/sendAnimation/sendDocument
+TELEGRAM_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Bot API limit for photos uploaded with sendPhoto
+TELEGRAM_MAX_PHOTO_BYTES = 10 * 1024 * 1024
+
+# Telegram stores photos at most this many pixels on the long side, so
+# uploading more only costs time
+PHOTO_MAX_SIDE = 2560
+
+# sendPhoto rejects images more elongated than this
+PHOTO_MAX_ASPECT_RATIO = 20
+
+# Never shrink the photo size budget below this, however slow uploads are
+MIN_PHOTO_BUDGET = 256 * 1024
+
+# JPEG qualities tried in order until a photo fits its size budget
+JPEG_QUALITIES = (95, 90, 85, 75, 65)
+
+# Highest bitrate worth spending on a clip, in bits per second
+MAX_VIDEO_BITRATE = 8_000_000
+
+# Below this many bits per pixel per frame, lowering the resolution looks
+# better than lowering the bitrate further
+MIN_BITS_PER_PIXEL = 0.05
+
+# Encoding attempts with progressively lower bitrate before giving up
+VIDEO_ENCODE_ATTEMPTS = 3
+
+
+async def download_to_spool(bot, file_id: str, max_memory: int = SPOOL_MAX_MEMORY):
+    """
+    Download a Telegram file chunk by chunk into a spooled temporary file,
+    without holding a full copy of the file in memory.
+    """
+    telegram_file = await bot.get_file(file_id)
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        file_path = str(telegram_file.file_path)
+        if file_path.startswith("http"):
+            import httpx
+
+            async with httpx.AsyncClient(timeout=60) as client:
+                async with client.stream("GET", file_path) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        spool.write(chunk)
+        else:
+            # A local Bot API server returns a path on the local filesystem
+            with open(file_path, "rb") as source:
+                shutil.copyfileobj(source, spool, DOWNLOAD_CHUNK_SIZE)
+        spool.seek(0)
+        return spool
+    except Exception:
+        spool.close()
+        raise
+
+
+class InboundFile:
+    """
+    A photo or document attached to a Telegram message. The download runs on
+    the bot loop as soon as the message arrives; the data is only read and
+    decoded when a workflow asks for it.
+    """
+
+    def __init__(
+        self,
+        file_id: str,
+        mime_type: str = "",
+        future: Optional[concurrent.futures.Future] = None,
+    ):
+        self.file_id = file_id
+        self.mime_type = mime_type
+        self.future = future
+
+    @classmethod
+    def start(cls, bot, loop, file_id: str, mime_type: str = "") -> "InboundFile":
+        """Schedule the download of a file on the bot loop."""
+        future = asyncio.run_coroutine_threadsafe(download_to_spool(bot, file_id), loop)
+        return cls(file_id, mime_type, future)
+
+    def open(self, timeout: Optional[float] = None):
+        """Wait for the download and return the spooled file, rewound."""
+        spool = self.future.result(timeout=timeout)
+        spool.seek(0)
+        return spool
+
+    def decode_image(self, timeout: Optional[float] = None):
+        """Decode the file into a ComfyUI IMAGE tensor and release the download."""
+        spool = self.open(timeout)
+        try:
+            return decode_image(spool)
+        finally:
+            spool.close()
+
+    def close(self):
+        """Release the downloaded data, cancelling the download if still running."""
+        if self.future is None:
+            return
+        if (
+            not self.future.cancel()
+            and self.future.done()
+            and self.future.exception() is None
+        ):
+            self.future.result().close()
+
+
+def decode_image(stream: Any):
+    """Decode an image file into a ComfyUI IMAGE tensor of shape [1, H, W, 3]."""
+    import numpy as np
+    import torch
+    from PIL import Image, ImageOps
+
+    with Image.open(stream) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        array = np.asarray(image, dtype=np.float32) / 255.0
+    return torch.from_numpy(array)[None]
+
+
+def stack_images(images):
+    """
+    Stack IMAGE tensors into one batch, resizing each to the size of the first
+    since a batch must share its dimensions.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    height, width = images[0].shape[1:3]
+    resized = []
+    for image in images:
+        if tuple(image.shape[1:3]) != (height, width):
+            image = F.interpolate(
+                image.movedim(-1, 1),
+                size=(height, width),
+                mode="bilinear",
+                align_corners=False,
+            ).movedim(1, -1)
+        resized.append(image)
+    return torch.cat(resized, dim=0)
+
+
+def empty_image():
+    """Return a small black IMAGE for messages that carry no picture."""
+    import torch
+
+    return torch.zeros((1, 64, 64, 3), dtype=torch.float32)
+
+
+def frame_to_bytes(frame) -> bytes:
+    """Convert one [H, W, 3] IMAGE frame into packed RGB24 bytes."""
+    import torch
+
+    return (frame.clamp(0, 1) * 255).round().to(torch.uint8).cpu().numpy().tobytes()
+
+
+def find_ffmpeg() -> str:
+    """Locate an ffmpeg executable on PATH or from the imageio-ffmpeg package."""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        raise RuntimeError(
+            "ffmpeg is required to send video: install ffmpeg or imageio-ffmpeg"
+        )
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def plan_video_encoding(
+    width: int,
+    height: int,
+    frame_count: int,
+    fps: float,
+    max_bytes: int = TELEGRAM_MAX_UPLOAD_BYTES,
+    attempt: int = 0,
+) -> Tuple[int, int, int]:
+    """
+    Pick the output width, height and bitrate so a clip fits in max_bytes,
+    lowering the resolution when the bitrate gets too low for it. Each retry
+    attempt lowers the bitrate further.
+    """
+    duration = max(frame_count, 1) / fps
+    # Leave 10% headroom for the container and rate control overshoot
+    bitrate = int(min(max_bytes * 8 * 0.9 / duration, MAX_VIDEO_BITRATE) * 0.7**attempt)
+    scale = 1.0
+    bits_per_pixel = bitrate / (width * height * fps)
+    if bits_per_pixel < MIN_BITS_PER_PIXEL:
+        scale = math.sqrt(bits_per_pixel / MIN_BITS_PER_PIXEL)
+    # H.264 with yuv420p needs even dimensions
+    out_width = max(2, int(width * scale) // 2 * 2)
+    out_height = max(2, int(height * scale) // 2 * 2)
+    return out_width, out_height, bitrate
+
+
+def encode_video(frames, fps: float, max_bytes: int = TELEGRAM_MAX_UPLOAD_BYTES) -> str:
+    """
+    Encode an IMAGE batch into an H.264 MP4 file under max_bytes and return its
+    path. Frames are converted and piped to an ffmpeg process one at a time, so
+    no second full copy of the clip is held in memory.
+    """
+    ffmpeg = find_ffmpeg()
+    frame_count, height, width = frames.shape[0], frames.shape[1], frames.shape[2]
+    
+    for attempt in range(VIDEO_ENCODE_ATTEMPTS):
+        out_width, out_height, bitrate = plan_video_encoding(
+            width, height, frame_count, fps, max_bytes, attempt
+        )
+        handle, path = tempfile.mkstemp(suffix=".mp4")
+        os.close(handle)
+        # fmt: off
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+            "-r", str(fps), "-i", "-",
+            "-an", "-vf", f"scale={out_width}:{out_height}",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p",
+            "-b:v", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(bitrate * 2),
+            "-movflags", "+faststart", path,
+        ]
+        # fmt: on
+        process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        try:
+            for frame in frames:
+                process.stdin.write(frame_to_bytes(frame))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its error output explains why
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            os.remove(path)
+            raise RuntimeError(
+                f"ffmpeg failed: {stderr.decode(errors='replace').strip()[-500:]}"
+            )
+        if os.path.getsize(path) <= max_bytes:
+            return path
+        os.remove(path)
+    
+    raise RuntimeError("Encoded video exceeds Telegram's upload size limit")
+
+
+def image_to_array(image):
+    """Convert one [H, W, 3] IMAGE tensor into a uint8 numpy array."""
+    import numpy as np
+
+    return np.clip(np.round(image.cpu().numpy() * 255.0), 0, 255).astype(np.uint8)
+
+
+def image_digest(images) -> str:
+    """Hash the pixels of an IMAGE batch a frame at a time, e.g. to spot a repeat."""
+    digest = hashlib.sha256()
+    for frame in images:
+        pixels = memoryview(frame.cpu().numpy())
+        digest.update(pixels if pixels.c_contiguous else pixels.tobytes())
+    return digest.hexdigest()
+
+
+def photo_fits(array) -> bool:
+    """Check whether an image's aspect ratio is accepted by sendPhoto."""
+    height, width = array.shape[:2]
+    return max(height, width) <= PHOTO_MAX_ASPECT_RATIO * min(height, width)
+
+
+def downscale_array(array, max_side: int):
+    """
+    Shrink an [H, W, C] uint8 array by the smallest integer factor that fits
+    its long side in max_side, averaging each factor x factor block at once.
+    """
+    import numpy as np
+
+    height, width = array.shape[:2]
+    factor = math.ceil(max(height, width) / max_side)
+    if factor <= 1:
+        return array
+    height, width = height // factor * factor, width // factor * factor
+    blocks = array[:height, :width].reshape(
+        height // factor, factor, width // factor, factor, -1
+    )
+    return np.round(blocks.mean(axis=(1, 3), dtype=np.float32)).astype(np.uint8)
+
+
+def encode_jpeg(array, quality: int) -> bytes:
+    """Encode a uint8 RGB array as JPEG."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def encode_png(array) -> bytes:
+    """Encode a uint8 RGB array as lossless PNG."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def encode_photo(array, max_bytes: int) -> bytes:
+    """
+    Encode an image as the highest quality JPEG within max_bytes, halving the
+    resolution whenever even the lowest quality is too large.
+    """
+    array = downscale_array(array, PHOTO_MAX_SIDE)
+    while True:
+        for quality in JPEG_QUALITIES:
+            data = encode_jpeg(array, quality)
+            if len(data) <= max_bytes:
+                return data
+        if min(array.shape[:2]) < 64:
+            return data
+        array = downscale_array(array, max(array.shape[:2]) // 2)
+
+
+class UploadBandwidth:
+    """An exponentially weighted estimate of upload throughput to Telegram."""
+
+    def __init__(self, bytes_per_second: float = 1_000_000, smoothing: float = 0.3):
+        self.bytes_per_second = bytes_per_second
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def record(self, size: int, seconds: float):
+        """Fold a completed upload into the estimate."""
+        if size <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self.bytes_per_second += self.smoothing * (
+                size / seconds - self.bytes_per_second
+            )
+
+    def budget(
+        self, target_latency: float, limit: int = TELEGRAM_MAX_PHOTO_BYTES
+    ) -> int:
+        """Return how many bytes can be uploaded within target_latency seconds."""
+        return int(
+            min(limit, max(MIN_PHOTO_BUDGET, self.bytes_per_second * target_latency))
+        )
@@ -1,21 +1,530 @@
 import asyncio
+import hashlib
+import os
+import socket
 import threading
 import queue
 import time
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, List, Callable, Awaitable
 import logging
 
 try:
-    from telegram import Update
-    from telegram.ext import Application, MessageHandler, filters, ContextTypes
+    from telegram import (
+        Update,
+        InlineQueryResultArticle,
+        InlineQueryResultCachedDocument,
+        InlineQueryResultCachedMpeg4Gif,
+        InlineQueryResultCachedPhoto,
+        InlineQueryResultCachedVideo,
+        InlineQueryResultsButton,
+        InputTextMessageContent,
+    )
+    from telegram.ext import (
+        Application,
+        InlineQueryHandler,
+        MessageHandler,
+        filters,
+        ContextTypes,
+    )
 except ImportError:
     print("Please install python-telegram-bot: pip install python-telegram-bot")
     raise
 
+try:
+    from .telegram_cache import get_result_cache, result_cache_key, workflow_fingerprint
+except ImportError:
+    # Handle case where running tests or importing without package structure
+    from telegram_cache import get_result_cache, result_cache_key, workflow_fingerprint
+
+try:
+    from .telegram_context import get_conversation_store
+except ImportError:
+    from telegram_context import get_conversation_store
+
+try:
+    from .telegram_profiling import PROFILE_MODES, current_profile, profiled
+except ImportError:
+    from telegram_profiling import PROFILE_MODES, current_profile, profiled
+
+try:
+    from .telegram_status import get_status_reporter
+except ImportError:
+    from telegram_status import get_status_reporter
+
+try:
+    from .telegram_runtime import get_hub
+except ImportError:
+    from telegram_runtime import get_hub
+
+try:
+    from .telegram_commands import get_commands
+except ImportError:
+    from telegram_commands import get_commands
+
+try:
+    from .telegram_chat_actions import CHAT_ACTIONS, ChatActionKeepalive
+except ImportError:
+    from telegram_chat_actions import CHAT_ACTIONS, ChatActionKeepalive
+
+try:
+    from .telegram_quota import get_usage_ledger
+except ImportError:
+    from telegram_quota import get_usage_ledger
+
+try:
+    from .telegram_dispatcher import FileQueue
+except ImportError:
+    from telegram_dispatcher import FileQueue
+
+try:
+    from .telegram_outbox import (
+        DeliveryDeferred,
+        SendStep,
+        get_outbox,
+        is_transient_error,
+        perform_step,
+    )
+except ImportError:
+    from telegram_outbox import (
+        DeliveryDeferred,
+        SendStep,
+        get_outbox,
+        is_transient_error,
+        perform_step,
+    )
+
+try:
+    from .telegram_media import (
+        InboundFile,
+        UploadBandwidth,
+        empty_image,
+        stack_images,
+        encode_video,
+        encode_photo,
+        encode_png,
+        image_digest,
+        image_to_array,
+        photo_fits,
+        TELEGRAM_MAX_PHOTO_BYTES,
+    )
+except ImportError:
+    from telegram_media import (
+        InboundFile,
+        UploadBandwidth,
+        empty_image,
+        stack_images,
+        encode_video,
+        encode_photo,
+        encode_png,
+        image_digest,
+        image_to_array,
+        photo_fits,
+        TELEGRAM_MAX_PHOTO_BYTES,
+    )
+
+
+# Telegram rejects text messages longer than this many characters
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Telegram rejects media captions longer than this many characters
+TELEGRAM_MAX_CAPTION_LENGTH = 1024
+
+# sendMediaGroup accepts at most this many photos per album
+TELEGRAM_MAX_MEDIA_GROUP = 10
+
+# Seconds between polls of a dispatcher queue while waiting for a message
+REMOTE_POLL_INTERVAL = 0.5
+
+# Telegram allows roughly one message per second to the same chat
+CHAT_MIN_SEND_INTERVAL = 1.0
+
+# Seconds an inline query must stay unchanged before it is generated, since
+# Telegram sends a new query as the user types
+INLINE_SETTLE = 1.5
+
+# Longest time Telegram may serve an inline answer from its own cache
+INLINE_MAX_CACHE_TIME = 3600
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Split text into ordered parts no longer than limit, preferring paragraph,
+    line and word boundaries over hard cuts.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, 0, limit)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+class ChatRateLimiter:
+    """Spaces out sends to the same chat by a minimum interval."""
+
+    def __init__(self, min_interval: float = CHAT_MIN_SEND_INTERVAL):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, chat_id: Any) -> float:
+        """Reserve the next send slot for a chat and return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(chat_id, now))
+            self._next_slot[chat_id] = slot + self.min_interval
+            return slot - now
+
+
+class MessageCoalescer:
+    """
+    Buffers texts per (bot token, chat) and flushes them as a single message
+    once no new text has arrived for the configured window.
+    """
+
+    def __init__(self, separator: str = "\n\n"):
+        self.separator = separator
+        self._pending = {}  # (bot_token, chat_id) -> (texts, timer)
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        bot_token: str,
+        chat_id: int,
+        text: str,
+        window: float,
+        flush: Callable[[str, int, str], None],
+    ):
+        """Queue text for a chat; flush(bot_token, chat_id, text) runs afterwards."""
+        key = (bot_token, chat_id)
+        with self._lock:
+            texts, timer = self._pending.get(key, ([], None))
+            if timer is not None:
+                timer.cancel()
+            texts.append(text)
+            timer = threading.Timer(window, self._flush, args=(key, flush))
+            timer.daemon = True
+            self._pending[key] = (texts, timer)
+            timer.start()
+
+    def _flush(self, key: Tuple[str, int], flush: Callable[[str, int, str], None]):
+        with self._lock:
+            texts, _ = self._pending.pop(key, ([], None))
+        if texts:
+            try:
+                flush(key[0], key[1], self.separator.join(texts))
+            except Exception as e:
+                logging.error(f"Error sending coalesced message: {e}")
+
+
+def payload_hash(*parts: Any) -> str:
+    """Hash an outgoing payload so duplicate deliveries can be recognized."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DeliveryTracker:
+    """
+    Remembers which payloads were delivered to each chat while answering the
+    current request, identified by the update_id of the consumed message.
+    Outside a request, e.g. in a workflow that only sends, nothing is kept.
+    """
+
+    def __init__(self):
+        self._requests = {}  # (bot_token, chat_id) -> (update_id, delivered hashes)
+        self._lock = threading.Lock()
+
+    def begin(self, bot_token: str, chat_id: int, update_id: Optional[int]):
+        """Start a new request for a chat, forgetting earlier deliveries."""
+        with self._lock:
+            self._requests[(bot_token, chat_id)] = (update_id, set())
+
+    def request_id(self, bot_token: str, chat_id: int) -> Optional[int]:
+        """Return the update_id of the request currently answered in a chat."""
+        with self._lock:
+            return self._requests.get((bot_token, chat_id), (None, None))[0]
+
+    def mark(self, bot_token: str, chat_id: int, digest: str) -> bool:
+        """Record a delivery; return False if it was already made for this request."""
+        with self._lock:
+            update_id, delivered = self._requests.get(
+                (bot_token, chat_id), (None, None)
+            )
+            if update_id is None:
+                return True
+            if digest in delivered:
+                return False
+            delivered.add(digest)
+            return True
+
+    def was_delivered(self, bot_token: str, chat_id: int, digest: str) -> bool:
+        """Check whether a payload was already delivered for the current request."""
+        with self._lock:
+            update_id, delivered = self._requests.get(
+                (bot_token, chat_id), (None, None)
+            )
+            return update_id is not None and digest in delivered
+
+
+_chat_rate_limiter = ChatRateLimiter()
+_message_coalescer = MessageCoalescer()
+_delivery_tracker = DeliveryTracker()
+_upload_bandwidth = UploadBandwidth()
+
+# Dispatcher messages awaiting acknowledgment, keyed by (bot_token, chat_id)
+_remote_claims: Dict[Tuple[str, int], Tuple[FileQueue, int, str]] = {}
+_remote_claims_lock = threading.Lock()
+
+
+def acknowledge_remote_message(bot_token: str, chat_id: int) -> bool:
+    """Acknowledge the dispatcher message being answered in a chat, if any."""
+    with _remote_claims_lock:
+        claim = _remote_claims.pop((bot_token, chat_id), None)
+    if claim is None:
+        return False
+    file_queue, message_id, worker = claim
+    return file_queue.ack(message_id, worker)
+
+
+def _run_coroutine_sync(coro_factory: Callable[[], Awaitable[Any]]):
+    """
+    Run a coroutine to completion from synchronous node code and return its
+    result, raising its exception in the caller.
+    """
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # No event loop, create one
+        return asyncio.run(coro_factory())
+    if not loop.is_running():
+        return loop.run_until_complete(coro_factory())
+
+    # ComfyUI calls nodes from inside its own loop, so run a new one in a thread
+    outcome = {}
+
+    def run_in_thread():
+        try:
+            outcome["result"] = asyncio.run(coro_factory())
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run_in_thread)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+class ProgressMessage:
+    """
+    A status message that is edited in place as ComfyUI reports step progress,
+    at most once per min_interval seconds.
+    """
+
+    def __init__(
+        self,
+        bot,
+        loop,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        min_interval: float,
+        track: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.bot = bot
+        self.loop = loop
+        self.track = track  # keeps edits in flight until the bot is drained
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.min_interval = min_interval
+        self._last_text = text
+        self._last_edit = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, value: int, total: int) -> bool:
+        """Edit the status message if the throttle allows; return whether it did."""
+        text = f"{self.text} {int(100 * value / total)}%" if total else self.text
+        with self._lock:
+            now = time.monotonic()
+            if text == self._last_text or now - self._last_edit < self.min_interval:
+                return False
+            self._last_text = text
+            self._last_edit = now
+        future = asyncio.run_coroutine_threadsafe(
+            self.bot.edit_message_text(
+                chat_id=self.chat_id, message_id=self.message_id, text=text
+            ),
+            self.loop,
+        )
+        future.add_done_callback(_log_future_error)
+        if self.track is not None:
+            self.track(future)
+        return True
+
+
+def _log_future_error(future):
+    """Log the exception of a fire-and-forget future, if any."""
+    try:
+        error = future.exception()
+    except Exception as e:
+        error = e
+    if error is not None:
+        logging.error(f"Telegram background call failed: {error}")
+
+
+# Active status messages keyed by (bot_token, chat_id)
+_progress_messages: Dict[Tuple[str, int], ProgressMessage] = {}
+_progress_lock = threading.Lock()
+
+
+def register_progress_message(bot_token: str, progress: ProgressMessage):
+    """Track a status message for a new request, replacing stale ones of the bot."""
+    with _progress_lock:
+        for key in [key for key in _progress_messages if key[0] == bot_token]:
+            del _progress_messages[key]
+        _progress_messages[(bot_token, progress.chat_id)] = progress
+    _install_progress_hook()
+
+
+def pop_progress_message(bot_token: str, chat_id: int) -> Optional[ProgressMessage]:
+    """Stop tracking and return the status message for a chat, if any."""
+    with _progress_lock:
+        return _progress_messages.pop((bot_token, chat_id), None)
+
+
+def _progress_hook(value, total, *args, **kwargs):
+    """Forward ComfyUI step progress to every active status message."""
+    with _progress_lock:
+        progress_messages = list(_progress_messages.values())
+    for progress in progress_messages:
+        try:
+            progress.update(value, total)
+        except Exception as e:
+            logging.error(f"Error updating progress message: {e}")
+
+
+def _install_progress_hook() -> bool:
+    """Chain _progress_hook into ComfyUI's global progress bar hook."""
+    try:
+        import comfy.utils
+    except ImportError:
+        return False
+    
+    previous = getattr(comfy.utils, "PROGRESS_BAR_HOOK", None)
+    if getattr(previous, "_telegram_progress", False) is True:
+        return True
+    
+    def hook(value, total, *args, **kwargs):
+        if previous is not None:
+            previous(value, total, *args, **kwargs)
+        _progress_hook(value, total, *args, **kwargs)
+    
+    hook._telegram_progress = True
+    comfy.utils.set_progress_bar_global_hook(hook)
+    return True
+
+
+def _output_is_used(
+    prompt: Optional[Dict[str, Any]], unique_id: Optional[str], index: int
+) -> bool:
+    """Check whether any node in the workflow is linked to the given node output."""
+    if not prompt or unique_id is None:
+        return False
+    for node in prompt.values():
+        for value in node.get("inputs", {}).values():
+            if (
+                isinstance(value, list)
+                and len(value) == 2
+                and str(value[0]) == str(unique_id)
+                and value[1] == index
+            ):
+                return True
+    return False
+
+
+def _message_attachment(message) -> Optional[Tuple[str, str]]:
+    """Return the (file_id, mime_type) of the image attached to a message, if any."""
+    if message.photo:
+        # Telegram lists photo sizes from smallest to largest
+        return (message.photo[-1].file_id, "image/jpeg")
+    document = message.document
+    if document and (document.mime_type or "").startswith("image/"):
+        return (document.file_id, document.mime_type)
+    return None
+
+
+def _configure_application(application, runtime):
+    """Register the listener's update handlers on a newly created bot application."""
+    application.add_handler(
+        MessageHandler(
+            (filters.TEXT & ~filters.COMMAND) | filters.PHOTO | filters.Document.IMAGE,
+            runtime.dispatch,
+        )
+    )
+    # Commands are answered on the bot loop without taking a workflow run
+    application.add_handler(
+        MessageHandler(filters.COMMAND, get_commands().handler_for(runtime))
+    )
+    application.add_handler(InlineQueryHandler(runtime.dispatch_inline))
+    runtime.chat_actions = ChatActionKeepalive(application.bot, runtime.loop)
+
+
+def inline_result(result_id: str, title: str, cached: Dict[str, Any]):
+    """Build the inline query result resending a cached output by its file_id."""
+    text = cached.get("text", "")
+    caption = text if len(text) <= TELEGRAM_MAX_CAPTION_LENGTH else None
+    media_type = cached.get("media_type")
+    if media_type == "photo":
+        return InlineQueryResultCachedPhoto(
+            result_id, cached["file_id"], caption=caption
+        )
+    if media_type == "video":
+        return InlineQueryResultCachedVideo(
+            result_id, cached["file_id"], title, caption=caption
+        )
+    if media_type == "animation":
+        return InlineQueryResultCachedMpeg4Gif(
+            result_id, cached["file_id"], caption=caption
+        )
+    if media_type == "document":
+        return InlineQueryResultCachedDocument(
+            result_id, title, cached["file_id"], caption=caption
+        )
+    return InlineQueryResultArticle(
+        result_id,
+        title,
+        InputTextMessageContent(split_message(text)[0]),
+        description=text[:100],
+    )
+
+
+def _request_answered(bot_token: str, chat_id: int):
+    """Charge a chat's request its generation time and stop showing the bot at work."""
+    get_usage_ledger().finish(bot_token, chat_id)
+    # Whatever is sent to the chat later no longer answers the cached prompt
+    get_result_cache().discard(bot_token, chat_id)
+    runtime = get_hub().get(bot_token)
+    if runtime is not None:
+        runtime.answered(chat_id)
+
 
 class TelegramListener:
     """
-    A ComfyUI node that listens to Telegram messages and outputs the text content.
+    A ComfyUI node that listens to Telegram messages and outputs the text
+    content, and the attached picture for photo and image document messages.
     """
     
     @classmethod
@@ -33,114 +542,571 @@ class TelegramListener:
                     "max": 300,
                     "step": 1
                 }),
+            },
+            "optional": {
+                "progress_message": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": (
+                        "Status text shown while generating (empty to disable)"
+                    )
+                }),
+                "progress_interval": ("FLOAT", {
+                    "default": 3.0,
+                    "min": 1.0,
+                    "max": 60.0,
+                    "step": 0.5
+                }),
+                "cache_ttl": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 604800,
+                    "step": 60
+                }),
+                "album_window": ("FLOAT", {
+                    "default": 1.0,
+                    "min": 0.0,
+                    "max": 10.0,
+                    "step": 0.1
+                }),
+                "remote_queue": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": (
+                        "Dispatcher queue file (empty to poll Telegram directly)"
+                    )
+                }),
+                "chat_action": (CHAT_ACTIONS,),
+                "max_requests_per_hour": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 10000,
+                    "step": 1
+                }),
+                "max_gpu_seconds_per_hour": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 3600,
+                    "step": 10
+                }),
+                "profile": (PROFILE_MODES,),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             }
         }
     
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("message_text", "chat_id")
+    RETURN_TYPES = ("STRING", "STRING", "IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("message_text", "chat_id", "image", "context", "user_id")
     FUNCTION = "listen_for_message"
     CATEGORY = "telegram"
     OUTPUT_NODE = False
     
+    @classmethod
+    def IS_CHANGED(cls, bot_token: str, *args, **kwargs):
+        """
+        Key the listener on the update_id of the next message it will consume,
+        so ComfyUI never reuses a stale cached message. Without a pending
+        message the listener has to run and wait, so it is always changed.
+        """
+        runtime = get_hub().get(bot_token)
+        if runtime is None or not runtime.is_running:
+            return float("nan")
+        update_id = runtime.peek_update_id()
+        return float("nan") if update_id is None else update_id
+    
     def __init__(self):
         self.bot_token = None
         self.application = None
+        self.loop = None
+        self.cache_ttl = 0
+        self.workflow_fingerprint = ""
+        self.album_window = 1.0
+        self.chat_action = "typing"
+        self.quota = (0, 0)  # (max requests, max generation seconds) per user and hour
+        # user_id -> flush timer handle of the user's latest inline query
+        self.inline_queries = {}
+        self.albums = {}  # media_group_id -> (message data, flush timer handle)
+        self.refused_albums = {}  # media_group_id -> expiry timer handle
         self.message_queue = queue.Queue()
         self.chat_ids = {}  # Store chat IDs for responses
         self.is_running = False
         self.bot_thread = None
+        self.runtime = None
+        self.remote_queue = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
     
-    def listen_for_message(self, bot_token: str, timeout: int) -> Tuple[str, str]:
+    @profiled("TelegramListener")
+    def listen_for_message(
+        self,
+        bot_token: str,
+        timeout: int,
+        progress_message: str = "",
+        progress_interval: float = 3.0,
+        cache_ttl: int = 0,
+        album_window: float = 1.0,
+        remote_queue: str = "",
+        chat_action: str = "typing",
+        max_requests_per_hour: int = 0,
+        max_gpu_seconds_per_hour: int = 0,
+        prompt: Optional[Dict[str, Any]] = None,
+        unique_id: Optional[str] = None,
+    ) -> Tuple[str, str, Any, str, str]:
         """
-        Listen for Telegram messages and return the message text and chat ID.
+        Listen for Telegram messages and return the message text (or photo
+        caption), the chat ID, the attached image, the chat's recent turns
+        before this message and the sender's user ID. The image is only
+        decoded when a downstream node uses the image output. Photos of an
+        album arriving within album_window seconds of each other are delivered
+        together as one image batch.
+
+        With a progress_message, a status message is posted to the chat and
+        edited with the generation progress until SaveToTelegram replaces it.
+        With a cache_ttl, prompts already answered by this workflow are replied
+        to from the result cache by the bot and never reach the workflow, and
+        inline queries (@bot prompt) are answered from the cache; uncached
+        ones are generated into the user's private chat with the bot.
+        With a remote_queue, messages are taken from a telegram_dispatcher
+        queue shared with other workers instead of polling Telegram. Until
+        SaveToTelegram replies, the chat shows the bot's chat_action. Users
+        past max_requests_per_hour, or whose requests took more than
+        max_gpu_seconds_per_hour from pickup to reply within the last hour,
+        are turned away before their message is queued. With a profile mode,
+        the time spent in each phase of the call is recorded.
         """
         if not bot_token or not bot_token.strip():
-            return ("Error: Bot token is required", "")
+            return ("Error: Bot token is required", "", None, "", "")
             
         if not bot_token.startswith("bot") and ":" not in bot_token:
-            return ("Error: Invalid bot token format", "")
+            return ("Error: Invalid bot token format", "", None, "", "")
+        
+        self.cache_ttl = cache_ttl
+        self.album_window = album_window
+        self.chat_action = chat_action
+        self.quota = (max_requests_per_hour, max_gpu_seconds_per_hour)
+        self.workflow_fingerprint = (
+            workflow_fingerprint(prompt, unique_id) if cache_ttl else ""
+        )
             
-        # If bot token changed or not running, restart the bot
-        if self.bot_token != bot_token or not self.is_running:
-            self._stop_bot()
-            try:
-                self._start_bot(bot_token)
-            except Exception as e:
-                return (f"Error starting bot: {str(e)}", "")
+        profiling = current_profile()
+        if remote_queue:
+            with profiling.phase("wait"):
+                message_data = self._claim_remote_message(
+                    bot_token, remote_queue, timeout
+                )
+        else:
+            # If bot token changed or not running, restart the bot
+            if (
+                self.bot_token != bot_token
+                or not self.is_running
+                or (self.runtime is not None and not self.runtime.is_running)
+            ):
+                try:
+                    with profiling.phase("start_bot"):
+                        self._switch_bot(bot_token)
+                except Exception as e:
+                    return (f"Error starting bot: {str(e)}", "", None, "", "")
+            with profiling.phase("wait"):
+                message_data = self._next_message(timeout)
+        
+        if message_data is None:
+            return ("No message received within timeout", "", None, "", "")
+        get_status_reporter().notify()  # the queue got shorter
+        
+        chat_id = str(message_data["chat_id"])
+        message_text = message_data["text"]
+        user_id = message_data.get("user_id")
+        if user_id is not None:
+            get_usage_ledger().begin(bot_token, message_data["chat_id"], user_id)
+        profiling.correlate(
+            chat_id=message_data["chat_id"], update_id=message_data.get("update_id")
+        )
+        
+        # Store chat ID for potential response
+        self.chat_ids[chat_id] = message_data["chat_id"]
+        _delivery_tracker.begin(
+            bot_token, message_data["chat_id"], message_data.get("update_id")
+        )
+        
+        # The context holds the turns before this message
+        conversations = get_conversation_store()
+        context = conversations.context(bot_token, message_data["chat_id"])
+        conversations.add(bot_token, message_data["chat_id"], "user", message_text)
+        
+        if not remote_queue:
+            # Generation starts now, so the action runs its full duration from here
+            self._show_chat_action(self.runtime, message_data["chat_id"])
+        
+        if message_data.get("cache_key"):
+            get_result_cache().expect(
+                bot_token, message_data["chat_id"], message_data["cache_key"], cache_ttl
+            )
+        else:
+            get_result_cache().discard(bot_token, message_data["chat_id"])
         
-        # Wait for a message with timeout
+        if progress_message:
+            with profiling.phase("progress"):
+                self._post_progress_message(
+                    message_data["chat_id"], progress_message, progress_interval
+                )
+        
+        try:
+            with profiling.phase("image"):
+                image = self._image_output(message_data, prompt, unique_id, timeout)
+        except Exception as e:
+            return (
+                f"Error downloading image: {str(e)}",
+                chat_id,
+                None,
+                context,
+                "" if user_id is None else str(user_id),
+            )
+        
+        return (
+            message_text,
+            chat_id,
+            image,
+            context,
+            "" if user_id is None else str(user_id),
+        )
+    
+    def _next_message(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to timeout seconds for a message from the bot."""
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                message_data = self.message_queue.get(timeout=1)
-                chat_id = str(message_data['chat_id'])
-                message_text = message_data['text']
-                
-                # Store chat ID for potential response
-                self.chat_ids[chat_id] = message_data['chat_id']
-                
-                return (message_text, chat_id)
+                return self.message_queue.get(timeout=1)
             except queue.Empty:
                 continue
+        return None
+    
+    def _claim_remote_message(
+        self, bot_token: str, path: str, timeout: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Wait up to timeout seconds to claim a message from a dispatcher queue.
+        The claim is acknowledged once SaveToTelegram answers the chat, or
+        when this listener claims its next message.
+        """
+        if self.remote_queue is None or self.remote_queue.path != path:
+            self.remote_queue = FileQueue(path)
         
-        return ("No message received within timeout", "")
+        # Reaching the next run means the previous message was handled
+        with _remote_claims_lock:
+            finished = [
+                key
+                for key, claim in _remote_claims.items()
+                if claim[2] == self.worker_id
+            ]
+        for key in finished:
+            acknowledge_remote_message(*key)
+        
+        start_time = time.time()
+        while True:
+            claimed = self.remote_queue.claim(self.worker_id)
+            if claimed is not None:
+                message_id, message_data = claimed
+                with _remote_claims_lock:
+                    _remote_claims[(bot_token, message_data["chat_id"])] = (
+                        self.remote_queue,
+                        message_id,
+                        self.worker_id,
+                    )
+                return message_data
+            if time.time() - start_time >= timeout:
+                return None
+            time.sleep(REMOTE_POLL_INTERVAL)
+    
+    def _switch_bot(self, bot_token: str):
+        """
+        Attach to a bot token, replacing the current one. A new token starts
+        polling before the old one is released, so the swap leaves no gap; the
+        same token is released first, since Telegram rejects a second poller.
+        """
+        previous = (
+            self.bot_token if self.runtime is not None and self.is_running else None
+        )
+        if previous == bot_token:
+            self._stop_bot()
+            previous = None
+        try:
+            self._start_bot(bot_token)
+        finally:
+            if previous is not None:
+                get_hub().release(previous)
     
     def _start_bot(self, bot_token: str):
-        """Start the Telegram bot in a separate thread."""
+        """Attach to the shared runtime polling this bot token, starting it first."""
         self.bot_token = bot_token
-        
-        def run_bot():
-            try:
-                # Create application
-                self.application = Application.builder().token(bot_token).build()
-                
-                # Add message handler
-                message_handler = MessageHandler(
-                    filters.TEXT & ~filters.COMMAND, 
-                    self._handle_message
-                )
-                self.application.add_handler(message_handler)
-                
-                # Run the bot
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                self.is_running = True
-                loop.run_until_complete(self.application.run_polling(stop_signals=None))
-                
-            except Exception as e:
-                logging.error(f"Bot error: {e}")
-                self.is_running = False
-        
-        self.bot_thread = threading.Thread(target=run_bot, daemon=True)
-        self.bot_thread.start()
+        self.runtime = None
+        self.is_running = False
+        get_status_reporter()  # follows runtime changes from now on
+        self.runtime = get_hub().acquire(bot_token, _configure_application)
+        self.runtime.handler = self._handle_message
+        self.runtime.inline_handler = self._handle_inline_query
+        self.message_queue = self.runtime.message_queue
+        self.application = self.runtime.application
+        self.loop = self.runtime.loop
+        self.bot_thread = self.runtime.thread
+        self.is_running = True
     
     def _stop_bot(self):
-        """Stop the running bot."""
-        if self.application and self.is_running:
+        """Detach from the bot token; polling stops once no other listener uses it."""
+        if self.runtime is not None and self.is_running:
             try:
-                # Stop the application
-                asyncio.run(self.application.stop())
-                self.is_running = False
+                get_hub().release(self.bot_token)
             except Exception as e:
                 logging.error(f"Error stopping bot: {e}")
+        self.runtime = None
+        self.is_running = False
+    
+    def _image_output(
+        self,
+        message_data: Dict[str, Any],
+        prompt: Optional[Dict[str, Any]],
+        unique_id: Optional[str],
+        timeout: float,
+    ):
+        """Decode the message's images only if the image output is linked."""
+        images = message_data.get("images", [])
+        if not _output_is_used(prompt, unique_id, 2):
+            for inbound in images:
+                inbound.close()
+            return None
+        if not images:
+            return empty_image()
+        return stack_images([inbound.decode_image(timeout) for inbound in images])
+    
+    def _post_progress_message(self, chat_id: int, text: str, min_interval: float):
+        """Post the status message for a request on the bot loop and track it."""
+        if self.application is None or self.loop is None:
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self.application.bot.send_message(chat_id=chat_id, text=text), self.loop
+            )
+            sent = future.result(timeout=10)
+            progress = ProgressMessage(
+                self.application.bot,
+                self.loop,
+                chat_id,
+                sent.message_id,
+                text,
+                min_interval,
+                self.runtime.track if self.runtime is not None else None,
+            )
+            register_progress_message(self.bot_token, progress)
+        except Exception as e:
+            logging.error(f"Error posting progress message: {e}")
     
     async def _handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle incoming Telegram messages."""
-        if update.message and update.message.text:
+        message = update.message
+        if not message:
+            return
+        attachment = None if message.text else _message_attachment(message)
+        if message.text or attachment is not None:
+            # After a token swap this listener may still handle a runtime shared
+            # with other listeners, so route into the queue the update came from
+            runtime = get_hub().get(getattr(context.bot, "token", None)) or self.runtime
+            message_queue = (
+                runtime.message_queue if runtime is not None else self.message_queue
+            )
             message_data = {
-                'text': update.message.text,
-                'chat_id': update.message.chat_id,
-                'user_id': update.message.from_user.id,
-                'username': update.message.from_user.username or "",
-                'timestamp': time.time()
+                "text": message.text or message.caption or "",
+                "chat_id": message.chat_id,
+                "user_id": message.from_user.id,
+                "username": message.from_user.username or "",
+                "timestamp": time.time(),
+                "update_id": update.update_id,
             }
-            self.message_queue.put(message_data)
+            if attachment is None and self.cache_ttl > 0:
+                key = result_cache_key(message.text, self.workflow_fingerprint)
+                cached = get_result_cache().get(key)
+                if cached is not None:
+                    await self._reply_cached(update, cached)
+                    conversations = get_conversation_store()
+                    conversations.add(
+                        self.bot_token, message.chat_id, "user", message.text
+                    )
+                    conversations.add(
+                        self.bot_token,
+                        message.chat_id,
+                        "assistant",
+                        cached.get("text", ""),
+                    )
+                    return
+                message_data["cache_key"] = key
+            grouped = self.album_window > 0 and message.media_group_id
+            if grouped and message.media_group_id in self.refused_albums:
+                # The album was refused with its first photo
+                self._refuse_album(message.media_group_id)
+                return
+            # Further photos of an album belong to a request that was already admitted
+            if not (grouped and message.media_group_id in self.albums):
+                refusal = get_usage_ledger().admit(message.from_user.id, *self.quota)
+                if refusal is not None:
+                    if grouped:
+                        self._refuse_album(message.media_group_id)
+                    await message.reply_text(refusal)
+                    return
+            if attachment is not None:
+                # Download in the background while the workflow is busy
+                inbound = InboundFile.start(
+                    context.bot, asyncio.get_running_loop(), *attachment
+                )
+                if runtime is not None:
+                    runtime.track(inbound.future)
+                if message.media_group_id and self.album_window > 0:
+                    self._show_chat_action(runtime, message.chat_id)
+                    self._add_to_album(
+                        message.media_group_id, message_data, inbound, message_queue
+                    )
+                    return
+                message_data["images"] = [inbound]
+            self._show_chat_action(runtime, message.chat_id)
+            message_queue.put(message_data)
+    
+    def _show_chat_action(self, runtime, chat_id: int):
+        """Show the bot at work in a chat until its request is answered."""
+        if runtime is not None and runtime.chat_actions is not None:
+            runtime.chat_actions.start(chat_id, self.chat_action)
+    
+    def _add_to_album(
+        self,
+        media_group_id: str,
+        message_data: Dict[str, Any],
+        inbound: InboundFile,
+        message_queue: Optional[queue.Queue] = None,
+    ):
+        """Buffer a photo of an album until no more photos arrive within the window."""
+        album, handle = self.albums.get(media_group_id, (None, None))
+        if album is None:
+            album = dict(message_data, images=[])
+        else:
+            handle.cancel()
+            # Only one photo of an album carries the caption
+            album["text"] = album["text"] or message_data["text"]
+        album["images"].append(inbound)
+        handle = asyncio.get_running_loop().call_later(
+            self.album_window, self._flush_album, media_group_id, message_queue
+        )
+        self.albums[media_group_id] = (album, handle)
+    
+    def _refuse_album(self, media_group_id: str):
+        """Ignore the rest of a refused album until no more photos arrive."""
+        handle = self.refused_albums.pop(media_group_id, None)
+        if handle is not None:
+            handle.cancel()
+        self.refused_albums[media_group_id] = asyncio.get_running_loop().call_later(
+            self.album_window, self.refused_albums.pop, media_group_id, None
+        )
+    
+    def _flush_album(
+        self, media_group_id: str, message_queue: Optional[queue.Queue] = None
+    ):
+        """Queue a buffered album as a single message."""
+        album, _ = self.albums.pop(media_group_id, (None, None))
+        if album is not None:
+            if message_queue is None:
+                message_queue = self.message_queue
+            message_queue.put(album)
+    
+    async def _handle_inline_query(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """
+        Answer an inline query from the result cache. An uncached prompt is
+        queued for generation once the user stops typing.
+        """
+        inline_query = update.inline_query
+        if not inline_query:
+            return
+        prompt = inline_query.query.strip()
+        if not prompt or self.cache_ttl <= 0:
+            await inline_query.answer([], cache_time=0)
+            return
+        key = result_cache_key(prompt, self.workflow_fingerprint)
+        cached = get_result_cache().get(key)
+        if cached is not None:
+            await inline_query.answer(
+                [inline_result(key, prompt[:64], cached)],
+                cache_time=min(self.cache_ttl, INLINE_MAX_CACHE_TIME),
+            )
+            return
+        # Ask again without Telegram's cache, so the result is served once generated
+        await inline_query.answer(
+            [],
+            cache_time=0,
+            is_personal=True,
+            button=InlineQueryResultsButton(
+                text="Generating, the result will be sent to you",
+                start_parameter="inline",
+            ),
+        )
+        runtime = get_hub().get(getattr(context.bot, "token", None)) or self.runtime
+        message_data = {
+            "text": prompt,
+            # The user's private chat with the bot
+            "chat_id": inline_query.from_user.id,
+            "user_id": inline_query.from_user.id,
+            "username": inline_query.from_user.username or "",
+            "timestamp": time.time(),
+            "update_id": update.update_id,
+            "cache_key": key,
+        }
+        handle = self.inline_queries.pop(inline_query.from_user.id, None)
+        if handle is not None:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        self.inline_queries[inline_query.from_user.id] = loop.call_later(
+            INLINE_SETTLE, self._queue_inline, runtime, message_data
+        )
+    
+    def _queue_inline(self, runtime, message_data: Dict[str, Any]):
+        """Queue a user's settled inline query, unless it is already being generated."""
+        self.inline_queries.pop(message_data["user_id"], None)
+        message_queue = (
+            runtime.message_queue if runtime is not None else self.message_queue
+        )
+        with message_queue.mutex:
+            queued = any(
+                message.get("cache_key") == message_data["cache_key"]
+                for message in message_queue.queue
+            )
+        if queued or get_result_cache().is_expected(message_data["cache_key"]):
+            return
+        refusal = get_usage_ledger().admit(message_data["user_id"], *self.quota)
+        if refusal is not None:
+            user_id = message_data["user_id"]
+            logging.info(f"Inline query of user {user_id} not generated: {refusal}")
+            return
+        message_queue.put(message_data)
+    
+    async def _reply_cached(self, update: Update, cached: Dict[str, Any]):
+        """Answer a message with a previously delivered result."""
+        text = cached.get("text", "")
+        media_type = cached.get("media_type")
+        if media_type:
+            caption = text if len(text) <= TELEGRAM_MAX_CAPTION_LENGTH else None
+            reply = {
+                "video": update.message.reply_video,
+                "animation": update.message.reply_animation,
+                "photo": update.message.reply_photo,
+                "document": update.message.reply_document,
+            }[media_type]
+            await reply(cached["file_id"], caption=caption)
+            if caption is not None:
+                return
+        for part in split_message(text):
+            await update.message.reply_text(part)
 
 
 class SaveToTelegram:
     """
-    A ComfyUI node that sends messages back to Telegram chats.
+    A ComfyUI node that sends messages, and optionally images as photos, a
+    video or an animation, back to Telegram chats.
     """
     
     @classmethod
@@ -162,6 +1128,32 @@ class SaveToTelegram:
                     "multiline": True,
                     "placeholder": "Message to send"
                 }),
+            },
+            "optional": {
+                "coalesce_window": ("FLOAT", {
+                    "default": 0.0,
+                    "min": 0.0,
+                    "max": 10.0,
+                    "step": 0.1
+                }),
+                "images": ("IMAGE",),
+                "media_mode": (["photo", "video", "animation"],),
+                "fps": ("FLOAT", {
+                    "default": 8.0,
+                    "min": 1.0,
+                    "max": 60.0,
+                    "step": 1.0
+                }),
+                "send_original": ("BOOLEAN", {
+                    "default": False
+                }),
+                "target_latency": ("FLOAT", {
+                    "default": 2.0,
+                    "min": 0.5,
+                    "max": 60.0,
+                    "step": 0.5
+                }),
+                "profile": (PROFILE_MODES,),
             }
         }
     
@@ -171,12 +1163,57 @@ class SaveToTelegram:
     CATEGORY = "telegram"
     OUTPUT_NODE = True
     
+    @classmethod
+    def IS_CHANGED(
+        cls,
+        bot_token: str = "",
+        chat_id: Optional[str] = None,
+        message: Optional[str] = None,
+        *args,
+        **kwargs,
+    ):
+        """
+        Key the sender on the request being answered and the payload, so the
+        same payload is not re-sent to a chat while answering one request.
+        ComfyUI only passes constant inputs, so when chat_id or message are
+        linked from another node the sender is always changed, and
+        send_message skips duplicates itself.
+        """
+        if chat_id is None or message is None:
+            return float("nan")
+        try:
+            chat_id_int = int(chat_id)
+        except ValueError:
+            return float("nan")
+        request_id = _delivery_tracker.request_id(bot_token, chat_id_int)
+        return f"{request_id}:{payload_hash(message)}"
+    
     def __init__(self):
         self.applications = {}  # Store applications by bot token
     
-    def send_message(self, bot_token: str, chat_id: str, message: str) -> Tuple[str]:
+    @profiled("SaveToTelegram")
+    def send_message(
+        self,
+        bot_token: str,
+        chat_id: str,
+        message: str,
+        coalesce_window: float = 0.0,
+        images=None,
+        media_mode: str = "photo",
+        fps: float = 8.0,
+        send_original: bool = False,
+        target_latency: float = 2.0,
+    ) -> Tuple[str]:
         """
         Send a message to a Telegram chat.
+
+        With a coalesce_window, messages to the same chat arriving within the
+        window are merged and sent as one. Text over Telegram's length limit is
+        split into ordered parts. With images, the message is the caption of
+        the photos, or of the frames encoded as a video or animation. Photos
+        are downscaled and compressed to upload within target_latency, and
+        with send_original the lossless PNGs follow as documents. With a
+        profile mode, the time spent in each phase of the call is recorded.
         """
         if not bot_token:
             return ("Error: Bot token is required",)
@@ -184,7 +1221,7 @@ class SaveToTelegram:
         if not chat_id:
             return ("Error: Chat ID is required",)
         
-        if not message:
+        if not message and images is None:
             return ("Error: Message is required",)
         
         try:
@@ -193,38 +1230,371 @@ class SaveToTelegram:
                 chat_id_int = int(chat_id)
             except ValueError:
                 return (f"Error: Invalid chat ID format: {chat_id}",)
+            current_profile().correlate(
+                chat_id=chat_id_int,
+                update_id=_delivery_tracker.request_id(bot_token, chat_id_int),
+            )
             
-            # Get or create application for this bot token
-            if bot_token not in self.applications:
-                self.applications[bot_token] = Application.builder().token(bot_token).build()
+            if images is None:
+                digest = payload_hash(message)
+            else:
+                digest = payload_hash(
+                    message, media_mode, tuple(images.shape), image_digest(images)
+                )
+            if _delivery_tracker.was_delivered(bot_token, chat_id_int, digest):
+                return (f"Message already sent to chat {chat_id}",)
             
-            application = self.applications[bot_token]
+            if images is not None and media_mode == "photo":
+                self._send_photos(
+                    bot_token,
+                    chat_id_int,
+                    images,
+                    message,
+                    send_original,
+                    target_latency,
+                )
+                self._mark_delivered(bot_token, chat_id_int, digest, message)
+                return (f"Photo sent successfully to chat {chat_id}",)
             
-            # Send message synchronously
-            async def send_async():
-                await application.bot.send_message(chat_id=chat_id_int, text=message)
+            if images is not None:
+                self._send_video(
+                    bot_token, chat_id_int, images, message, media_mode, fps
+                )
+                self._mark_delivered(bot_token, chat_id_int, digest, message)
+                return (
+                    f"{media_mode.capitalize()} sent successfully to chat {chat_id}",
+                )
             
-            # Run in event loop
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # If loop is already running, create a new one in a thread
-                    def run_in_thread():
-                        new_loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(new_loop)
-                        new_loop.run_until_complete(send_async())
-                        new_loop.close()
-                    
-                    thread = threading.Thread(target=run_in_thread)
-                    thread.start()
-                    thread.join()
-                else:
-                    loop.run_until_complete(send_async())
-            except RuntimeError:
-                # No event loop, create one
-                asyncio.run(send_async())
+            if coalesce_window > 0:
+                # The rest of the delivery is recorded once the merged text is sent
+                _delivery_tracker.mark(bot_token, chat_id_int, digest)
+                _message_coalescer.add(
+                    bot_token,
+                    chat_id_int,
+                    message,
+                    coalesce_window,
+                    self._send_coalesced,
+                )
+                return (f"Message queued for chat {chat_id}",)
             
+            parts = self._send_text(bot_token, chat_id_int, message)
+            self._mark_delivered(bot_token, chat_id_int, digest, message)
+            if parts > 1:
+                return (
+                    f"Message sent successfully to chat {chat_id} in {parts} parts",
+                )
             return (f"Message sent successfully to chat {chat_id}",)
             
+        except DeliveryDeferred as e:
+            # The outbox owns the delivery now, so do not send it again
+            self._mark_delivered(bot_token, chat_id_int, digest, message)
+            self._report_deferred(bot_token, e)
+            return (f"Delivery to chat {chat_id} delayed, queued for retry: {str(e)}",)
         except Exception as e:
+            _request_answered(bot_token, chat_id_int)
+            get_status_reporter().record_error(bot_token, e)
             return (f"Error sending message: {str(e)}",)
+    
+    def _send_coalesced(self, bot_token: str, chat_id: int, message: str):
+        """Send merged texts, then record the delivery or report why it failed."""
+        try:
+            self._send_text(bot_token, chat_id, message)
+        except DeliveryDeferred as e:
+            self._mark_delivered(bot_token, chat_id, None, message)
+            self._report_deferred(bot_token, e)
+            return
+        except Exception as e:
+            _request_answered(bot_token, chat_id)
+            get_status_reporter().record_error(bot_token, e)
+            raise
+        self._mark_delivered(bot_token, chat_id, None, message)
+    
+    def _report_deferred(self, bot_token: str, error: DeliveryDeferred):
+        """Tell status observers that a delivery is waiting to be retried."""
+        if error.__cause__ is not None:
+            get_status_reporter().record_error(bot_token, error.__cause__)
+        else:
+            get_status_reporter().notify()
+    
+    def _mark_delivered(
+        self, bot_token: str, chat_id: int, digest: Optional[str], message: str
+    ):
+        """
+        Record a delivery, add it to the chat's conversation, stop its chat
+        action and acknowledge the dispatcher message it answers.
+        """
+        if digest is not None:
+            _delivery_tracker.mark(bot_token, chat_id, digest)
+        _request_answered(bot_token, chat_id)
+        get_conversation_store().add(bot_token, chat_id, "assistant", message)
+        acknowledge_remote_message(bot_token, chat_id)
+    
+    def _get_application(self, bot_token: str):
+        """Get or create the application for a bot token."""
+        if bot_token not in self.applications:
+            self.applications[bot_token] = (
+                Application.builder().token(bot_token).build()
+            )
+        return self.applications[bot_token]
+    
+    def _deliver(
+        self,
+        bot_token: str,
+        chat_id: int,
+        steps: List[SendStep],
+        on_sent: Optional[Callable[[SendStep, Any, float], None]] = None,
+    ) -> List[Any]:
+        """
+        Perform send steps in order, rate-limited per chat, and return their
+        results. When a step fails with a transient error, or earlier
+        deliveries to the chat are still waiting to be retried, the remaining
+        steps are stored in the outbox and DeliveryDeferred is raised.
+        """
+        outbox = get_outbox()
+        if outbox.has_pending(bot_token, chat_id):
+            # Queue behind the waiting deliveries to keep the chat in order
+            outbox.defer(bot_token, chat_id, steps)
+            raise DeliveryDeferred(
+                f"earlier messages to chat {chat_id} are waiting to be retried"
+            )
+        application = self._get_application(bot_token)
+        results = []
+        profiling = current_profile()
+        # Separates event loop and thread overhead from the HTTP calls
+        timeline = {"called": time.perf_counter()}
+        
+        async def send_async():
+            profiling.add("loop_setup", time.perf_counter() - timeline["called"])
+            for step in steps:
+                if step.optional:
+                    try:
+                        with profiling.phase("http"):
+                            results.append(
+                                await perform_step(application.bot, chat_id, step)
+                            )
+                    except Exception as e:
+                        logging.error(f"Error in Telegram {step.method}: {e}")
+                        results.append(None)
+                    continue
+                delay = _chat_rate_limiter.reserve(chat_id)
+                if delay > 0:
+                    with profiling.phase("rate_limit"):
+                        await asyncio.sleep(delay)
+                started = time.monotonic()
+                with profiling.phase("http"):
+                    result = await perform_step(application.bot, chat_id, step)
+                results.append(result)
+                if on_sent is not None:
+                    on_sent(step, result, time.monotonic() - started)
+            timeline["finished"] = time.perf_counter()
+        
+        try:
+            _run_coroutine_sync(send_async)
+            if "finished" in timeline:
+                profiling.add(
+                    "loop_teardown", time.perf_counter() - timeline["finished"]
+                )
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            outbox.defer(bot_token, chat_id, steps[len(results) :], e)
+            raise DeliveryDeferred(str(e)) from e
+        return results
+    
+    def _text_steps(
+        self, text: str, progress: Optional["ProgressMessage"] = None
+    ) -> List[SendStep]:
+        """Build steps sending text in ordered parts, the first replacing the status."""
+        steps = []
+        for index, part in enumerate(split_message(text)):
+            if index == 0 and progress is not None:
+                steps.append(
+                    SendStep(
+                        "edit_message_text",
+                        {"message_id": progress.message_id, "text": part},
+                    )
+                )
+            else:
+                steps.append(SendStep("send_message", {"text": part}))
+        return steps
+    
+    def _delete_progress_step(
+        self, progress: Optional["ProgressMessage"]
+    ) -> List[SendStep]:
+        """Media cannot replace a text message, so drop the status message instead."""
+        if progress is None:
+            return []
+        return [
+            SendStep(
+                "delete_message", {"message_id": progress.message_id}, optional=True
+            )
+        ]
+    
+    def _send_text(self, bot_token: str, chat_id: int, text: str) -> int:
+        """Send text as one or more rate-limited parts and return the part count."""
+        steps = self._text_steps(text, pop_progress_message(bot_token, chat_id))
+        self._deliver(bot_token, chat_id, steps)
+        get_result_cache().fulfil(bot_token, chat_id, {"text": text})
+        return len(steps)
+    
+    def _send_photos(
+        self,
+        bot_token: str,
+        chat_id: int,
+        images,
+        caption: str,
+        send_original: bool,
+        target_latency: float,
+    ):
+        """
+        Send an image batch as size-budgeted photo previews, followed by the
+        lossless originals as documents if requested. Images too elongated for
+        sendPhoto are only sent as documents. The previews are delivered
+        before the originals are encoded, so they are not held back by them.
+        """
+        progress = pop_progress_message(bot_token, chat_id)
+        budget = _upload_bandwidth.budget(target_latency, TELEGRAM_MAX_PHOTO_BYTES)
+        arrays = [image_to_array(image) for image in images]
+        with current_profile().phase("encode"):
+            previews = [
+                encode_photo(array, budget) for array in arrays if photo_fits(array)
+            ]
+        originals = (
+            arrays
+            if send_original
+            else [array for array in arrays if not photo_fits(array)]
+        )
+        media_caption = caption if len(caption) <= TELEGRAM_MAX_CAPTION_LENGTH else None
+        
+        steps = self._delete_progress_step(progress)
+        for start in range(0, len(previews), TELEGRAM_MAX_MEDIA_GROUP):
+            chunk = previews[start : start + TELEGRAM_MAX_MEDIA_GROUP]
+            chunk_caption = media_caption if start == 0 else None
+            if len(chunk) == 1:
+                steps.append(
+                    SendStep(
+                        "send_photo", {"caption": chunk_caption}, "photo", chunk[0]
+                    )
+                )
+            else:
+                steps.append(
+                    SendStep(
+                        "send_media_group",
+                        {"captions": [chunk_caption]},
+                        "media",
+                        chunk,
+                    )
+                )
+        if caption and media_caption is None and not originals:
+            steps.extend(self._text_steps(caption))
+        
+        def record_upload(step: SendStep, result, seconds: float):
+            if step.method == "send_photo":
+                _upload_bandwidth.record(len(step.media), seconds)
+            elif step.method == "send_media_group":
+                _upload_bandwidth.record(sum(len(data) for data in step.media), seconds)
+        
+        results = []
+        try:
+            if steps:
+                results = self._deliver(bot_token, chat_id, steps, record_upload)
+        except DeliveryDeferred:
+            if originals:
+                # Queue the originals behind the previews waiting in the outbox
+                documents = self._original_steps(originals, caption, previews)
+                self._deliver(bot_token, chat_id, documents)
+            raise
+        
+        if originals:
+            documents = self._original_steps(originals, caption, previews)
+            self._deliver(bot_token, chat_id, documents)
+        elif len(previews) == 1:
+            file_id = next(
+                (
+                    result.photo[-1].file_id
+                    for step, result in zip(steps, results)
+                    if step.method == "send_photo"
+                ),
+                None,
+            )
+            if file_id is not None:
+                get_result_cache().fulfil(
+                    bot_token,
+                    chat_id,
+                    {"text": caption, "media_type": "photo", "file_id": file_id},
+                )
+    
+    def _original_steps(
+        self, originals: List[Any], caption: str, previews: List[bytes]
+    ) -> List[SendStep]:
+        """Encode lossless originals as documents, captioned if no preview was."""
+        media_caption = caption if len(caption) <= TELEGRAM_MAX_CAPTION_LENGTH else None
+        with current_profile().phase("encode"):
+            steps = [
+                SendStep(
+                    "send_document",
+                    {
+                        "filename": f"image_{index + 1}.png",
+                        "caption": (
+                            media_caption if not previews and index == 0 else None
+                        ),
+                    },
+                    "document",
+                    encode_png(array),
+                )
+                for index, array in enumerate(originals)
+            ]
+        if caption and media_caption is None:
+            steps.extend(self._text_steps(caption))
+        return steps
+    
+    def _send_video(
+        self,
+        bot_token: str,
+        chat_id: int,
+        images,
+        caption: str,
+        media_mode: str,
+        fps: float,
+    ):
+        """Encode an image batch and upload it as a video or animation."""
+        progress = pop_progress_message(bot_token, chat_id)
+        with current_profile().phase("encode"):
+            path = encode_video(images, fps)
+        try:
+            with open(path, "rb") as media:
+                data = media.read()
+        finally:
+            os.remove(path)
+        media_caption = caption if len(caption) <= TELEGRAM_MAX_CAPTION_LENGTH else None
+        
+        steps = self._delete_progress_step(progress)
+        media_index = len(steps)
+        if media_mode == "animation":
+            steps.append(
+                SendStep(
+                    "send_animation", {"caption": media_caption}, "animation", data
+                )
+            )
+        else:
+            steps.append(
+                SendStep(
+                    "send_video",
+                    {"caption": media_caption, "supports_streaming": True},
+                    "video",
+                    data,
+                )
+            )
+        if caption and media_caption is None:
+            steps.extend(self._text_steps(caption))
+        
+        results = self._deliver(bot_token, chat_id, steps)
+        
+        # _deliver returns every step's result or raises, so the upload is there
+        sent = results[media_index]
+        file_id = (sent.animation if media_mode == "animation" else sent.video).file_id
+        get_result_cache().fulfil(
+            bot_token,
+            chat_id,
+            {"text": caption, "media_type": media_mode, "file_id": file_id},
+        )
@@ -0,0 +1,381 @@
+"""
+Durable outbox for Telegram deliveries that failed with a transient error.
+Failed sends are stored in SQLite and retried in the background with
+exponential backoff, in order per chat, until they succeed or are moved to
+the dead-letter state.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Any, Callable, List, NamedTuple, Optional
+
+try:
+    from .telegram_runtime import _LoopThread
+except ImportError:
+    from telegram_runtime import _LoopThread
+
+# Deliveries are given up after this many failed attempts...
+MAX_ATTEMPTS = 8
+
+# ...or once they have waited this many seconds
+MAX_AGE = 24 * 60 * 60
+
+# First retry delay in seconds, doubled on every further attempt
+BASE_DELAY = 2.0
+
+# Upper bound for the retry delay in seconds
+MAX_DELAY = 300.0
+
+# Seconds between checks for deliveries that are due
+POLL_INTERVAL = 0.5
+
+# Telegram errors that will fail again however often they are retried
+PERMANENT_ERRORS = {
+    "BadRequest",
+    "Forbidden",
+    "InvalidToken",
+    "ChatMigrated",
+    "Conflict",
+}
+
+# Errors worth retrying: network failures, timeouts, 5xx responses and flood control
+TRANSIENT_ERRORS = {
+    "NetworkError",
+    "TimedOut",
+    "RetryAfter",
+    "ConnectionError",
+    "TimeoutError",
+}
+
+
+class DeliveryDeferred(Exception):
+    """Raised when a delivery was stored in the outbox instead of completed."""
+
+
+class SendStep(NamedTuple):
+    """One Bot API call of a delivery, e.g. a message part or a photo."""
+
+    method: str
+    params: Dict[str, Any]
+    media_field: Optional[str] = None
+    media: Any = None
+    optional: bool = False  # failures are logged and the delivery goes on
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Check whether a failed send is worth retrying later."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return not names & PERMANENT_ERRORS and bool(names & TRANSIENT_ERRORS)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Return the flood control wait Telegram asked for, in seconds."""
+    value = getattr(error, "retry_after", None)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+async def perform_step(bot, chat_id: int, step: SendStep):
+    """Make the Bot API call for a step."""
+    params = dict(step.params)
+    if step.method == "send_media_group":
+        from telegram import InputMediaPhoto
+
+        captions = params.pop("captions", [])
+        media = [
+            InputMediaPhoto(
+                data, caption=captions[index] if index < len(captions) else None
+            )
+            for index, data in enumerate(step.media)
+        ]
+        return await bot.send_media_group(chat_id=chat_id, media=media, **params)
+    if step.media_field:
+        params[step.media_field] = step.media
+    return await getattr(bot, step.method)(chat_id=chat_id, **params)
+
+
+def _storable_steps(steps: List[SendStep]) -> List[SendStep]:
+    """Split media groups into single photos, which can be stored one per row."""
+    storable = []
+    for step in steps:
+        if step.method == "send_media_group":
+            captions = step.params.get("captions", [])
+            for index, data in enumerate(step.media):
+                storable.append(
+                    SendStep(
+                        "send_photo",
+                        {"caption": captions[index] if index < len(captions) else None},
+                        "photo",
+                        data,
+                    )
+                )
+        else:
+            storable.append(step)
+    return storable
+
+
+def _build_bot(token: str):
+    """Build a bot client for a token."""
+    from telegram import Bot
+
+    return Bot(token)
+
+
+class Outbox:
+    """
+    Stores failed deliveries and retries them on a background loop with
+    exponential backoff and jitter, oldest first within each chat.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        bot_factory: Optional[Callable[[str], Any]] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        max_age: float = MAX_AGE,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.path = path
+        self.bot_factory = bot_factory or _build_bot
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delivered = 0
+        self._bots = {}
+        self._worker = None
+        self._task = None
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, bot_token TEXT NOT NULL, "
+            "chat_id INTEGER NOT NULL, method TEXT NOT NULL, params TEXT NOT NULL, "
+            "media_field TEXT, media BLOB, optional INTEGER NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+            "created REAL NOT NULL, dead INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._db.commit()
+
+    def defer(
+        self,
+        bot_token: str,
+        chat_id: int,
+        steps: List[SendStep],
+        error: Optional[BaseException] = None,
+    ):
+        """Store undelivered steps, to be retried after the backoff delay."""
+        now = time.time()
+        delay = max(
+            self.base_delay, (retry_after(error) if error is not None else None) or 0
+        )
+        with self._lock:
+            for step in _storable_steps(steps):
+                self._db.execute(
+                    "INSERT INTO outbox (bot_token, chat_id, method, params, "
+                    "media_field, media, optional, attempts, next_attempt, created, "
+                    "last_error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        bot_token,
+                        chat_id,
+                        step.method,
+                        json.dumps(step.params),
+                        step.media_field,
+                        step.media,
+                        int(step.optional),
+                        1 if error is not None else 0,
+                        now + delay,
+                        now,
+                        str(error) if error is not None else None,
+                    ),
+                )
+            self._db.commit()
+        self.start()
+
+    def has_pending(self, bot_token: str, chat_id: int) -> bool:
+        """Check whether a chat has deliveries waiting, which new sends queue behind."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM outbox WHERE bot_token = ? AND chat_id = ? AND dead = 0 "
+                "LIMIT 1",
+                (bot_token, chat_id),
+            ).fetchone()
+        return row is not None
+
+    def pending_count(self, bot_token: Optional[str] = None) -> int:
+        """Return the number of deliveries waiting to be retried, optionally per bot."""
+        with self._lock:
+            if bot_token is None:
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE dead = 0"
+                ).fetchone()[0]
+            return self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE dead = 0 AND bot_token = ?",
+                (bot_token,),
+            ).fetchone()[0]
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Return deliveries that were given up on."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, bot_token, chat_id, method, attempts, last_error "
+                "FROM outbox WHERE dead = 1 ORDER BY id"
+            ).fetchall()
+        return [
+            dict(
+                zip(
+                    ("id", "bot_token", "chat_id", "method", "attempts", "last_error"),
+                    row,
+                )
+            )
+            for row in rows
+        ]
+
+    def due(self, now: Optional[float] = None) -> List[tuple]:
+        """Return the oldest waiting delivery of every chat whose retry is due."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, bot_token, chat_id, method, params, media_field, media, "
+                "optional, attempts, created FROM outbox WHERE id IN ("
+                "SELECT MIN(id) FROM outbox WHERE dead = 0 "
+                "GROUP BY bot_token, chat_id) AND next_attempt <= ? ORDER BY id",
+                (now,),
+            ).fetchall()
+
+    def backoff(self, attempts: int) -> float:
+        """Return the retry delay after a number of attempts, with jitter."""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(attempts - 1, 0))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record_failure(self, row: tuple, error: BaseException):
+        """Schedule the next attempt of a delivery, or give up on it."""
+        entry_id, attempts, created = row[0], row[8] + 1, row[9]
+        now = time.time()
+        dead = (
+            not is_transient_error(error)
+            or attempts >= self.max_attempts
+            or now - created >= self.max_age
+        )
+        delay = max(self.backoff(attempts), retry_after(error) or 0)
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, dead = ?, "
+                "last_error = ? WHERE id = ?",
+                (attempts, now + delay, int(dead), str(error), entry_id),
+            )
+            self._db.commit()
+        if dead:
+            logging.error(
+                f"Giving up on Telegram delivery to chat {row[2]} "
+                f"after {attempts} attempts: {error}"
+            )
+
+    def _remove(self, entry_id: int):
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+            self._db.commit()
+
+    async def _bot(self, token: str):
+        """Return an initialized bot client for a token."""
+        if token not in self._bots:
+            bot = self.bot_factory(token)
+            await bot.initialize()
+            self._bots[token] = bot
+        return self._bots[token]
+
+    async def retry_due(self) -> int:
+        """Attempt every due delivery once and return how many succeeded."""
+        delivered = 0
+        for row in self.due():
+            (
+                entry_id,
+                bot_token,
+                chat_id,
+                method,
+                params,
+                media_field,
+                media,
+                optional,
+            ) = row[:8]
+            step = SendStep(
+                method, json.loads(params), media_field, media, bool(optional)
+            )
+            try:
+                await perform_step(await self._bot(bot_token), chat_id, step)
+            except Exception as e:
+                if step.optional:
+                    self._remove(entry_id)
+                else:
+                    self._record_failure(row, e)
+                continue
+            self._remove(entry_id)
+            delivered += 1
+        self.delivered += delivered
+        return delivered
+
+    async def _run(self):
+        while True:
+            try:
+                await self.retry_due()
+            except Exception as e:
+                logging.error(f"Error retrying Telegram deliveries: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def start(self):
+        """Start retrying in the background, if not already running."""
+        with self._lock:
+            if self._worker is None:
+                self._worker = _LoopThread("telegram-outbox")
+                self._task = asyncio.run_coroutine_threadsafe(
+                    self._run(), self._worker.loop
+                )
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop retrying; waiting deliveries stay stored for the next start."""
+        with self._lock:
+            worker, task = self._worker, self._task
+            self._worker = self._task = None
+        if worker is not None:
+            task.cancel()
+            worker.stop(timeout)
+
+
+def default_outbox_path() -> str:
+    """Keep the outbox in ComfyUI's user directory, or in memory outside ComfyUI."""
+    try:
+        import folder_paths
+
+        return os.path.join(folder_paths.get_user_directory(), "telegram_outbox.db")
+    except (ImportError, AttributeError):
+        return ":memory:"
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """
+    Return the process-wide outbox, resuming retries left over from a previous
+    run. Set TELEGRAM_OUTBOX to choose where it is stored.
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(os.environ.get("TELEGRAM_OUTBOX") or default_outbox_path())
+            if _outbox.pending_count():
+                _outbox.start()
+        return _outbox
@@ -0,0 +1,222 @@
+"""
+Opt-in profiling of the Telegram nodes: wall and CPU time per internal phase
+of each node call, and a cProfile capture of calls slower than a threshold,
+written to a directory together with the Telegram message they handled.
+"""
+
+import cProfile
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+PROFILE_MODES = ["off", "timings", "cprofile"]
+
+# Calls busy for longer than this many seconds get their cProfile written
+DEFAULT_SLOW_THRESHOLD = 5.0
+
+# Phases spent waiting rather than working, not counted towards the threshold
+IDLE_PHASES = {"wait", "rate_limit"}
+
+
+class CallProfile:
+    """Timings of one node call, keyed by phase name."""
+
+    def __init__(
+        self,
+        node: str,
+        mode: str = "timings",
+        threshold: float = DEFAULT_SLOW_THRESHOLD,
+    ):
+        self.node = node
+        self.mode = mode
+        self.threshold = threshold
+        self.correlation: Dict[str, Any] = {}
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.started = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.profiler = cProfile.Profile() if mode == "cprofile" else None
+        self._lock = threading.Lock()
+
+    def correlate(self, **fields):
+        """Attach identifiers of the handled message, e.g. chat_id and update_id."""
+        self.correlation.update(
+            {key: value for key, value in fields.items() if value is not None}
+        )
+
+    def add(self, name: str, wall: float, cpu: float = 0.0):
+        """Add time to a phase; phases entered several times are summed."""
+        with self._lock:
+            phase = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+            phase["wall"] += wall
+            phase["cpu"] += cpu
+            phase["count"] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block as a phase. CPU time is that of the current thread."""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    @property
+    def busy(self) -> float:
+        """Wall time of the call not spent in idle phases."""
+        return self.wall - sum(
+            phase["wall"] for name, phase in self.phases.items() if name in IDLE_PHASES
+        )
+
+    def record(self) -> Dict[str, Any]:
+        """Return the call's timings as a JSON-serializable record."""
+        return {
+            "node": self.node,
+            "time": self.started,
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "phases": {
+                name: {
+                    "wall": round(phase["wall"], 6),
+                    "cpu": round(phase["cpu"], 6),
+                    "count": phase["count"],
+                }
+                for name, phase in self.phases.items()
+            },
+            **self.correlation,
+        }
+
+
+class _NullProfile:
+    """Stands in for CallProfile when profiling is off, so call sites need no checks."""
+
+    def correlate(self, **fields):
+        pass
+
+    def add(self, name: str, wall: float, cpu: float = 0.0):
+        pass
+
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+
+NULL_PROFILE = _NullProfile()
+
+_local = threading.local()
+
+
+def current_profile():
+    """Return the profile of the node call running on this thread, or a no-op one."""
+    return getattr(_local, "profile", None) or NULL_PROFILE
+
+
+def profile_directory() -> str:
+    """Return where profiles go: TELEGRAM_PROFILE_DIR, or ComfyUI's user directory."""
+    directory = os.environ.get("TELEGRAM_PROFILE_DIR")
+    if not directory:
+        try:
+            import folder_paths
+
+            base = folder_paths.get_user_directory()
+        except (ImportError, AttributeError):
+            base = tempfile.gettempdir()
+        directory = os.path.join(base, "telegram_profiles")
+    return directory
+
+
+def resolve_mode(mode: str) -> str:
+    """Use the node's profile input, or TELEGRAM_PROFILE when the input is off."""
+    if mode and mode != "off":
+        return mode
+    mode = os.environ.get("TELEGRAM_PROFILE", "off").lower()
+    if mode in ("1", "true", "yes"):
+        return "timings"
+    return mode if mode in PROFILE_MODES else "off"
+
+
+def write_profile(
+    profile: CallProfile, directory: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Append a call's timings to timings.jsonl, and dump its cProfile stats next
+    to it if the call was slow.
+    """
+    directory = directory or profile_directory()
+    os.makedirs(directory, exist_ok=True)
+    record = profile.record()
+    if profile.profiler is not None and profile.busy >= profile.threshold:
+        name = "_".join(
+            str(part)
+            for part in (
+                time.strftime("%Y%m%d-%H%M%S", time.localtime(profile.started)),
+                profile.node,
+                profile.correlation.get("chat_id", ""),
+                profile.correlation.get("update_id", ""),
+            )
+        )
+        record["cprofile"] = f"{name}.prof"
+        profile.profiler.dump_stats(os.path.join(directory, record["cprofile"]))
+    with open(
+        os.path.join(directory, "timings.jsonl"), "a", encoding="utf-8"
+    ) as timings:
+        timings.write(json.dumps(record, default=str) + "\n")
+    return record
+
+
+@contextmanager
+def profile_call(node: str, mode: str = "timings"):
+    """Profile a node call made on this thread and write the results when it ends."""
+    threshold = float(
+        os.environ.get("TELEGRAM_PROFILE_THRESHOLD", DEFAULT_SLOW_THRESHOLD)
+    )
+    profile = CallProfile(node, mode, threshold)
+    previous = getattr(_local, "profile", None)
+    _local.profile = profile
+    wall, cpu = time.perf_counter(), time.thread_time()
+    if profile.profiler is not None:
+        try:
+            profile.profiler.enable()
+        except ValueError as e:
+            # Only one profiler can be active at a time, e.g. under a debugger
+            logging.error(f"Cannot capture cProfile: {e}")
+            profile.profiler = None
+    try:
+        yield profile
+    finally:
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        profile.wall = time.perf_counter() - wall
+        profile.cpu = time.thread_time() - cpu
+        _local.profile = previous
+        try:
+            record = write_profile(profile)
+            logging.info(f"Telegram profile: {json.dumps(record, default=str)}")
+        except Exception as e:
+            logging.error(f"Error writing Telegram profile: {e}")
+
+
+def profiled(node: str):
+    """
+    Decorate a node function so its profile input (or TELEGRAM_PROFILE)
+    turns on profiling of the call.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, profile: str = "off", **kwargs):
+            mode = resolve_mode(profile)
+            if mode == "off":
+                return method(self, *args, **kwargs)
+            with profile_call(node, mode):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
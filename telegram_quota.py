@@ -0,0 +1,254 @@
+"""
+Per-user usage accounting: requests and generation time in a sliding
+one-hour window, counted in an in-memory index and flushed to a SQLite file
+now and then, so quotas can be enforced before a message is queued.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+
+# Seconds covered by the quotas
+QUOTA_WINDOW = 3600
+
+# Usage is counted in buckets of this many seconds, so the window slides per bucket
+BUCKET_SECONDS = 60
+
+# Seconds between writes of changed usage to the store
+FLUSH_INTERVAL = 30.0
+
+
+class _Usage:
+    """One user's per-bucket counts within the window, with running totals."""
+
+    __slots__ = ("buckets", "requests", "seconds")
+
+    def __init__(self):
+        self.buckets = deque()  # [bucket, requests, seconds], oldest first
+        self.requests = 0
+        self.seconds = 0.0
+
+    def add(self, bucket: int, requests: int = 0, seconds: float = 0.0):
+        if self.buckets and self.buckets[-1][0] == bucket:
+            self.buckets[-1][1] += requests
+            self.buckets[-1][2] += seconds
+        else:
+            self.buckets.append([bucket, requests, seconds])
+        self.requests += requests
+        self.seconds += seconds
+
+    def expire(self, oldest: int):
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, requests, seconds = self.buckets.popleft()
+            self.requests -= requests
+            self.seconds -= seconds
+
+    def wait(
+        self, index: int, limit: float, now: float, bucket_seconds: int, window: int
+    ) -> float:
+        """Seconds until the total at index (1 requests, 2 seconds) is below limit."""
+        total = self.requests if index == 1 else self.seconds
+        for bucket in self.buckets:
+            total -= bucket[index]
+            if total < limit:
+                return max(0.0, bucket[0] * bucket_seconds + window - now)
+        return 0.0
+
+
+class UsageLedger:
+    """
+    Counts each user's requests and generation time, and admits new requests
+    only while the user is within the hourly limits.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        window: int = QUOTA_WINDOW,
+        bucket_seconds: int = BUCKET_SECONDS,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.flush_interval = flush_interval
+        self._users: Dict[int, _Usage] = {}
+        # (user_id, bucket) changed since the last flush
+        self._dirty: Set[Tuple[int, int]] = set()
+        # (bot_token, chat_id) -> (user_id, started)
+        self._active: Dict[Tuple[str, int], Tuple[int, float]] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "user_id INTEGER NOT NULL, bucket INTEGER NOT NULL, "
+            "requests INTEGER NOT NULL, seconds REAL NOT NULL, "
+            "PRIMARY KEY (user_id, bucket))"
+        )
+        self._db.commit()
+
+    def _oldest(self, now: float) -> int:
+        return int((now - self.window) // self.bucket_seconds) + 1
+
+    def _get(self, user_id: int, now: float) -> _Usage:
+        """Return a user's usage, reading it from the store on first use."""
+        usage = self._users.get(user_id)
+        if usage is None:
+            usage = self._users[user_id] = _Usage()
+            rows = self._db.execute(
+                "SELECT bucket, requests, seconds FROM usage "
+                "WHERE user_id = ? AND bucket >= ? ORDER BY bucket",
+                (user_id, self._oldest(now)),
+            ).fetchall()
+            for bucket, requests, seconds in rows:
+                usage.add(bucket, requests, seconds)
+        usage.expire(self._oldest(now))
+        return usage
+
+    def usage(self, user_id: int, now: Optional[float] = None) -> Tuple[int, float]:
+        """Return a user's requests and generation seconds within the window."""
+        now = time.time() if now is None else now
+        with self._lock:
+            usage = self._get(user_id, now)
+            return usage.requests, usage.seconds
+
+    def admit(
+        self,
+        user_id: int,
+        max_requests: int = 0,
+        max_seconds: float = 0,
+        now: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Count a new request for a user and return None, or return why it is
+        refused when the user has reached a limit (0 means no limit).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            usage = self._get(user_id, now)
+            refusal = None
+            if max_requests and usage.requests >= max_requests:
+                wait = usage.wait(
+                    1, max_requests, now, self.bucket_seconds, self.window
+                )
+                refusal = (
+                    f"You have reached the limit of {max_requests} requests per hour."
+                )
+            elif max_seconds and usage.seconds >= max_seconds:
+                wait = usage.wait(2, max_seconds, now, self.bucket_seconds, self.window)
+                refusal = (
+                    f"You have used your {int(max_seconds)} seconds "
+                    "of generation time for this hour."
+                )
+            if refusal is not None:
+                return f"{refusal} Try again in {max(1, math.ceil(wait / 60))} min."
+            self._record(user_id, usage, now, requests=1)
+        self._maybe_flush()
+        return None
+
+    def begin(
+        self, bot_token: str, chat_id: int, user_id: int, now: Optional[float] = None
+    ):
+        """
+        Start timing the generation of a user's request. The bot's earlier
+        requests are finished, since a workflow handles one message at a time.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            earlier = [key for key in self._active if key[0] == bot_token]
+        for key in earlier:
+            self.finish(*key, now=now)
+        with self._lock:
+            self._active[(bot_token, chat_id)] = (user_id, now)
+
+    def finish(
+        self, bot_token: str, chat_id: int, now: Optional[float] = None
+    ) -> Optional[float]:
+        """Charge the generation time of a chat's request to its user and return it."""
+        now = time.time() if now is None else now
+        with self._lock:
+            active = self._active.pop((bot_token, chat_id), None)
+            if active is None:
+                return None
+            user_id, started = active
+            seconds = max(0.0, now - started)
+            self._record(user_id, self._get(user_id, now), now, seconds=seconds)
+        self._maybe_flush()
+        return seconds
+
+    def _record(
+        self,
+        user_id: int,
+        usage: _Usage,
+        now: float,
+        requests: int = 0,
+        seconds: float = 0.0,
+    ):
+        bucket = int(now // self.bucket_seconds)
+        usage.add(bucket, requests, seconds)
+        self._dirty.add((user_id, bucket))
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, now: Optional[float] = None):
+        """Write changed usage to the store and forget users without recent usage."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_flush = time.monotonic()
+            oldest = self._oldest(now)
+            rows = []
+            for user_id, bucket in self._dirty:
+                usage = self._users.get(user_id)
+                counts = None
+                if usage is not None:
+                    counts = next((e for e in usage.buckets if e[0] == bucket), None)
+                if counts is not None:
+                    rows.append((user_id, bucket, counts[1], counts[2]))
+            self._dirty.clear()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?)", rows
+            )
+            self._db.execute("DELETE FROM usage WHERE bucket < ?", (oldest,))
+            self._db.commit()
+            for user_id, usage in list(self._users.items()):
+                usage.expire(oldest)
+                if not usage.buckets:
+                    del self._users[user_id]
+
+    def close(self):
+        """Flush and close the store."""
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+
+def default_usage_path() -> str:
+    """Keep usage in ComfyUI's user directory, or in memory outside ComfyUI."""
+    try:
+        import folder_paths
+
+        return os.path.join(folder_paths.get_user_directory(), "telegram_usage.db")
+    except (ImportError, AttributeError):
+        return ":memory:"
+
+
+_usage_ledger = None
+_usage_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Return the process-wide usage ledger, stored where TELEGRAM_USAGE says."""
+    global _usage_ledger
+    with _usage_ledger_lock:
+        if _usage_ledger is None:
+            _usage_ledger = UsageLedger(
+                os.environ.get("TELEGRAM_USAGE") or default_usage_path()
+            )
+        return _usage_ledger
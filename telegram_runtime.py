@@ -0,0 +1,373 @@
+"""
+Shared runtime hosting Telegram bots: a small fixed pool of event loops, each
+polling any number of bot tokens and routing their updates into per-token
+queues consumed by the nodes.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+# Seconds to wait for a bot to connect and start polling
+START_TIMEOUT = 30
+
+# Seconds to wait for a bot to stop polling and shut down, including the drain
+STOP_TIMEOUT = 10
+
+# Seconds a stopping bot waits for in-flight downloads and sends to finish
+DRAIN_TIMEOUT = 5
+
+
+class BotRuntime:
+    """
+    One bot token's Application running on a hub loop, with the queue its
+    updates are routed into.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        application,
+        loop,
+        thread: Optional[threading.Thread] = None,
+        message_queue: Optional[queue.Queue] = None,
+    ):
+        self.token = token
+        self.application = application
+        self.loop = loop
+        self.thread = thread
+        self.message_queue = (
+            message_queue if message_queue is not None else queue.Queue()
+        )
+        self.handler = None  # async callable(update, context) routing updates
+        # Async callable(update, context) answering inline queries
+        self.inline_handler = None
+        self.on_change = None  # callable() notified of state changes
+        self.is_running = False
+        self.started_at = None
+        self.last_update_at = None
+        self.users = 0  # listeners attached through the hub
+        self.chat_actions = None  # ChatActionKeepalive of chats waiting for a reply
+        self._inflight = set()  # concurrent futures to finish before shutdown
+
+    async def dispatch(self, update, context):
+        """Route an update to the current handler."""
+        self.last_update_at = time.time()
+        if self.handler is not None:
+            await self.handler(update, context)
+        self._changed()
+
+    async def dispatch_inline(self, update, context):
+        """Route an inline query to the current inline handler."""
+        self.last_update_at = time.time()
+        if self.inline_handler is not None:
+            await self.inline_handler(update, context)
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    async def start(self):
+        """Connect the bot and start polling for updates."""
+        await self.application.initialize()
+        await self.application.updater.start_polling()
+        await self.application.start()
+        self.is_running = True
+        self.started_at = time.time()
+        self._changed()
+
+    async def stop(self, drain_timeout: float = DRAIN_TIMEOUT):
+        """
+        Stop polling, let updates already received be handled, wait up to
+        drain_timeout for in-flight downloads and sends, and shut the bot down.
+        """
+        self.is_running = False
+        self._changed()
+        if self.chat_actions is not None:
+            self.chat_actions.close()
+        await self.application.updater.stop()
+        await self.application.stop()
+        await self.drain(drain_timeout)
+        await self.application.shutdown()
+
+    def track(self, future):
+        """Keep a concurrent future of work on this bot's loop until it is done."""
+        self._inflight.add(future)
+        future.add_done_callback(self._inflight.discard)
+        return future
+
+    async def drain(self, timeout: float):
+        """Wait up to timeout for tracked work to finish."""
+        pending = [asyncio.wrap_future(future) for future in list(self._inflight)]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+
+    @property
+    def is_polling(self) -> bool:
+        """Whether the updater is still fetching updates."""
+        return (
+            self.is_running
+            and getattr(self.application.updater, "running", False) is True
+        )
+
+    def peek_update_id(self) -> Optional[int]:
+        """Return the update_id of the oldest queued message without consuming it."""
+        with self.message_queue.mutex:
+            if not self.message_queue.queue:
+                return None
+            return self.message_queue.queue[0].get("update_id")
+
+    def queue_position(self, chat_id: int) -> Optional[int]:
+        """Return the 1-based queue position of a chat's oldest queued message."""
+        with self.message_queue.mutex:
+            for position, message in enumerate(self.message_queue.queue, start=1):
+                if message.get("chat_id") == chat_id:
+                    return position
+        return None
+
+    def cancel(self, chat_id: int) -> int:
+        """
+        Remove a chat's queued messages, end its chat action and return how
+        many were removed.
+        """
+        with self.message_queue.mutex:
+            removed = [
+                message
+                for message in self.message_queue.queue
+                if message.get("chat_id") == chat_id
+            ]
+            if removed:
+                kept = [
+                    message
+                    for message in self.message_queue.queue
+                    if message.get("chat_id") != chat_id
+                ]
+                self.message_queue.queue.clear()
+                self.message_queue.queue.extend(kept)
+        for message in removed:
+            for inbound in message.get("images", ()):
+                inbound.close()
+        if removed and self.chat_actions is not None:
+            self.chat_actions.stop(chat_id)
+        return len(removed)
+
+    def answered(self, chat_id: int):
+        """Stop a chat's chat action once none of its messages are queued."""
+        if self.chat_actions is not None and self.queue_position(chat_id) is None:
+            self.chat_actions.stop(chat_id)
+
+    def submit(self, coro):
+        """Schedule a coroutine on this bot's loop and return a tracked future."""
+        return self.track(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+
+class _LoopThread:
+    """An asyncio event loop running forever on a daemon thread."""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the loop and wait for its thread to exit."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+def _build_application(token: str):
+    """Build a python-telegram-bot Application for a token."""
+    from telegram.ext import Application
+
+    return Application.builder().token(token).build()
+
+
+class RuntimeHub:
+    """
+    Hosts any number of bot tokens on a fixed pool of event loops, so the
+    threads and loops used stay flat as tokens are added.
+    """
+
+    def __init__(
+        self,
+        loop_count: int = 1,
+        application_factory: Optional[Callable[[str], Any]] = None,
+        start_timeout: float = START_TIMEOUT,
+        stop_timeout: float = STOP_TIMEOUT,
+    ):
+        self.loop_count = max(1, loop_count)
+        self.application_factory = application_factory or _build_application
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.runtimes: Dict[str, BotRuntime] = {}
+        self.observers: List[Callable[[], None]] = []  # notified when a runtime changes
+        self._handover: Dict[str, queue.Queue] = {}  # queues left by stopped runtimes
+        # Tokens whose runtime is stopping
+        self._stopping: Dict[str, threading.Event] = {}
+        # Tokens whose runtime is starting
+        self._starting: Dict[str, threading.Event] = {}
+        self._loops: List[_LoopThread] = []
+        self._lock = threading.RLock()
+
+    def _loop_for(self, token: str) -> _LoopThread:
+        """Pick the loop hosting a token, starting the pool on first use."""
+        if not self._loops:
+            self._loops = [
+                _LoopThread(f"telegram-hub-{index}") for index in range(self.loop_count)
+            ]
+        return self._loops[zlib.crc32(token.encode("utf-8")) % self.loop_count]
+
+    def acquire(
+        self,
+        token: str,
+        configure: Optional[Callable[[Any, BotRuntime], None]] = None,
+        message_queue: Optional[queue.Queue] = None,
+    ) -> BotRuntime:
+        """
+        Return the running runtime for a token, starting it if needed, and
+        count the caller as one of its users. configure(application, runtime)
+        registers handlers on a new application. Messages still queued by a
+        previous runtime of the token are handed over to the new one.
+        """
+        while True:
+            with self._lock:
+                runtime = self.runtimes.get(token)
+                if runtime is not None and runtime.is_running:
+                    runtime.users += 1
+                    return runtime
+                # Telegram rejects a second poller, so let a previous runtime
+                # finish stopping, or a concurrent start of the token finish
+                pending = self._starting.get(token) or self._stopping.get(token)
+                if pending is None:
+                    started = self._starting[token] = threading.Event()
+                    runtime = self.runtimes.pop(token, None)
+                    if message_queue is None and runtime is None:
+                        message_queue = self._handover.pop(token, None)
+                    loop_thread = self._loop_for(token)
+                    break
+            pending.wait(max(self.start_timeout, self.stop_timeout) + 1)
+        # Start outside the lock, so a slow token doesn't hold up the others
+        try:
+            if runtime is not None:
+                # A runtime that stopped on its own still holds its queue
+                self._stop(runtime)
+                if message_queue is None:
+                    message_queue = runtime.message_queue
+            application = self.application_factory(token)
+            runtime = BotRuntime(
+                token, application, loop_thread.loop, loop_thread.thread, message_queue
+            )
+            runtime.on_change = self._changed
+            if configure is not None:
+                configure(application, runtime)
+            try:
+                loop_thread.run(runtime.start(), self.start_timeout)
+            except BaseException:
+                if not runtime.message_queue.empty():
+                    with self._lock:
+                        self._handover[token] = runtime.message_queue
+                raise
+            with self._lock:
+                runtime.users = 1
+                self.runtimes[token] = runtime
+            return runtime
+        finally:
+            with self._lock:
+                self._starting.pop(token, None)
+            started.set()
+
+    def _changed(self):
+        for observer in list(self.observers):
+            try:
+                observer()
+            except Exception as e:
+                logging.error(f"Error notifying runtime observer: {e}")
+
+    def get(self, token: str) -> Optional[BotRuntime]:
+        """Return the runtime for a token, if one was started."""
+        return self.runtimes.get(token)
+
+    def release(self, token: str, force: bool = False):
+        """
+        Drop one user of a token's runtime, and stop polling it once no users
+        are left (or right away with force). Returns within stop_timeout.
+        """
+        with self._lock:
+            runtime = self.runtimes.get(token)
+            if runtime is None:
+                return
+            runtime.users -= 1
+            if runtime.users > 0 and not force:
+                return
+            del self.runtimes[token]
+            stopped = self._stopping[token] = threading.Event()
+        try:
+            self._stop(runtime)
+        finally:
+            with self._lock:
+                if not runtime.message_queue.empty():
+                    # Keep what was received for the token's next runtime
+                    self._handover[token] = runtime.message_queue
+                self._stopping.pop(token, None)
+            stopped.set()
+
+    def _stop(self, runtime: BotRuntime):
+        """Stop a runtime on its own loop, bounded by stop_timeout."""
+        drain_timeout = min(DRAIN_TIMEOUT, self.stop_timeout / 2)
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(runtime.stop(drain_timeout), self.stop_timeout),
+            runtime.loop,
+        )
+        try:
+            future.result(self.stop_timeout + 1)
+        except Exception as e:
+            future.cancel()
+            logging.error(f"Error stopping bot: {e!r}")
+
+    def shutdown(self):
+        """Stop every runtime and the loop pool."""
+        for token in list(self.runtimes):
+            self.release(token, force=True)
+        with self._lock:
+            loops, self._loops = self._loops, []
+            self._handover.clear()
+        for loop_thread in loops:
+            loop_thread.stop(self.stop_timeout)
+
+    @property
+    def threads(self) -> List[threading.Thread]:
+        """The threads running the loop pool."""
+        return [loop_thread.thread for loop_thread in self._loops]
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> RuntimeHub:
+    """
+    Return the process-wide runtime hub. Set TELEGRAM_RUNTIME_LOOPS to spread
+    bot tokens over more than one event loop.
+    """
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = RuntimeHub(
+                loop_count=int(os.environ.get("TELEGRAM_RUNTIME_LOOPS", 1))
+            )
+        return _hub
@@ -0,0 +1,164 @@
+"""
+Live runtime status of the Telegram bots, pushed to the ComfyUI frontend over
+its websocket so the node widgets can show it.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from .telegram_cache import get_result_cache
+    from .telegram_outbox import get_outbox, retry_after
+    from .telegram_runtime import get_hub
+except ImportError:
+    from telegram_cache import get_result_cache
+    from telegram_outbox import get_outbox, retry_after
+    from telegram_runtime import get_hub
+
+# Websocket event name the frontend listens for
+STATUS_EVENT = "telegram.status"
+
+# Pushes are at least this many seconds apart, however busy the bots are
+MIN_PUSH_INTERVAL = 1.0
+
+# Status is pushed at least this often while bots run, so stopped pollers show up
+HEARTBEAT_INTERVAL = 10.0
+
+# Errors older than this many seconds are no longer reported
+RECENT_WINDOW = 600
+
+
+def bot_id(token: str) -> str:
+    """Return the public bot id, the part of a token before the colon."""
+    token = token.strip()
+    if token.startswith("bot"):
+        token = token[3:]
+    return token.split(":", 1)[0]
+
+
+def _prompt_server_send() -> Optional[Callable[[str, Any], None]]:
+    """Return ComfyUI's websocket broadcast, or None outside ComfyUI."""
+    try:
+        from server import PromptServer
+    except ImportError:
+        return None
+    instance = getattr(PromptServer, "instance", None)
+    return getattr(instance, "send_sync", None)
+
+
+class StatusReporter:
+    """
+    Collects bot runtime state and recent send errors, and pushes snapshots to
+    the frontend, throttled to MIN_PUSH_INTERVAL.
+    """
+
+    def __init__(
+        self,
+        send: Optional[Callable[[str, Any], None]] = None,
+        min_interval: float = MIN_PUSH_INTERVAL,
+        heartbeat: float = HEARTBEAT_INTERVAL,
+    ):
+        self.send = send if send is not None else _prompt_server_send()
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+        self.pushes = 0
+        self._errors: Dict[str, deque] = {}  # bot id -> (time, rate limited, message)
+        self._last_push = 0.0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def record_error(self, bot_token: str, error: BaseException):
+        """Remember a failed send for the status of its bot."""
+        with self._lock:
+            errors = self._errors.setdefault(bot_id(bot_token), deque(maxlen=100))
+            errors.append((time.time(), retry_after(error) is not None, str(error)))
+        self.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current status of every bot and of the result cache."""
+        now = time.time()
+        bots = {}
+        outbox = get_outbox()
+        for token, runtime in list(get_hub().runtimes.items()):
+            bots[bot_id(token)] = {
+                "connected": runtime.is_running,
+                "polling": runtime.is_polling,
+                "queue": runtime.message_queue.qsize(),
+                "last_message_age": (
+                    None
+                    if runtime.last_update_at is None
+                    else now - runtime.last_update_at
+                ),
+                "backlog": outbox.pending_count(token),
+            }
+        with self._lock:
+            for key, errors in self._errors.items():
+                while errors and errors[0][0] < now - RECENT_WINDOW:
+                    errors.popleft()
+                if not errors:
+                    continue
+                status = bots.setdefault(key, {})
+                status["errors"] = len(errors)
+                status["rate_limited"] = sum(1 for _, limited, _ in errors if limited)
+                status["last_error"] = errors[-1][2]
+        return {
+            "bots": bots,
+            "cache": get_result_cache().stats(),
+            "error_window": RECENT_WINDOW,
+        }
+
+    def notify(self):
+        """Push the status now, or as soon as the throttle allows."""
+        if self.send is None:
+            return
+        with self._lock:
+            if self._timer is not None and self._timer.interval <= self.min_interval:
+                return  # a push is already due shortly
+            delay = max(0.0, self._last_push + self.min_interval - time.monotonic())
+            self._schedule(delay)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._push)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _push(self):
+        with self._lock:
+            self._timer = None
+            self._last_push = time.monotonic()
+        try:
+            snapshot = self.snapshot()
+            self.send(STATUS_EVENT, snapshot)
+            self.pushes += 1
+        except Exception as e:
+            logging.error(f"Error pushing Telegram status: {e}")
+            return
+        with self._lock:
+            if snapshot["bots"] and self._timer is None:
+                self._schedule(self.heartbeat)
+
+    def stop(self):
+        """Cancel any scheduled push."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+_status_reporter = None
+_status_reporter_lock = threading.Lock()
+
+
+def get_status_reporter() -> StatusReporter:
+    """Return the process-wide status reporter, notified of runtime changes."""
+    global _status_reporter
+    with _status_reporter_lock:
+        if _status_reporter is None:
+            _status_reporter = StatusReporter()
+            get_hub().observers.append(_status_reporter.notify)
+        return _status_reporter
@@ -0,0 +1,213 @@
+import unittest
+import sys
+import os
+import time
+from unittest.mock import Mock, AsyncMock, patch
+import asyncio
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_cache import (
+    EXPECT_TIMEOUT,
+    ResultCache,
+    normalize_prompt,
+    workflow_fingerprint,
+    result_cache_key,
+)
+from telegram_nodes import TelegramListener, SaveToTelegram, DeliveryTracker
+from telegram_outbox import DeliveryDeferred
+
+
+class TestCacheKeys(unittest.TestCase):
+    """Test cases for prompt normalization and fingerprints"""
+    
+    def test_normalize_prompt(self):
+        """Test that case and whitespace differences are ignored"""
+        self.assertEqual(normalize_prompt("  A   Cat\n"), "a cat")
+    
+    def test_fingerprint_ignores_listener_node(self):
+        """Test that the listener node's own inputs do not change the fingerprint"""
+        prompt_a = {"1": {"inputs": {"timeout": 10}}, "2": {"inputs": {"steps": 20}}}
+        prompt_b = {"1": {"inputs": {"timeout": 30}}, "2": {"inputs": {"steps": 20}}}
+        prompt_c = {"1": {"inputs": {"timeout": 10}}, "2": {"inputs": {"steps": 30}}}
+        
+        self.assertEqual(
+            workflow_fingerprint(prompt_a, "1"), workflow_fingerprint(prompt_b, "1")
+        )
+        self.assertNotEqual(
+            workflow_fingerprint(prompt_a, "1"), workflow_fingerprint(prompt_c, "1")
+        )
+        self.assertEqual(workflow_fingerprint(None), "")
+    
+    def test_cache_key(self):
+        """Test that keys depend on normalized text and workflow"""
+        self.assertEqual(result_cache_key("Cat", "wf"), result_cache_key(" cat ", "wf"))
+        self.assertNotEqual(
+            result_cache_key("cat", "wf"), result_cache_key("cat", "other")
+        )
+
+
+class TestResultCache(unittest.TestCase):
+    """Test cases for the result cache store"""
+    
+    def test_put_and_get(self):
+        """Test storing and retrieving a result"""
+        cache = ResultCache()
+        cache.put("key", {"text": "hello"}, ttl=60)
+        
+        self.assertEqual(cache.get("key"), {"text": "hello"})
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+    
+    def test_ttl_expiry(self):
+        """Test that expired entries are not returned"""
+        cache = ResultCache()
+        cache.put("key", {"text": "hello"}, ttl=0.05)
+        time.sleep(0.1)
+        
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats()["entries"], 0)
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = ResultCache(max_entries=2)
+        cache.put("a", {"text": "a"}, ttl=60)
+        time.sleep(0.01)
+        cache.put("b", {"text": "b"}, ttl=60)
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", {"text": "c"}, ttl=60)
+        
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+    
+    def test_expect_and_fulfil(self):
+        """Test that delivered results are stored under the expected key"""
+        cache = ResultCache()
+        
+        self.assertFalse(cache.fulfil("token", 1, {"text": "unexpected"}))
+        cache.expect("token", 1, "key", 60)
+        self.assertTrue(cache.fulfil("token", 1, {"text": "result"}))
+        self.assertFalse(cache.fulfil("token", 1, {"text": "again"}))
+        self.assertEqual(cache.get("key"), {"text": "result"})
+    
+    def test_discard(self):
+        """Test that a discarded expectation caches nothing and is not pending"""
+        cache = ResultCache()
+        cache.expect("token", 1, "key", 60)
+        
+        cache.discard("token", 1)
+        
+        self.assertFalse(cache.is_expected("key"))
+        self.assertFalse(cache.fulfil("token", 1, {"text": "result"}))
+        self.assertIsNone(cache.get("key"))
+    
+    def test_expectation_deadline(self):
+        """Test that a result never delivered stops counting as being generated"""
+        cache = ResultCache()
+        cache.expect("token", 1, "key", 60)
+        self.assertTrue(cache.is_expected("key"))
+        
+        later = time.time() + EXPECT_TIMEOUT + 1
+        with patch("telegram_cache.time.time", return_value=later):
+            self.assertFalse(cache.is_expected("key"))
+    
+    def test_persistent_store(self):
+        """Test that a file-backed cache survives reopening"""
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.db")
+            ResultCache(path=path).put("key", {"text": "hello"}, ttl=60)
+            
+            self.assertEqual(ResultCache(path=path).get("key"), {"text": "hello"})
+
+
+class TestListenerCache(unittest.TestCase):
+    """Test cases for answering cached prompts from the bot loop"""
+    
+    def setUp(self):
+        """Set up a listener with caching enabled"""
+        self.listener = TelegramListener()
+        self.listener.cache_ttl = 60
+        self.listener.workflow_fingerprint = "wf"
+        self.cache = ResultCache()
+        patcher = patch("telegram_nodes.get_result_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def create_update(self, text):
+        """Create a mock text update"""
+        update = Mock()
+        update.message.text = text
+        update.message.chat_id = 12345
+        update.message.from_user.id = 67890
+        update.message.from_user.username = "testuser"
+        update.message.reply_text = AsyncMock()
+        return update
+    
+    def test_cache_hit_answered_without_queueing(self):
+        """Test that a cache hit is replied to and not queued"""
+        self.cache.put(result_cache_key("cat", "wf"), {"text": "cached reply"}, ttl=60)
+        update = self.create_update("Cat")
+        
+        asyncio.run(self.listener._handle_message(update, Mock()))
+        
+        update.message.reply_text.assert_awaited_once_with("cached reply")
+        self.assertTrue(self.listener.message_queue.empty())
+    
+    def test_cache_miss_is_queued_with_key(self):
+        """Test that a miss reaches the workflow and is expected in the cache"""
+        update = self.create_update("cat")
+        
+        asyncio.run(self.listener._handle_message(update, Mock()))
+        
+        message_data = self.listener.message_queue.queue[0]
+        self.assertEqual(message_data["cache_key"], result_cache_key("cat", "wf"))
+        
+        with patch.object(self.listener, "_start_bot"):
+            self.listener.is_running = True
+            self.listener.bot_token = "bot123456:ABC"
+            result = self.listener.listen_for_message("bot123456:ABC", 5, cache_ttl=60)
+        
+        self.assertEqual(result, ("cat", "12345", None, "", "67890"))
+        self.assertTrue(self.cache.fulfil("bot123456:ABC", 12345, {"text": "result"}))
+    
+    def test_uncached_message_drops_expectation(self):
+        """Test that the next message of a chat is not cached under an earlier key"""
+        self.cache.expect("bot123456:ABC", 12345, "earlier", 60)
+        self.listener.message_queue.put({"text": "hello", "chat_id": 12345})
+        
+        with patch.object(self.listener, "_start_bot"):
+            self.listener.is_running = True
+            self.listener.bot_token = "bot123456:ABC"
+            self.listener.listen_for_message("bot123456:ABC", 5)
+        
+        self.assertFalse(self.cache.is_expected("earlier"))
+    
+    def test_failed_send_drops_expectation(self):
+        """Test that a failed or deferred delivery caches nothing for the prompt"""
+        sender = SaveToTelegram()
+        token = "bot123456:ABC"
+        
+        for error in (RuntimeError("Forbidden"), DeliveryDeferred("retry later")):
+            self.cache.expect(token, 12345, "key", 60)
+            with patch.object(sender, "_deliver", side_effect=error):
+                with patch("telegram_nodes._delivery_tracker", DeliveryTracker()):
+                    sender.send_message(token, "12345", "two", images=None)
+            
+            self.assertFalse(self.cache.is_expected("key"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,202 @@
+import unittest
+import sys
+import os
+import asyncio
+import time
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_chat_actions import ChatActionKeepalive
+from telegram_runtime import BotRuntime, RuntimeHub, _LoopThread
+from telegram_nodes import (
+    TelegramListener,
+    SaveToTelegram,
+    ChatRateLimiter,
+    DeliveryTracker,
+)
+
+
+class Forbidden(Exception):
+    pass
+
+
+class TestChatActionKeepalive(unittest.TestCase):
+    """Test cases for chat actions refreshed from one timer"""
+
+    def setUp(self):
+        """Run a keepalive with a short interval on a loop thread"""
+        self.loop_thread = _LoopThread("test-chat-actions")
+        self.addCleanup(self.loop_thread.stop, 5)
+        self.bot = Mock()
+        self.bot.send_chat_action = AsyncMock()
+        self.keepalive = ChatActionKeepalive(
+            self.bot, self.loop_thread.loop, interval=0.05, max_duration=60
+        )
+
+    def actions(self, chat_id):
+        return [
+            call.kwargs["action"]
+            for call in self.bot.send_chat_action.call_args_list
+            if call.kwargs["chat_id"] == chat_id
+        ]
+
+    def sync(self):
+        """Wait until callbacks already scheduled on the loop have run"""
+
+        async def noop():
+            await asyncio.sleep(0)
+
+        self.loop_thread.run(noop(), 5)
+
+    def test_actions_repeat_until_stopped(self):
+        """Test that waiting chats are refreshed until they are answered"""
+        self.keepalive.start(1, "typing")
+        self.keepalive.start(2, "upload_photo")
+        time.sleep(0.3)
+        self.keepalive.stop(1)
+        self.sync()
+        sent_to_first = len(self.actions(1))
+        time.sleep(0.2)
+
+        self.assertGreater(sent_to_first, 2)
+        self.assertEqual(len(self.actions(1)), sent_to_first)
+        self.assertEqual(set(self.actions(2)), {"upload_photo"})
+        self.assertGreater(len(self.actions(2)), sent_to_first)
+
+    def test_one_timer_for_all_chats(self):
+        """Test that many waiting chats share a single scheduled timer"""
+        with patch.object(
+            self.loop_thread.loop, "call_later", wraps=self.loop_thread.loop.call_later
+        ) as call_later:
+            for chat_id in range(50):
+                self.keepalive.start(chat_id)
+            self.sync()
+
+            self.assertEqual(call_later.call_count, 1)
+            self.assertEqual(self.bot.send_chat_action.await_count, 50)
+
+        for chat_id in range(50):
+            self.keepalive.stop(chat_id)
+        time.sleep(0.15)
+        self.assertIsNone(self.keepalive._handle)
+
+    def test_repeated_start_does_not_resend(self):
+        """Test that a chat with several queued requests is shown once per refresh"""
+        self.keepalive.interval = 60
+        for _ in range(5):
+            self.keepalive.start(1)
+        self.sync()
+
+        self.assertEqual(len(self.actions(1)), 1)
+
+    def test_actions_expire(self):
+        """Test that an unanswered chat stops showing the action after max_duration"""
+        self.keepalive.max_duration = 0.1
+        self.keepalive.start(1)
+        time.sleep(0.3)
+        self.sync()
+
+        self.assertFalse(self.keepalive.is_active(1))
+
+    def test_rejected_chat_is_dropped(self):
+        """Test that a chat where Telegram refuses the action is not retried"""
+        self.bot.send_chat_action.side_effect = Forbidden("bot was blocked by the user")
+        self.keepalive.start(1)
+        time.sleep(0.2)
+
+        self.assertFalse(self.keepalive.is_active(1))
+        self.assertEqual(len(self.actions(1)), 1)
+
+    def test_none_action_is_ignored(self):
+        """Test that the none choice turns the keepalive off"""
+        self.keepalive.start(1, "none")
+        self.sync()
+
+        self.assertFalse(self.keepalive.is_active(1))
+        self.bot.send_chat_action.assert_not_called()
+
+
+class TestChatActionNodes(unittest.TestCase):
+    """Test cases for starting chat actions on requests and ending them on replies"""
+
+    def setUp(self):
+        """Put a runtime with a mock keepalive in a hub"""
+        self.token = "bot123456:ABC"
+        self.hub = RuntimeHub()
+        self.runtime = BotRuntime(self.token, Mock(), None)
+        self.runtime.is_running = True
+        self.runtime.chat_actions = Mock()
+        self.hub.runtimes[self.token] = self.runtime
+        patches = [
+            patch("telegram_nodes.get_hub", return_value=self.hub),
+            patch("telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)),
+            patch("telegram_nodes._delivery_tracker", DeliveryTracker()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_queued_message_starts_action(self):
+        """Test that the bot shows its action as soon as a request is queued"""
+        listener = TelegramListener()
+        listener.chat_action = "upload_photo"
+        update = Mock()
+        update.message.text = "a cat"
+        update.message.chat_id = 12345
+        update.message.from_user.id = 67890
+        context = Mock()
+        context.bot.token = self.token
+
+        asyncio.run(listener._handle_message(update, context))
+
+        self.runtime.chat_actions.start.assert_called_once_with(12345, "upload_photo")
+        self.assertEqual(self.runtime.message_queue.qsize(), 1)
+
+    def test_reply_stops_action(self):
+        """Test that delivering a reply ends the chat's action"""
+        sender = SaveToTelegram()
+        sender._send_text = Mock(return_value=1)
+
+        sender.send_message(self.token, "12345", "here is a cat")
+
+        self.runtime.chat_actions.stop.assert_called_once_with(12345)
+
+    def test_action_kept_while_chat_has_queued_requests(self):
+        """Test that a chat with more queued requests keeps showing the action"""
+        self.runtime.message_queue.put({"text": "a dog", "chat_id": 12345})
+        sender = SaveToTelegram()
+        sender._send_text = Mock(return_value=1)
+
+        sender.send_message(self.token, "12345", "here is a cat")
+
+        self.runtime.chat_actions.stop.assert_not_called()
+
+    def test_failed_reply_stops_action(self):
+        """Test that the action ends when the reply cannot be sent"""
+        sender = SaveToTelegram()
+        sender._send_text = Mock(side_effect=ValueError("Bad Request: chat not found"))
+
+        result = sender.send_message(self.token, "12345", "here is a cat")
+
+        self.assertIn("Error sending message", result[0])
+        self.runtime.chat_actions.stop.assert_called_once_with(12345)
+
+    def test_cancel_stops_action(self):
+        """Test that cancelling a chat's queued requests ends its action"""
+        self.runtime.message_queue.put({"text": "a dog", "chat_id": 12345})
+        self.runtime.message_queue.put({"text": "a cow", "chat_id": 1})
+
+        self.assertEqual(self.runtime.cancel(12345), 1)
+        self.assertEqual(self.runtime.cancel(12345), 0)
+
+        self.runtime.chat_actions.stop.assert_called_once_with(12345)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import sys
+import os
+import asyncio
+import time
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_cache import ResultCache
+from telegram_commands import CommandRegistry, get_commands, format_duration
+from telegram_outbox import Outbox, SendStep
+from telegram_runtime import BotRuntime
+
+
+def make_update(text, chat_id=1):
+    """Create an update carrying a command message"""
+    update = Mock()
+    update.message.text = text
+    update.message.chat_id = chat_id
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+class TestCommands(unittest.TestCase):
+    """Test cases for commands answered on the bot loop"""
+
+    def setUp(self):
+        """Create a runtime with a few queued messages"""
+        self.runtime = BotRuntime("token", Mock(), None)
+        self.runtime.is_running = True
+        self.runtime.started_at = time.time() - 125
+        for chat_id in (2, 1, 2):
+            self.runtime.message_queue.put({"text": "prompt", "chat_id": chat_id})
+        self.cache = ResultCache()
+        self.outbox = Outbox()
+        patches = [
+            patch("telegram_commands.get_outbox", return_value=self.outbox),
+            patch("telegram_commands.get_result_cache", return_value=self.cache),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def run_command(self, text, chat_id=1):
+        """Dispatch a command and return the reply text"""
+        update = make_update(text, chat_id)
+        asyncio.run(get_commands().dispatch(self.runtime, update, None))
+        update.message.reply_text.assert_awaited_once()
+        return update.message.reply_text.await_args[0][0]
+
+    def test_queue_position(self):
+        """Test that /queue reports the chat's place in the queue"""
+        self.assertIn("number 2 of 3", self.run_command("/queue"))
+        self.assertIn("no requests waiting", self.run_command("/queue", chat_id=9))
+
+    def test_cancel_removes_waiting_requests(self):
+        """Test that /cancel removes only the chat's queued messages"""
+        inbound = Mock()
+        self.runtime.message_queue.put({"text": "", "chat_id": 2, "images": [inbound]})
+
+        self.assertIn(
+            "Cancelled 3 waiting requests", self.run_command("/cancel", chat_id=2)
+        )
+
+        self.assertEqual([m["chat_id"] for m in self.runtime.message_queue.queue], [1])
+        inbound.close.assert_called_once()
+
+    def test_status(self):
+        """Test that /status reports the connection and queue depth"""
+        reply = self.run_command("/status@my_bot")
+
+        self.assertIn("Connected for 2m", reply)
+        self.assertIn("Requests waiting: 3", reply)
+        self.assertNotIn("cache", reply)
+
+    def test_status_reports_cache_hits(self):
+        """Test that /status reports the result cache's hit rate once it was used"""
+        self.cache.put("a cat", {"text": "a cat"}, ttl=60)
+        self.cache.get("a cat")
+        self.cache.get("a dog")
+
+        self.assertIn("Answered from cache: 1 (50%)", self.run_command("/status"))
+
+    def test_status_counts_own_retries(self):
+        """Test that /status only counts the replies this bot has waiting"""
+        self.outbox.defer("token", 1, [SendStep("send_message", {"text": "a"})])
+        self.outbox.defer("other", 1, [SendStep("send_message", {"text": "b"})])
+
+        self.assertIn("Replies waiting to be resent: 1", self.run_command("/status"))
+
+    def test_help_and_unknown_commands(self):
+        """Test that /help lists described commands and unknown commands point to it"""
+        reply = self.run_command("/help")
+        self.assertIn("/cancel", reply)
+        self.assertNotIn("/start", reply)
+        self.assertIn("Unknown command /foo", self.run_command("/foo"))
+
+    def test_custom_command_and_failures(self):
+        """Test registering a command and that handler errors get a short reply"""
+        registry = CommandRegistry()
+
+        @registry.command("ping", "Check the bot")
+        async def ping(runtime, message, args):
+            return " ".join(["pong"] + args)
+
+        @registry.command("broken")
+        async def broken(runtime, message, args):
+            raise RuntimeError("boom")
+
+        update = make_update("/ping a b")
+        asyncio.run(registry.handler_for(self.runtime)(update, None))
+        update.message.reply_text.assert_awaited_once_with("pong a b")
+
+        update = make_update("/broken")
+        asyncio.run(registry.dispatch(self.runtime, update, None))
+        update.message.reply_text.assert_awaited_once_with("Sorry, /broken failed.")
+
+    def test_format_duration(self):
+        """Test compact duration formatting"""
+        self.assertEqual(format_duration(40), "40s")
+        self.assertEqual(format_duration(125), "2m")
+        self.assertEqual(format_duration(7500), "2h 5m")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_context import ConversationStore, MAX_TURN_CHARS
+from telegram_nodes import (
+    TelegramListener,
+    SaveToTelegram,
+    ChatRateLimiter,
+    DeliveryTracker,
+)
+
+
+class TestConversationStore(unittest.TestCase):
+    """Test cases for the bounded per-chat conversation history"""
+
+    def test_ring_buffer_keeps_recent_turns(self):
+        """Test that only the last turns of a chat are kept, in order"""
+        store = ConversationStore(turns=3)
+        for index in range(5):
+            store.add("token", 1, "user", f"prompt {index}")
+        store.add("token", 1, "assistant", "reply")
+
+        self.assertEqual(
+            store.context("token", 1),
+            "User: prompt 3\nUser: prompt 4\nAssistant: reply",
+        )
+        self.assertEqual(store.chars, len("prompt 3prompt 4reply"))
+        self.assertEqual(store.context("token", 2), "")
+
+    def test_long_turns_are_truncated(self):
+        """Test that a single turn cannot take unbounded memory"""
+        store = ConversationStore()
+        store.add("token", 1, "user", "x" * (MAX_TURN_CHARS * 2))
+
+        self.assertEqual(store.chars, MAX_TURN_CHARS)
+
+    def test_idle_chats_are_evicted_first(self):
+        """Test LRU eviction by chat count and by total size"""
+        store = ConversationStore(max_chats=2)
+        store.add("token", 1, "user", "a")
+        store.add("token", 2, "user", "b")
+        store.context("token", 1)
+        store.add("token", 3, "user", "c")
+
+        self.assertEqual(store.context("token", 2), "")
+        self.assertEqual(store.context("token", 1), "User: a")
+        self.assertEqual(store.evictions, 1)
+
+        store = ConversationStore(max_chars=10)
+        store.add("token", 1, "user", "a" * 6)
+        store.add("token", 2, "user", "b" * 6)
+        self.assertEqual(store.context("token", 1), "")
+        self.assertEqual(store.chars, 6)
+
+    def test_evicted_chats_are_restored_from_spill(self):
+        """Test that evicted chats are written to the spill file and read back"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = ConversationStore(
+                max_chats=1, spill_path=os.path.join(directory, "context.db")
+            )
+            store.add("token", 1, "user", "a")
+            store.add("token", 1, "assistant", "b")
+            store.add("token", 2, "user", "c")
+
+            self.assertEqual(store.context("token", 1), "User: a\nAssistant: b")
+            self.assertEqual(store.context("token", 2), "User: c")
+
+            store.clear("token", 1)
+            self.assertEqual(store.context("token", 1), "")
+            store._spill.close()
+
+
+class TestListenerContext(unittest.TestCase):
+    """Test cases for the listener's context output"""
+
+    def setUp(self):
+        self.store = ConversationStore()
+        self.valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        patches = [
+            patch("telegram_nodes.get_conversation_store", return_value=self.store),
+            patch("telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)),
+            patch("telegram_nodes._delivery_tracker", DeliveryTracker()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_context_holds_earlier_turns(self):
+        """Test that the context output holds the turns before the current message"""
+        listener = TelegramListener()
+        listener.is_running = True
+        listener.bot_token = self.valid_token
+        sender = SaveToTelegram()
+        sender._send_text = Mock(return_value=1)
+
+        listener.message_queue.put({"text": "a cat", "chat_id": 1, "update_id": 1})
+        first = listener.listen_for_message(self.valid_token, 5)
+        sender.send_message(self.valid_token, "1", "here is a cat")
+        listener.message_queue.put(
+            {"text": "make it orange", "chat_id": 1, "update_id": 2}
+        )
+        second = listener.listen_for_message(self.valid_token, 5)
+
+        self.assertEqual(first[3], "")
+        self.assertEqual(second[3], "User: a cat\nAssistant: here is a cat")
+
+
+if __name__ == "__main__":
+    unittest.main()
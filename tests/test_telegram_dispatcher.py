@@ -0,0 +1,193 @@
+import unittest
+import sys
+import os
+import multiprocessing
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_context import ConversationStore
+from telegram_dispatcher import FileQueue
+from telegram_nodes import TelegramListener, SaveToTelegram
+import telegram_nodes
+
+
+def drain_queue(path, worker, results):
+    """Worker process: claim and acknowledge messages until the queue is empty"""
+    file_queue = FileQueue(path)
+    while True:
+        claimed = file_queue.claim(worker)
+        if claimed is None:
+            break
+        message_id, message = claimed
+        time.sleep(0.005)  # simulate work
+        if file_queue.ack(message_id, worker):
+            results.put((worker, message["n"]))
+    file_queue.close()
+
+
+class TestFileQueue(unittest.TestCase):
+    """Test cases for the dispatcher's file-backed queue"""
+    
+    def setUp(self):
+        """Create a queue in a temporary directory"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.db")
+        self.queue = FileQueue(self.path)
+    
+    def tearDown(self):
+        """Close and remove the queue"""
+        self.queue.close()
+        self.directory.cleanup()
+    
+    def test_claim_in_order_and_ack(self):
+        """Test that messages are claimed oldest first and removed on ack"""
+        self.queue.put({"text": "first"})
+        self.queue.put({"text": "second"})
+        
+        first_id, first = self.queue.claim("worker-a")
+        second_id, second = self.queue.claim("worker-b")
+        
+        self.assertEqual((first["text"], second["text"]), ("first", "second"))
+        self.assertIsNone(self.queue.claim("worker-c"))
+        self.assertFalse(self.queue.ack(first_id, "worker-b"))
+        self.assertTrue(self.queue.ack(first_id, "worker-a"))
+        self.assertEqual(self.queue.stats(), {"pending": 0, "claimed": 1})
+    
+    def test_expired_lease_is_taken_over(self):
+        """Test that a stalled worker's message is taken over by another"""
+        self.queue.put({"text": "hello"})
+        message_id, _ = self.queue.claim("stalled", lease=0.05)
+        
+        self.assertIsNone(self.queue.claim("idle"))
+        time.sleep(0.1)
+        
+        claimed = self.queue.claim("idle")
+        self.assertEqual(claimed[0], message_id)
+        self.assertFalse(self.queue.ack(message_id, "stalled"))
+        self.assertTrue(self.queue.ack(message_id, "idle"))
+    
+    def test_release_redelivers(self):
+        """Test that a released message can be claimed again right away"""
+        self.queue.put({"text": "hello"})
+        message_id, _ = self.queue.claim("worker-a")
+        
+        self.assertTrue(self.queue.release(message_id, "worker-a"))
+        self.assertEqual(self.queue.claim("worker-b")[0], message_id)
+    
+    def test_dead_letter_after_max_attempts(self):
+        """Test that a message failing repeatedly is eventually dropped"""
+        file_queue = FileQueue(self.path, lease=0.01, max_attempts=2)
+        file_queue.put({"text": "poison"})
+        
+        self.assertIsNotNone(file_queue.claim("worker"))
+        time.sleep(0.02)
+        self.assertIsNotNone(file_queue.claim("worker"))
+        time.sleep(0.02)
+        self.assertIsNone(file_queue.claim("worker"))
+        file_queue.close()
+    
+    def test_workers_in_separate_processes(self):
+        """Test that several worker processes share the queue without duplicates"""
+        for n in range(60):
+            self.queue.put({"n": n})
+        
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=drain_queue, args=(self.path, f"worker-{i}", results)
+            )
+            for i in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        handled = [results.get(timeout=30) for _ in range(60)]
+        for worker in workers:
+            worker.join(30)
+        
+        self.assertEqual(sorted(n for _, n in handled), list(range(60)))
+        self.assertGreater(len({worker for worker, _ in handled}), 1)
+        self.assertEqual(self.queue.stats(), {"pending": 0, "claimed": 0})
+
+
+class TestRemoteListener(unittest.TestCase):
+    """Test cases for the listener's remote queue mode"""
+    
+    def setUp(self):
+        """Create a dispatcher queue with one message"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.db")
+        self.queue = FileQueue(self.path)
+        self.valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        patcher = patch(
+            "telegram_nodes.get_conversation_store", return_value=ConversationStore()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        """Close and remove the queue"""
+        self.queue.close()
+        self.directory.cleanup()
+        telegram_nodes._remote_claims.clear()
+    
+    def test_listen_from_remote_queue(self):
+        """Test that the listener claims dispatcher messages without polling Telegram"""
+        self.queue.put({"text": "remote hello", "chat_id": 12345, "update_id": 1})
+        listener = TelegramListener()
+        
+        with patch.object(listener, "_start_bot") as mock_start:
+            result = listener.listen_for_message(
+                self.valid_token, 5, remote_queue=self.path
+            )
+        
+        self.assertEqual(result, ("remote hello", "12345", None, "", ""))
+        mock_start.assert_not_called()
+        self.assertEqual(self.queue.stats(), {"pending": 0, "claimed": 1})
+    
+    def test_remote_timeout(self):
+        """Test that an empty dispatcher queue times out"""
+        listener = TelegramListener()
+        
+        result = listener.listen_for_message(
+            self.valid_token, 1, remote_queue=self.path
+        )
+        
+        self.assertEqual(
+            result, ("No message received within timeout", "", None, "", "")
+        )
+    
+    def test_delivery_acknowledges_message(self):
+        """Test that answering the chat acknowledges the dispatcher message"""
+        self.queue.put({"text": "remote hello", "chat_id": 12345, "update_id": 1})
+        listener = TelegramListener()
+        sender = SaveToTelegram()
+        listener.listen_for_message(self.valid_token, 5, remote_queue=self.path)
+        
+        with patch.object(sender, "_send_text", return_value=1):
+            sender.send_message(self.valid_token, "12345", "reply")
+        
+        self.assertEqual(self.queue.stats(), {"pending": 0, "claimed": 0})
+    
+    def test_next_claim_acknowledges_previous(self):
+        """Test that claiming the next message acknowledges the previous one"""
+        self.queue.put({"text": "first", "chat_id": 1, "update_id": 1})
+        self.queue.put({"text": "second", "chat_id": 2, "update_id": 2})
+        listener = TelegramListener()
+        
+        listener.listen_for_message(self.valid_token, 5, remote_queue=self.path)
+        listener.listen_for_message(self.valid_token, 5, remote_queue=self.path)
+        
+        self.assertEqual(self.queue.stats(), {"pending": 0, "claimed": 1})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
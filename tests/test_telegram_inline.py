@@ -0,0 +1,161 @@
+import unittest
+import sys
+import os
+import asyncio
+import time
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_cache import ResultCache, result_cache_key
+from telegram_quota import UsageLedger
+from telegram_nodes import TelegramListener, SaveToTelegram, DeliveryTracker
+from telegram_nodes import inline_result
+
+
+def create_inline_update(query, user_id=67890, update_id=1):
+    """Create a mock inline query update"""
+    update = Mock()
+    update.update_id = update_id
+    update.inline_query.query = query
+    update.inline_query.from_user.id = user_id
+    update.inline_query.from_user.username = "testuser"
+    update.inline_query.answer = AsyncMock()
+    return update
+
+
+class TestInlineQueries(unittest.TestCase):
+    """Test cases for inline queries answered from the result cache"""
+
+    def setUp(self):
+        """Set up a caching listener with a short settle time"""
+        self.listener = TelegramListener()
+        self.listener.cache_ttl = 600
+        self.listener.workflow_fingerprint = "wf"
+        self.cache = ResultCache()
+        patches = [
+            patch("telegram_nodes.get_result_cache", return_value=self.cache),
+            patch("telegram_nodes.get_usage_ledger", return_value=UsageLedger()),
+            patch("telegram_nodes.INLINE_SETTLE", 0.05),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def handle(self, *updates, settle=0.1):
+        """Handle inline queries in order on one loop, then let them settle"""
+
+        async def run():
+            for update in updates:
+                await self.listener._handle_inline_query(update, Mock())
+            await asyncio.sleep(settle)
+
+        asyncio.run(run())
+
+    def queued(self):
+        return [message["text"] for message in self.listener.message_queue.queue]
+
+    def test_cached_result_served_without_generation(self):
+        """Test that a cached result is answered at once with Telegram's cache_time"""
+        key = result_cache_key("a cat", "wf")
+        self.cache.put(
+            key,
+            {"text": "a cat", "media_type": "photo", "file_id": "photo-id"},
+            ttl=600,
+        )
+        update = create_inline_update("A  cat")
+
+        with patch("telegram_nodes.InlineQueryResultCachedPhoto") as cached_photo:
+            started = time.perf_counter()
+            self.handle(update, settle=0)
+            elapsed = time.perf_counter() - started
+
+        cached_photo.assert_called_once_with(key, "photo-id", caption="a cat")
+        update.inline_query.answer.assert_awaited_once_with(
+            [cached_photo.return_value], cache_time=600
+        )
+        self.assertEqual(self.queued(), [])
+        self.assertLess(elapsed, 1.0)
+
+    def test_uncached_prompt_queued_for_private_chat(self):
+        """Test that a miss is queued for generation in the user's chat"""
+        update = create_inline_update("a dog", update_id=7)
+
+        self.handle(update)
+
+        self.assertEqual(update.inline_query.answer.await_args.kwargs["cache_time"], 0)
+        message_data = self.listener.message_queue.queue[0]
+        self.assertEqual(message_data["chat_id"], 67890)
+        self.assertEqual(message_data["update_id"], 7)
+        self.assertEqual(message_data["cache_key"], result_cache_key("a dog", "wf"))
+
+    def test_only_settled_query_is_generated(self):
+        """Test that the queries sent while the user types are not generated"""
+        self.handle(
+            create_inline_update("a"),
+            create_inline_update("a d"),
+            create_inline_update("a dog"),
+            create_inline_update("a cow", user_id=1),
+        )
+
+        self.assertEqual(sorted(self.queued()), ["a cow", "a dog"])
+        self.assertEqual(self.listener.inline_queries, {})
+
+    def test_repeated_miss_generated_once(self):
+        """Test that a prompt queued or being generated is not queued again"""
+        self.handle(create_inline_update("a dog"))
+        self.handle(create_inline_update("a dog", user_id=1))
+        self.assertEqual(self.queued(), ["a dog"])
+
+        self.listener.message_queue.get()
+        self.cache.expect("token", 67890, result_cache_key("a dog", "wf"), 600)
+        self.handle(create_inline_update("a dog"))
+        self.assertEqual(self.queued(), [])
+
+    def test_failed_generation_can_be_retried(self):
+        """Test that a prompt whose reply failed is generated again when asked"""
+        token = "bot123456:ABC"
+        self.handle(create_inline_update("a dog"))
+        with patch.object(self.listener, "_start_bot"):
+            self.listener.is_running = True
+            self.listener.bot_token = token
+            self.listener.listen_for_message(token, 5, cache_ttl=600)
+        self.assertTrue(self.cache.is_expected(result_cache_key("a dog", "wf")))
+        sender = SaveToTelegram()
+
+        with patch.object(sender, "_deliver", side_effect=RuntimeError("Forbidden")):
+            with patch("telegram_nodes._delivery_tracker", DeliveryTracker()):
+                sender.send_message(token, "67890", "a dog")
+        self.handle(create_inline_update("a dog"))
+
+        self.assertEqual(self.queued(), ["a dog"])
+
+    def test_inline_needs_cache(self):
+        """Test that without a cache_ttl inline queries get an empty answer"""
+        self.listener.cache_ttl = 0
+        update = create_inline_update("a dog")
+
+        self.handle(update)
+
+        update.inline_query.answer.assert_awaited_once_with([], cache_time=0)
+        self.assertEqual(self.queued(), [])
+
+    def test_text_result(self):
+        """Test that a cached text reply becomes an article result"""
+        with patch("telegram_nodes.InlineQueryResultArticle") as article:
+            with patch("telegram_nodes.InputTextMessageContent") as content:
+                inline_result("id", "a poem", {"text": "roses are red"})
+
+        content.assert_called_once_with("roses are red")
+        article.assert_called_once_with(
+            "id", "a poem", content.return_value, description="roses are red"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,550 @@
+import unittest
+import sys
+import os
+import asyncio
+import io
+import tempfile
+import threading
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_media import (
+    InboundFile,
+    download_to_spool,
+    plan_video_encoding,
+    encode_video,
+)
+from telegram_media import UploadBandwidth, photo_fits, downscale_array, encode_photo
+from telegram_media import image_digest
+
+try:
+    import numpy
+    from PIL import Image
+
+    HAS_IMAGING = True
+except ImportError:
+    HAS_IMAGING = False
+from telegram_nodes import (
+    TelegramListener,
+    SaveToTelegram,
+    ChatRateLimiter,
+    _output_is_used,
+    _message_attachment,
+)
+
+
+class TestInboundDownloads(unittest.TestCase):
+    """Test cases for background downloads of inbound files"""
+    
+    def setUp(self):
+        """Run a bot-like event loop in a background thread"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, "wb") as f:
+            f.write(b"image-bytes" * 1000)
+        self.bot = Mock()
+        self.bot.get_file = AsyncMock(return_value=Mock(file_path=self.path))
+    
+    def tearDown(self):
+        """Stop the loop and remove the temporary file"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(2)
+        self.loop.close()
+        os.remove(self.path)
+    
+    def test_download_to_spool(self):
+        """Test that a file is copied into a spooled temporary file"""
+        spool = asyncio.run(download_to_spool(self.bot, "file-id", max_memory=1024))
+        
+        self.assertEqual(spool.read(), b"image-bytes" * 1000)
+        self.bot.get_file.assert_awaited_once_with("file-id")
+        spool.close()
+    
+    def test_inbound_file_downloads_in_background(self):
+        """Test that an inbound file is available once its download finishes"""
+        inbound = InboundFile.start(self.bot, self.loop, "file-id", "image/png")
+        
+        self.assertEqual(inbound.open(timeout=5).read(), b"image-bytes" * 1000)
+        self.assertEqual(inbound.mime_type, "image/png")
+        inbound.close()
+    
+    def test_decode_image_waits_for_download(self):
+        """Test that decoding reads the downloaded data"""
+        inbound = InboundFile.start(self.bot, self.loop, "file-id")
+        
+        with patch(
+            "telegram_media.decode_image", side_effect=lambda f: f.read()
+        ) as mock_decode:
+            self.assertEqual(inbound.decode_image(timeout=5), b"image-bytes" * 1000)
+        mock_decode.assert_called_once()
+
+
+class TestListenerImages(unittest.TestCase):
+    """Test cases for photo and document messages on the listener"""
+    
+    def create_update(
+        self, photo=None, document=None, caption="a caption", media_group_id=None
+    ):
+        """Create a mock photo or document update"""
+        update = Mock()
+        update.update_id = 7
+        update.message.text = None
+        update.message.caption = caption
+        update.message.photo = photo
+        update.message.document = document
+        update.message.media_group_id = media_group_id
+        update.message.chat_id = 12345
+        update.message.from_user.id = 67890
+        update.message.from_user.username = "testuser"
+        return update
+    
+    def test_message_attachment(self):
+        """Test that the largest photo size and image documents are picked"""
+        small, large = Mock(file_id="small"), Mock(file_id="large")
+        message = Mock(photo=[small, large])
+        self.assertEqual(_message_attachment(message), ("large", "image/jpeg"))
+        
+        message = Mock(photo=[], document=Mock(file_id="doc", mime_type="image/png"))
+        self.assertEqual(_message_attachment(message), ("doc", "image/png"))
+        
+        message = Mock(
+            photo=[], document=Mock(file_id="doc", mime_type="application/pdf")
+        )
+        self.assertIsNone(_message_attachment(message))
+    
+    def test_output_is_used(self):
+        """Test detection of links to a node output"""
+        prompt = {
+            "1": {"inputs": {"bot_token": "x"}},
+            "2": {"inputs": {"image": ["1", 2], "text": ["1", 0]}},
+        }
+        self.assertTrue(_output_is_used(prompt, "1", 2))
+        self.assertFalse(_output_is_used(prompt, "1", 1))
+        self.assertFalse(_output_is_used(None, "1", 2))
+    
+    def test_photo_message_is_queued_with_image(self):
+        """Test that photo messages are queued with a background download"""
+        listener = TelegramListener()
+        update = self.create_update(photo=[Mock(file_id="large")])
+        
+        with patch("telegram_nodes.InboundFile") as mock_inbound:
+            asyncio.run(listener._handle_message(update, Mock()))
+        
+        message_data = listener.message_queue.get_nowait()
+        self.assertEqual(message_data["text"], "a caption")
+        self.assertEqual(message_data["images"], [mock_inbound.start.return_value])
+        self.assertEqual(mock_inbound.start.call_args[0][2:], ("large", "image/jpeg"))
+    
+    def test_other_documents_are_ignored(self):
+        """Test that non-image documents without text are not queued"""
+        listener = TelegramListener()
+        update = self.create_update(
+            document=Mock(mime_type="application/pdf"), caption=None
+        )
+        
+        asyncio.run(listener._handle_message(update, Mock()))
+        
+        self.assertTrue(listener.message_queue.empty())
+    
+    def test_image_decoded_only_when_used(self):
+        """Test that the image output is decoded only when it is linked"""
+        listener = TelegramListener()
+        valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        inbound = Mock()
+        used = {"5": {"inputs": {"pixels": ["1", 2]}}}
+        
+        with patch.object(listener, "_start_bot"):
+            listener.message_queue.put({"text": "", "chat_id": 1, "images": [inbound]})
+            result = listener.listen_for_message(
+                valid_token, 5, prompt={}, unique_id="1"
+            )
+            self.assertIsNone(result[2])
+            inbound.close.assert_called_once()
+            inbound.decode_image.assert_not_called()
+            
+            listener.message_queue.put({"text": "", "chat_id": 1, "images": [inbound]})
+            with patch(
+                "telegram_nodes.stack_images", side_effect=lambda images: images
+            ):
+                result = listener.listen_for_message(
+                    valid_token, 5, prompt=used, unique_id="1"
+                )
+            self.assertEqual(result[2], [inbound.decode_image.return_value])
+    
+    def test_album_is_queued_as_one_message(self):
+        """Test that photos sharing a media_group_id are delivered together"""
+        listener = TelegramListener()
+        listener.album_window = 0.1
+        updates = [
+            self.create_update(
+                photo=[Mock(file_id="first")], caption=None, media_group_id="album"
+            ),
+            self.create_update(
+                photo=[Mock(file_id="second")],
+                caption="album caption",
+                media_group_id="album",
+            ),
+            self.create_update(
+                photo=[Mock(file_id="third")], caption=None, media_group_id="album"
+            ),
+        ]
+        
+        async def receive():
+            for update in updates:
+                await listener._handle_message(update, Mock())
+                await asyncio.sleep(0.02)
+            self.assertTrue(listener.message_queue.empty())
+            await asyncio.sleep(0.2)
+        
+        with patch("telegram_nodes.InboundFile") as mock_inbound:
+            mock_inbound.start.side_effect = (
+                lambda bot, loop, file_id, mime_type: file_id
+            )
+            asyncio.run(receive())
+        
+        self.assertEqual(listener.message_queue.qsize(), 1)
+        album = listener.message_queue.get_nowait()
+        self.assertEqual(album["images"], ["first", "second", "third"])
+        self.assertEqual(album["text"], "album caption")
+        self.assertEqual(listener.albums, {})
+    
+    def test_album_window_zero_disables_grouping(self):
+        """Test that album photos are delivered separately without a window"""
+        listener = TelegramListener()
+        listener.album_window = 0
+        update = self.create_update(
+            photo=[Mock(file_id="first")], media_group_id="album"
+        )
+        
+        with patch("telegram_nodes.InboundFile"):
+            asyncio.run(listener._handle_message(update, Mock()))
+        
+        self.assertEqual(listener.message_queue.qsize(), 1)
+
+
+class FakeFrames:
+    """A stand-in for an IMAGE batch that only exposes its shape and frames"""
+    
+    def __init__(self, count, height, width):
+        self.shape = (count, height, width, 3)
+        pixels = b"\x00" * (height * width * 3)
+        self.frames = [Mock(**{"cpu.return_value.numpy.return_value": pixels})] * count
+    
+    def __iter__(self):
+        return iter(self.frames)
+
+
+class TestVideoEncoding(unittest.TestCase):
+    """Test cases for size-bounded video encoding"""
+    
+    def test_plan_keeps_resolution_for_short_clips(self):
+        """Test that short clips keep their resolution and even dimensions"""
+        width, height, bitrate = plan_video_encoding(513, 511, 16, 8)
+        
+        self.assertEqual((width, height), (512, 510))
+        self.assertEqual(bitrate, 8_000_000)
+    
+    def test_plan_reduces_bitrate_and_resolution_for_long_clips(self):
+        """Test that long clips fit the size budget by lowering quality"""
+        width, height, bitrate = plan_video_encoding(1920, 1080, 24 * 600, 24)
+        
+        self.assertLessEqual(bitrate * 600 / 8, 50 * 1024 * 1024)
+        self.assertLess(width, 1920)
+        self.assertLess(height, 1080)
+        self.assertAlmostEqual(width / height, 1920 / 1080, places=1)
+    
+    def test_plan_retries_lower_bitrate(self):
+        """Test that each retry attempt lowers the bitrate"""
+        first = plan_video_encoding(512, 512, 16, 8, attempt=0)[2]
+        second = plan_video_encoding(512, 512, 16, 8, attempt=1)[2]
+        self.assertLess(second, first)
+    
+    def fake_ffmpeg(self, output_size, returncode=0):
+        """Create a Popen replacement that records frames and writes an output file"""
+        written = []
+        
+        def popen(command, stdin, stderr):
+            process = Mock()
+            process.stdin.write.side_effect = written.append
+            process.stderr.read.return_value = b"boom"
+            with open(command[-1], "wb") as f:
+                f.write(b"\x00" * output_size)
+            process.wait.return_value = returncode
+            return process
+        
+        return popen, written
+    
+    @patch("telegram_media.find_ffmpeg", return_value="ffmpeg")
+    @patch("telegram_media.frame_to_bytes", side_effect=lambda frame: frame)
+    def test_encode_video_streams_frames(self, mock_to_bytes, mock_find):
+        """Test that frames are piped to ffmpeg one at a time"""
+        popen, written = self.fake_ffmpeg(100)
+        
+        with patch("telegram_media.subprocess.Popen", side_effect=popen):
+            path = encode_video(FakeFrames(4, 8, 8), 8)
+        
+        self.assertEqual(len(written), 4)
+        self.assertTrue(path.endswith(".mp4"))
+        os.remove(path)
+    
+    @patch("telegram_media.find_ffmpeg", return_value="ffmpeg")
+    @patch("telegram_media.frame_to_bytes", side_effect=lambda frame: frame)
+    def test_encode_video_gives_up_when_too_large(self, mock_to_bytes, mock_find):
+        """Test that encoding is retried and fails if the output stays too large"""
+        popen, written = self.fake_ffmpeg(200)
+        
+        with patch("telegram_media.subprocess.Popen", side_effect=popen) as mock_popen:
+            with self.assertRaises(RuntimeError):
+                encode_video(FakeFrames(2, 8, 8), 8, max_bytes=100)
+        
+        self.assertEqual(mock_popen.call_count, 3)
+    
+    @patch("telegram_media.find_ffmpeg", return_value="ffmpeg")
+    @patch("telegram_media.frame_to_bytes", side_effect=lambda frame: frame)
+    def test_encode_video_reports_ffmpeg_errors(self, mock_to_bytes, mock_find):
+        """Test that ffmpeg failures are raised with its error output"""
+        popen, written = self.fake_ffmpeg(100, returncode=1)
+        
+        with patch("telegram_media.subprocess.Popen", side_effect=popen):
+            with self.assertRaisesRegex(RuntimeError, "boom"):
+                encode_video(FakeFrames(2, 8, 8), 8)
+    
+    def test_image_digest_hashes_frame_by_frame(self):
+        """Test that a batch is hashed one frame at a time, never copied whole"""
+        frames = FakeFrames(3, 8, 8)
+        
+        digest = image_digest(frames)
+        
+        self.assertEqual(frames.frames[0].cpu.call_count, 3)
+        self.assertEqual(digest, image_digest(FakeFrames(3, 8, 8)))
+        self.assertNotEqual(digest, image_digest(FakeFrames(2, 8, 8)))
+
+
+class TestSendVideo(unittest.TestCase):
+    """Test cases for sending image batches as video"""
+    
+    def setUp(self):
+        """Set up a sender with a mock bot"""
+        self.sender = SaveToTelegram()
+        self.app = Mock()
+        self.app.bot.send_video = AsyncMock(
+            return_value=Mock(video=Mock(file_id="video-id"))
+        )
+        self.app.bot.send_animation = AsyncMock(
+            return_value=Mock(animation=Mock(file_id="anim-id"))
+        )
+        self.app.bot.send_message = AsyncMock()
+        self.sender.applications["token"] = self.app
+        patcher = patch(
+            "telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def fake_encode(self, images, fps):
+        handle, path = tempfile.mkstemp(suffix=".mp4")
+        os.close(handle)
+        self.encoded_path = path
+        return path
+    
+    def test_send_video(self):
+        """Test that a batch is encoded, uploaded and the file removed"""
+        with patch("telegram_nodes.encode_video", side_effect=self.fake_encode):
+            result = self.sender.send_message(
+                "token",
+                "12345",
+                "caption",
+                images=FakeFrames(2, 8, 8),
+                media_mode="video",
+            )
+        
+        self.assertEqual(result, ("Video sent successfully to chat 12345",))
+        self.assertEqual(
+            self.app.bot.send_video.await_args.kwargs["caption"], "caption"
+        )
+        self.assertFalse(os.path.exists(self.encoded_path))
+    
+    def test_send_animation_with_long_caption(self):
+        """Test that captions over the limit are sent as a separate message"""
+        caption = "x" * 2000
+        with patch("telegram_nodes.encode_video", side_effect=self.fake_encode):
+            result = self.sender.send_message(
+                "token",
+                "12345",
+                caption,
+                images=FakeFrames(2, 8, 8),
+                media_mode="animation",
+            )
+        
+        self.assertEqual(result, ("Animation sent successfully to chat 12345",))
+        self.assertIsNone(self.app.bot.send_animation.await_args.kwargs["caption"])
+        self.app.bot.send_message.assert_awaited()
+    
+    def test_cached_video_reply(self):
+        """Test that cached media is replayed by file_id"""
+        listener = TelegramListener()
+        update = Mock()
+        update.message.reply_video = AsyncMock()
+        
+        asyncio.run(
+            listener._reply_cached(
+                update,
+                {"text": "caption", "media_type": "video", "file_id": "video-id"},
+            )
+        )
+        
+        update.message.reply_video.assert_awaited_once_with(
+            "video-id", caption="caption"
+        )
+
+
+class TestPhotoEncoding(unittest.TestCase):
+    """Test cases for size-aware photo preparation"""
+    
+    def test_bandwidth_budget(self):
+        """Test that the size budget follows the measured upload speed"""
+        bandwidth = UploadBandwidth(bytes_per_second=1_000_000, smoothing=0.5)
+        self.assertEqual(bandwidth.budget(2.0), 2_000_000)
+        
+        bandwidth.record(3_000_000, 1.0)
+        self.assertEqual(bandwidth.bytes_per_second, 2_000_000)
+        self.assertEqual(bandwidth.budget(100.0), 10 * 1024 * 1024)
+        self.assertEqual(bandwidth.budget(0.01), 256 * 1024)
+        
+        bandwidth.record(0, 1.0)
+        self.assertEqual(bandwidth.bytes_per_second, 2_000_000)
+    
+    def test_photo_fits(self):
+        """Test the sendPhoto aspect ratio limit"""
+        self.assertTrue(photo_fits(Mock(shape=(100, 2000, 3))))
+        self.assertFalse(photo_fits(Mock(shape=(100, 2100, 3))))
+    
+    @unittest.skipUnless(HAS_IMAGING, "numpy and Pillow are required")
+    def test_downscale_array(self):
+        """Test that blocks are averaged down to the size limit"""
+        array = numpy.zeros((6, 8, 3), dtype=numpy.uint8)
+        array[:, ::2] = 200
+        
+        result = downscale_array(array, 4)
+        
+        self.assertEqual(result.shape, (3, 4, 3))
+        self.assertTrue((result == 100).all())
+        self.assertIs(downscale_array(array, 8), array)
+    
+    @unittest.skipUnless(HAS_IMAGING, "numpy and Pillow are required")
+    def test_encode_photo_fits_budget(self):
+        """Test that photos are compressed or shrunk to fit the budget"""
+        array = numpy.random.randint(0, 255, (3000, 2000, 3), dtype=numpy.uint8)
+        
+        data = encode_photo(array, 300 * 1024)
+        
+        self.assertLessEqual(len(data), 300 * 1024)
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertLessEqual(max(image.size), 2560)
+
+
+class TestSendPhotos(unittest.TestCase):
+    """Test cases for sending image batches as photos"""
+    
+    def setUp(self):
+        """Set up a sender with a mock bot and stubbed image encoding"""
+        self.sender = SaveToTelegram()
+        self.app = Mock()
+        self.app.bot.send_photo = AsyncMock(
+            return_value=Mock(photo=[Mock(file_id="photo-id")])
+        )
+        self.app.bot.send_media_group = AsyncMock()
+        self.app.bot.send_document = AsyncMock()
+        self.sender.applications["token"] = self.app
+        patchers = [
+            patch("telegram_nodes.image_to_array", side_effect=lambda image: image),
+            patch("telegram_nodes.encode_photo", return_value=b"jpeg"),
+            patch("telegram_nodes.encode_png", return_value=b"png"),
+            patch("telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def create_images(self, *shapes):
+        """Create a batch of stand-in images with the given shapes"""
+        images = Mock()
+        images.shape = (len(shapes),) + shapes[0]
+        frames = [
+            Mock(shape=shape, **{"cpu.return_value.numpy.return_value": b"pixels"})
+            for shape in shapes
+        ]
+        images.__iter__ = lambda self: iter(frames)
+        return images
+    
+    def test_single_photo(self):
+        """Test that one image is sent as a compressed photo"""
+        result = self.sender.send_message(
+            "token", "12345", "caption", images=self.create_images((512, 512, 3))
+        )
+        
+        self.assertEqual(result, ("Photo sent successfully to chat 12345",))
+        self.app.bot.send_photo.assert_awaited_once_with(
+            chat_id=12345, photo=b"jpeg", caption="caption"
+        )
+        self.app.bot.send_document.assert_not_awaited()
+    
+    def test_batch_with_originals(self):
+        """Test that a batch is sent as an album followed by PNG originals"""
+        result = self.sender.send_message(
+            "token",
+            "12345",
+            "album",
+            images=self.create_images((512, 512, 3), (512, 512, 3)),
+            send_original=True,
+        )
+        
+        self.assertEqual(result, ("Photo sent successfully to chat 12345",))
+        self.app.bot.send_media_group.assert_awaited_once()
+        self.assertEqual(
+            len(self.app.bot.send_media_group.await_args.kwargs["media"]), 2
+        )
+        self.assertEqual(self.app.bot.send_document.await_count, 2)
+    
+    def test_previews_sent_before_originals_encoded(self):
+        """Test that the previews do not wait for the PNG originals to be encoded"""
+        previews_sent = []
+        
+        def encode_png(array):
+            previews_sent.append(self.app.bot.send_media_group.await_count)
+            return b"png"
+        
+        with patch("telegram_nodes.encode_png", side_effect=encode_png):
+            self.sender.send_message(
+                "token",
+                "12345",
+                "album",
+                images=self.create_images((512, 512, 3), (512, 512, 3)),
+                send_original=True,
+            )
+        
+        self.assertEqual(previews_sent, [1, 1])
+    
+    def test_elongated_image_sent_as_document(self):
+        """Test that images sendPhoto would reject are sent as documents"""
+        self.sender.send_message(
+            "token", "12345", "panorama", images=self.create_images((100, 4000, 3))
+        )
+        
+        self.app.bot.send_photo.assert_not_awaited()
+        self.app.bot.send_document.assert_awaited_once_with(
+            chat_id=12345, document=b"png", filename="image_1.png", caption="panorama"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -28,6 +28,16 @@ sys.modules['telegram.ext'].filters = mock_filters
 sys.modules['telegram.ext'].ContextTypes = Mock()
 
 from telegram_nodes import TelegramListener, SaveToTelegram
+from telegram_nodes import split_message, ChatRateLimiter, MessageCoalescer
+from telegram_nodes import (
+    ProgressMessage,
+    register_progress_message,
+    pop_progress_message,
+)
+from telegram_nodes import DeliveryTracker, payload_hash
+from telegram_runtime import BotRuntime
+from telegram_context import ConversationStore
+import telegram_nodes
 
 
 class TestTelegramListener(unittest.TestCase):
@@ -36,6 +46,11 @@ class TestTelegramListener(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures before each test method."""
         self.listener = TelegramListener()
+        patcher = patch(
+            "telegram_nodes.get_conversation_store", return_value=ConversationStore()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
     
     def tearDown(self):
         """Clean up after each test method."""
@@ -65,8 +80,14 @@ class TestTelegramListener(unittest.TestCase):
     
     def test_class_attributes(self):
         """Test that class attributes are correctly defined"""
-        self.assertEqual(TelegramListener.RETURN_TYPES, ("STRING", "STRING"))
-        self.assertEqual(TelegramListener.RETURN_NAMES, ("message_text", "chat_id"))
+        self.assertEqual(
+            TelegramListener.RETURN_TYPES,
+            ("STRING", "STRING", "IMAGE", "STRING", "STRING"),
+        )
+        self.assertEqual(
+            TelegramListener.RETURN_NAMES,
+            ("message_text", "chat_id", "image", "context", "user_id"),
+        )
         self.assertEqual(TelegramListener.FUNCTION, "listen_for_message")
         self.assertEqual(TelegramListener.CATEGORY, "telegram")
         self.assertEqual(TelegramListener.OUTPUT_NODE, False)
@@ -83,18 +104,18 @@ class TestTelegramListener(unittest.TestCase):
     def test_listen_for_message_empty_token(self):
         """Test listen_for_message with empty bot token"""
         result = self.listener.listen_for_message("", 10)
-        self.assertEqual(result, ("Error: Bot token is required", ""))
+        self.assertEqual(result, ("Error: Bot token is required", "", None, "", ""))
         
         result = self.listener.listen_for_message("   ", 10)
-        self.assertEqual(result, ("Error: Bot token is required", ""))
+        self.assertEqual(result, ("Error: Bot token is required", "", None, "", ""))
     
     def test_listen_for_message_invalid_token_format(self):
         """Test listen_for_message with invalid token format"""
         result = self.listener.listen_for_message("invalid_token", 10)
-        self.assertEqual(result, ("Error: Invalid bot token format", ""))
+        self.assertEqual(result, ("Error: Invalid bot token format", "", None, "", ""))
         
         result = self.listener.listen_for_message("bot123", 10)
-        self.assertEqual(result, ("Error: Invalid bot token format", ""))
+        self.assertEqual(result, ("Error: Invalid bot token format", "", None, "", ""))
     
     def test_listen_for_message_timeout(self):
         """Test listen_for_message timeout behavior"""
@@ -104,7 +125,9 @@ class TestTelegramListener(unittest.TestCase):
             result = self.listener.listen_for_message(valid_token, 1)  # 1 second timeout
             
             # Should timeout and return no message
-            self.assertEqual(result, ("No message received within timeout", ""))
+            self.assertEqual(
+                result, ("No message received within timeout", "", None, "", "")
+            )
             mock_start.assert_called_once_with(valid_token)
     
     def test_listen_for_message_with_queue_message(self):
@@ -124,30 +147,32 @@ class TestTelegramListener(unittest.TestCase):
         with patch.object(self.listener, '_start_bot'):
             result = self.listener.listen_for_message(valid_token, 10)
             
-            self.assertEqual(result, ("Hello, bot!", "12345"))
+            self.assertEqual(result, ("Hello, bot!", "12345", None, "", "67890"))
             self.assertIn("12345", self.listener.chat_ids)
     
-    @patch('telegram_nodes.asyncio')
-    @patch('telegram_nodes.threading.Thread')
-    def test_start_bot(self, mock_thread, mock_asyncio):
+    @patch("telegram_nodes.get_hub")
+    def test_start_bot(self, mock_get_hub):
         """Test _start_bot method"""
         valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        mock_runtime = mock_get_hub.return_value.acquire.return_value
         
-        # Mock the application builder
-        mock_app_builder = Mock()
-        mock_app = Mock()
-        mock_app_builder.token.return_value = mock_app_builder
-        mock_app_builder.build.return_value = mock_app
+        self.listener._start_bot(valid_token)
         
-        with patch('telegram_nodes.Application.builder', return_value=mock_app_builder):
-            self.listener._start_bot(valid_token)
-            
-            # Verify token was set
-            self.assertEqual(self.listener.bot_token, valid_token)
-            
-            # Verify thread was created and started
-            mock_thread.assert_called_once()
-            mock_thread.return_value.start.assert_called_once()
+        # Verify token was set
+        self.assertEqual(self.listener.bot_token, valid_token)
+        
+        # Verify the bot is polled by the shared runtime, not a thread of its own
+        mock_get_hub.return_value.acquire.assert_called_once_with(
+            valid_token, telegram_nodes._configure_application
+        )
+        self.assertEqual(mock_runtime.handler, self.listener._handle_message)
+        self.assertIs(self.listener.message_queue, mock_runtime.message_queue)
+        self.assertIs(self.listener.application, mock_runtime.application)
+        self.assertTrue(self.listener.is_running)
+        
+        self.listener._stop_bot()
+        mock_get_hub.return_value.release.assert_called_once_with(valid_token)
+        self.assertFalse(self.listener.is_running)
 
 
 class TestSaveToTelegram(unittest.TestCase):
@@ -245,6 +270,326 @@ class TestSaveToTelegram(unittest.TestCase):
             self.assertIn(chat_id, result[0])
 
 
+class TestOutboundText(unittest.TestCase):
+    """Test cases for message splitting, pacing and coalescing"""
+    
+    def test_split_message_short_text(self):
+        """Test that short text is returned as a single part"""
+        self.assertEqual(split_message("Hello"), ["Hello"])
+        self.assertEqual(split_message(""), [])
+    
+    def test_split_message_prefers_boundaries(self):
+        """Test that splitting prefers paragraph and word boundaries"""
+        text = "aaaa bbbb\n\ncccc dddd"
+        self.assertEqual(split_message(text, limit=12), ["aaaa bbbb", "cccc dddd"])
+        self.assertEqual(
+            split_message("aaaa bbbb cccc", limit=10), ["aaaa bbbb", "cccc"]
+        )
+    
+    def test_split_message_hard_cut(self):
+        """Test that text without boundaries is cut at the limit"""
+        parts = split_message("x" * 25, limit=10)
+        self.assertEqual(parts, ["x" * 10, "x" * 10, "x" * 5])
+    
+    def test_split_message_respects_telegram_limit(self):
+        """Test that every part fits Telegram's message length limit"""
+        text = ("word " * 3000).strip()
+        parts = split_message(text)
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(len(part) <= 4096 for part in parts))
+        self.assertEqual(" ".join(parts), text)
+    
+    def test_rate_limiter_spaces_same_chat(self):
+        """Test that consecutive sends to one chat are spaced apart"""
+        limiter = ChatRateLimiter(min_interval=1.0)
+        self.assertEqual(limiter.reserve(1), 0)
+        self.assertAlmostEqual(limiter.reserve(1), 1.0, places=1)
+        self.assertAlmostEqual(limiter.reserve(1), 2.0, places=1)
+        self.assertEqual(limiter.reserve(2), 0)
+    
+    def test_coalescer_merges_within_window(self):
+        """Test that texts within the window are flushed as one message"""
+        coalescer = MessageCoalescer()
+        flushed = []
+        done = threading.Event()
+        
+        def flush(bot_token, chat_id, text):
+            flushed.append((bot_token, chat_id, text))
+            done.set()
+        
+        coalescer.add("token", 1, "first", 0.2, flush)
+        coalescer.add("token", 1, "second", 0.2, flush)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(flushed, [("token", 1, "first\n\nsecond")])
+    
+    def test_send_message_coalesce_window_queues(self):
+        """Test that a coalesce window defers sending"""
+        sender = SaveToTelegram()
+        valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        
+        with patch("telegram_nodes._message_coalescer") as mock_coalescer:
+            result = sender.send_message(
+                valid_token, "12345", "Hello", coalesce_window=0.5
+            )
+        
+        self.assertEqual(result, ("Message queued for chat 12345",))
+        mock_coalescer.add.assert_called_once_with(
+            valid_token, 12345, "Hello", 0.5, sender._send_coalesced
+        )
+
+    def test_coalesced_delivery_recorded_after_sending(self):
+        """Test that a coalesced request is answered only once its text is sent"""
+        sender = SaveToTelegram()
+        valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        reporter = Mock()
+        sender._send_text = Mock(side_effect=RuntimeError("Bad Gateway"))
+        tracker = patch("telegram_nodes._delivery_tracker", DeliveryTracker())
+
+        with tracker, patch("telegram_nodes._request_answered") as answered:
+            with patch("telegram_nodes.get_status_reporter", return_value=reporter):
+                sender.send_message(valid_token, "12345", "Hello", coalesce_window=0.05)
+                answered.assert_not_called()
+                time.sleep(0.3)
+
+        answered.assert_called_once_with(valid_token, 12345)
+        reporter.record_error.assert_called_once()
+        self.assertEqual(reporter.record_error.call_args[0][0], valid_token)
+    
+    def test_send_message_reports_parts(self):
+        """Test that long messages report how many parts were sent"""
+        sender = SaveToTelegram()
+        valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        
+        with patch.object(sender, "_send_text", return_value=3):
+            result = sender.send_message(valid_token, "12345", "x" * 10000)
+        
+        self.assertEqual(
+            result, ("Message sent successfully to chat 12345 in 3 parts",)
+        )
+
+
+class TestProgressMessages(unittest.TestCase):
+    """Test cases for throttled progress status messages"""
+    
+    def setUp(self):
+        """Run a real event loop in a background thread for the edits"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.bot = Mock()
+        self.bot.edit_message_text = AsyncMock()
+    
+    def tearDown(self):
+        """Stop the background loop and forget tracked messages"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(2)
+        self.loop.close()
+        telegram_nodes._progress_messages.clear()
+    
+    def test_update_is_throttled(self):
+        """Test that edits are limited to one per interval"""
+        progress = ProgressMessage(self.bot, self.loop, 1, 10, "Working", 0.2)
+        
+        self.assertFalse(progress.update(1, 20))  # within the first interval
+        time.sleep(0.25)
+        self.assertTrue(progress.update(2, 20))
+        self.assertFalse(progress.update(3, 20))
+        time.sleep(0.1)
+        
+        self.bot.edit_message_text.assert_awaited_once_with(
+            chat_id=1, message_id=10, text="Working 10%"
+        )
+    
+    def test_update_skips_unchanged_text(self):
+        """Test that identical progress text is not re-sent"""
+        progress = ProgressMessage(self.bot, self.loop, 1, 10, "Working", 0)
+        
+        self.assertTrue(progress.update(1, 2))
+        self.assertFalse(progress.update(1, 2))
+    
+    def test_register_replaces_stale_messages(self):
+        """Test that a new request drops status messages of earlier requests"""
+        first = ProgressMessage(self.bot, self.loop, 1, 10, "Working", 1)
+        second = ProgressMessage(self.bot, self.loop, 2, 11, "Working", 1)
+        
+        register_progress_message("token", first)
+        register_progress_message("token", second)
+        
+        self.assertIsNone(pop_progress_message("token", 1))
+        self.assertIs(pop_progress_message("token", 2), second)
+        self.assertIsNone(pop_progress_message("token", 2))
+    
+    def test_comfy_progress_hook_is_chained(self):
+        """Test that the ComfyUI progress hook forwards to status messages"""
+        comfy_module = Mock()
+        comfy_utils = Mock()
+        previous_hook = Mock()
+        comfy_utils.PROGRESS_BAR_HOOK = previous_hook
+        comfy_utils.set_progress_bar_global_hook.side_effect = lambda hook: setattr(
+            comfy_utils, "PROGRESS_BAR_HOOK", hook
+        )
+        comfy_module.utils = comfy_utils
+        progress = Mock()
+        progress.chat_id = 1
+        
+        with patch.dict(
+            sys.modules, {"comfy": comfy_module, "comfy.utils": comfy_utils}
+        ):
+            register_progress_message("token", progress)
+            register_progress_message("token", progress)  # installs only once
+            comfy_utils.PROGRESS_BAR_HOOK(5, 10, None)
+        
+        comfy_utils.set_progress_bar_global_hook.assert_called_once()
+        previous_hook.assert_called_once_with(5, 10, None)
+        progress.update.assert_called_once_with(5, 10)
+    
+    def test_sender_replaces_status_message(self):
+        """Test that the final result edits the status message"""
+        sender = SaveToTelegram()
+        app = Mock()
+        app.bot.edit_message_text = AsyncMock()
+        app.bot.send_message = AsyncMock()
+        sender.applications["token"] = app
+        telegram_nodes._progress_messages[("token", 1)] = ProgressMessage(
+            self.bot, self.loop, 1, 10, "Working", 1
+        )
+        
+        sender._send_text("token", 1, "Done")
+        
+        app.bot.edit_message_text.assert_awaited_once_with(
+            chat_id=1, message_id=10, text="Done"
+        )
+        app.bot.send_message.assert_not_awaited()
+
+
+class TestChangeSemantics(unittest.TestCase):
+    """Test cases for IS_CHANGED and duplicate delivery suppression"""
+    
+    def setUp(self):
+        """Use a fresh delivery tracker and listener registry"""
+        self.valid_token = "bot123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        self.tracker = DeliveryTracker()
+        patchers = [
+            patch("telegram_nodes._delivery_tracker", self.tracker),
+            patch("telegram_nodes.get_hub"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_listener_changed_without_running_bot(self):
+        """Test that the listener always runs when its bot is not running"""
+        telegram_nodes.get_hub.return_value.get.return_value = None
+        value = TelegramListener.IS_CHANGED(self.valid_token, 10)
+        self.assertNotEqual(value, value)  # NaN never compares equal
+    
+    def test_listener_keyed_by_pending_update_id(self):
+        """Test that the listener is keyed by the next message's update_id"""
+        runtime = BotRuntime(self.valid_token, Mock(), None)
+        runtime.is_running = True
+        telegram_nodes.get_hub.return_value.get.return_value = runtime
+        
+        value = TelegramListener.IS_CHANGED(self.valid_token, 10)
+        self.assertNotEqual(value, value)
+        
+        message = {"text": "hi", "chat_id": 1, "update_id": 42}
+        runtime.message_queue.put(message)
+        self.assertEqual(TelegramListener.IS_CHANGED(self.valid_token, 10), 42)
+        self.assertEqual(runtime.message_queue.qsize(), 1)
+    
+    def test_consuming_message_starts_request(self):
+        """Test that consuming a message starts a new request for its chat"""
+        listener = TelegramListener()
+        listener.message_queue.put({"text": "hi", "chat_id": 1, "update_id": 42})
+        
+        with patch.object(listener, "_start_bot"):
+            listener.listen_for_message(self.valid_token, 5)
+        
+        self.assertEqual(self.tracker.request_id(self.valid_token, 1), 42)
+    
+    def test_sender_skips_duplicate_payload(self):
+        """Test that the same payload is sent only once per request"""
+        sender = SaveToTelegram()
+        self.tracker.begin(self.valid_token, 12345, 42)
+        
+        with patch.object(sender, "_send_text", return_value=1) as mock_send:
+            first = sender.send_message(self.valid_token, "12345", "Hello")
+            second = sender.send_message(self.valid_token, "12345", "Hello")
+            sender.send_message(self.valid_token, "12345", "Other")
+        
+        self.assertEqual(first, ("Message sent successfully to chat 12345",))
+        self.assertEqual(second, ("Message already sent to chat 12345",))
+        self.assertEqual(mock_send.call_count, 2)
+        
+        self.tracker.begin(self.valid_token, 12345, 43)
+        with patch.object(sender, "_send_text", return_value=1) as mock_send:
+            sender.send_message(self.valid_token, "12345", "Hello")
+        mock_send.assert_called_once()
+    
+    def test_sender_repeats_payload_outside_request(self):
+        """Test that a workflow without a listener request can resend a payload"""
+        sender = SaveToTelegram()
+        
+        with patch.object(sender, "_send_text", return_value=1) as mock_send:
+            sender.send_message(self.valid_token, "42", "Done")
+            second = sender.send_message(self.valid_token, "42", "Done")
+        
+        self.assertEqual(second, ("Message sent successfully to chat 42",))
+        self.assertEqual(mock_send.call_count, 2)
+    
+    def test_sender_tells_images_apart_by_pixels(self):
+        """Test that images of the same shape and mean, e.g. mirrored, are both sent"""
+
+        def create_images(pixels):
+            images = Mock(shape=(1, 1, 2, 3))
+            frame = Mock(**{"cpu.return_value.numpy.return_value": pixels})
+            images.__iter__ = lambda self: iter([frame])
+            return images
+
+        sender = SaveToTelegram()
+        self.tracker.begin(self.valid_token, 12345, 42)
+        
+        with patch.object(sender, "_send_photos") as mock_send:
+            sender.send_message(
+                self.valid_token, "12345", "", images=create_images(b"\x00\xff")
+            )
+            sender.send_message(
+                self.valid_token, "12345", "", images=create_images(b"\xff\x00")
+            )
+            sender.send_message(
+                self.valid_token, "12345", "", images=create_images(b"\xff\x00")
+            )
+        
+        self.assertEqual(mock_send.call_count, 2)
+    
+    def test_sender_is_changed_keyed_by_request_and_payload(self):
+        """Test that the sender's change key follows the request and payload"""
+        self.tracker.begin(self.valid_token, 12345, 42)
+        first = SaveToTelegram.IS_CHANGED(self.valid_token, "12345", "Hello")
+        
+        self.assertEqual(
+            first, SaveToTelegram.IS_CHANGED(self.valid_token, "12345", "Hello")
+        )
+        self.assertNotEqual(
+            first, SaveToTelegram.IS_CHANGED(self.valid_token, "12345", "Other")
+        )
+        self.tracker.begin(self.valid_token, 12345, 43)
+        self.assertNotEqual(
+            first, SaveToTelegram.IS_CHANGED(self.valid_token, "12345", "Hello")
+        )
+    
+    def test_sender_is_changed_with_linked_inputs(self):
+        """Test that the sender is changed when ComfyUI omits linked inputs"""
+        value = SaveToTelegram.IS_CHANGED(bot_token=self.valid_token)
+        
+        self.assertNotEqual(value, value)  # NaN
+    
+    def test_payload_hash(self):
+        """Test that payload hashes distinguish parts"""
+        self.assertEqual(payload_hash("a", b"b"), payload_hash("a", "b"))
+        self.assertNotEqual(payload_hash("ab"), payload_hash("a", "b"))
+
+
 class TestTelegramNodesIntegration(unittest.TestCase):
     """Integration tests for both nodes working together"""
     
@@ -274,7 +619,9 @@ class TestTelegramNodesIntegration(unittest.TestCase):
         
         with patch.object(self.listener, '_start_bot'):
             # Get message from listener
-            message_text, chat_id = self.listener.listen_for_message(valid_token, 10)
+            message_text, chat_id, image, context, user_id = (
+                self.listener.listen_for_message(valid_token, 10)
+            )
             
             # Verify message received correctly
             self.assertEqual(message_text, "Test message")
@@ -0,0 +1,251 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import Mock, AsyncMock, patch
+import asyncio
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+import telegram_nodes
+from telegram_nodes import SaveToTelegram, ChatRateLimiter
+from telegram_outbox import Outbox, SendStep, is_transient_error, retry_after
+
+
+class NetworkError(Exception):
+    pass
+
+
+class RetryAfter(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"Flood control exceeded. Retry in {seconds} seconds")
+        self.retry_after = seconds
+
+
+class BadRequest(Exception):
+    pass
+
+
+def make_bot(send_message):
+    bot = Mock()
+    bot.initialize = AsyncMock()
+    bot.send_message = send_message
+    return bot
+
+
+class TestOutbox(unittest.TestCase):
+    """Test cases for the durable outbox"""
+
+    def setUp(self):
+        self.sent = []
+
+        async def send_message(chat_id, text):
+            self.sent.append((chat_id, text))
+
+        self.bot = make_bot(AsyncMock(side_effect=send_message))
+        self.outbox = Outbox(bot_factory=lambda token: self.bot, base_delay=0)
+        self.outbox.start = Mock()  # retries are driven by the tests
+
+    def retry(self, outbox=None):
+        return asyncio.run((outbox or self.outbox).retry_due())
+
+    def test_error_classification(self):
+        """Test that network errors and flood control are retried, bad requests not"""
+        self.assertTrue(is_transient_error(NetworkError("Bad Gateway")))
+        self.assertTrue(is_transient_error(RetryAfter(3)))
+        self.assertTrue(is_transient_error(ConnectionError()))
+        self.assertFalse(is_transient_error(BadRequest("Chat not found")))
+        self.assertFalse(is_transient_error(ValueError()))
+        self.assertEqual(retry_after(RetryAfter(3)), 3.0)
+        self.assertIsNone(retry_after(NetworkError()))
+
+    def test_retries_in_order_per_chat(self):
+        """Test that one delivery per chat is attempted at a time, oldest first"""
+        self.outbox.defer(
+            "token",
+            1,
+            [
+                SendStep("send_message", {"text": "a"}),
+                SendStep("send_message", {"text": "b"}),
+            ],
+        )
+        self.outbox.defer("token", 2, [SendStep("send_message", {"text": "c"})])
+
+        self.assertEqual(self.retry(), 2)
+        self.assertEqual(self.sent, [(1, "a"), (2, "c")])
+        self.assertEqual(self.retry(), 1)
+        self.assertEqual(self.sent[-1], (1, "b"))
+        self.assertFalse(self.outbox.has_pending("token", 1))
+
+    def test_failed_head_blocks_chat(self):
+        """Test that later deliveries wait while the oldest one keeps failing"""
+        self.bot.send_message.side_effect = NetworkError("Bad Gateway")
+        self.outbox.defer(
+            "token",
+            1,
+            [
+                SendStep("send_message", {"text": "a"}),
+                SendStep("send_message", {"text": "b"}),
+            ],
+        )
+
+        self.assertEqual(self.retry(), 0)
+        self.assertEqual(self.bot.send_message.await_count, 1)
+        self.assertEqual(self.outbox.pending_count(), 2)
+
+    def test_backoff_grows_and_honors_retry_after(self):
+        """Test exponential backoff with jitter and Telegram's flood control wait"""
+        outbox = Outbox(base_delay=1, max_delay=60)
+        delays = [outbox.backoff(attempt) for attempt in range(1, 6)]
+        for attempt, delay in enumerate(delays, start=1):
+            self.assertLessEqual(delay, 2 ** (attempt - 1))
+            self.assertGreaterEqual(delay, 2 ** (attempt - 1) / 2)
+        self.assertLessEqual(outbox.backoff(20), 60)
+
+        self.bot.send_message.side_effect = RetryAfter(30)
+        self.outbox.defer("token", 1, [SendStep("send_message", {"text": "a"})])
+        self.retry()
+        self.assertEqual(self.outbox.due(), [])
+
+    def test_dead_letter_after_max_attempts(self):
+        """Test that a delivery is given up after max_attempts and unblocks the chat"""
+        self.outbox.max_attempts = 2
+        self.bot.send_message.side_effect = NetworkError("Bad Gateway")
+        self.outbox.defer("token", 1, [SendStep("send_message", {"text": "a"})])
+
+        self.retry()
+        self.retry()
+
+        self.assertFalse(self.outbox.has_pending("token", 1))
+        dead = self.outbox.dead_letters()
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0]["attempts"], 2)
+
+    def test_permanent_error_is_dead_lettered_at_once(self):
+        """Test that errors retrying cannot fix are not retried"""
+        self.bot.send_message.side_effect = BadRequest("Chat not found")
+        self.outbox.defer("token", 1, [SendStep("send_message", {"text": "a"})])
+
+        self.retry()
+
+        self.assertEqual(len(self.outbox.dead_letters()), 1)
+
+    def test_survives_restart(self):
+        """Test that waiting deliveries, including media, are kept in the outbox file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outbox.db")
+            first = Outbox(path, base_delay=0)
+            first.start = Mock()
+            first.defer(
+                "token",
+                1,
+                [SendStep("send_photo", {"caption": "cat"}, "photo", b"jpeg")],
+            )
+            first._db.close()
+
+            bot = Mock()
+            bot.initialize = AsyncMock()
+            bot.send_photo = AsyncMock()
+            second = Outbox(path, bot_factory=lambda token: bot, base_delay=0)
+            self.assertEqual(second.pending_count(), 1)
+            self.assertEqual(self.retry(second), 1)
+            bot.send_photo.assert_awaited_once_with(
+                chat_id=1, caption="cat", photo=b"jpeg"
+            )
+            second._db.close()
+
+    def test_media_groups_are_stored_as_photos(self):
+        """Test that an undelivered album is retried photo by photo"""
+        self.outbox.defer(
+            "token",
+            1,
+            [
+                SendStep(
+                    "send_media_group", {"captions": ["cat"]}, "media", [b"one", b"two"]
+                )
+            ],
+        )
+
+        self.assertEqual(self.outbox.pending_count(), 2)
+
+
+class TestSenderOutbox(unittest.TestCase):
+    """Test cases for SaveToTelegram handing failed sends to the outbox"""
+
+    def setUp(self):
+        self.outbox = Outbox(base_delay=0)
+        self.outbox.start = Mock()
+        self.sender = SaveToTelegram()
+        self.app = Mock()
+        self.sender.applications["token"] = self.app
+        self.patches = [
+            patch("telegram_nodes.get_outbox", return_value=self.outbox),
+            patch("telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)),
+            patch("telegram_nodes._delivery_tracker", telegram_nodes.DeliveryTracker()),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_transient_failure_defers_remaining_parts(self):
+        """Test that parts not yet sent are stored instead of lost"""
+        self.app.bot.send_message = AsyncMock(
+            side_effect=[None, NetworkError("Timed out")]
+        )
+
+        result = self.sender.send_message("token", "1", "a " * 3000)
+
+        self.assertIn("queued for retry", result[0])
+        self.assertEqual(self.outbox.pending_count(), 1)
+        self.assertTrue(self.outbox.has_pending("token", 1))
+
+    def test_permanent_failure_is_reported(self):
+        """Test that errors retrying cannot fix are still returned as errors"""
+        self.app.bot.send_message = AsyncMock(side_effect=BadRequest("Chat not found"))
+
+        result = self.sender.send_message("token", "1", "hello")
+
+        self.assertEqual(result, ("Error sending message: Chat not found",))
+        self.assertEqual(self.outbox.pending_count(), 0)
+
+    def test_new_messages_queue_behind_waiting_ones(self):
+        """Test that a chat's messages keep their order while earlier ones wait"""
+        self.app.bot.send_message = AsyncMock()
+        self.outbox.defer("token", 1, [SendStep("send_message", {"text": "first"})])
+
+        result = self.sender.send_message("token", "1", "second")
+
+        self.assertIn("queued for retry", result[0])
+        self.app.bot.send_message.assert_not_awaited()
+        self.assertEqual(self.outbox.pending_count(), 2)
+
+    def test_transient_failure_inside_running_loop(self):
+        """Test that a failure is deferred inside a running event loop, as in ComfyUI"""
+        self.app.bot.send_message = AsyncMock(
+            side_effect=ConnectionError("Connection reset")
+        )
+
+        async def run_node():
+            with self.assertRaises(telegram_nodes.DeliveryDeferred):
+                self.sender._deliver(
+                    "token", 1, [SendStep("send_message", {"text": "hello"})]
+                )
+            return self.sender.send_message("token", "2", "hello")
+
+        result = asyncio.run(run_node())
+
+        self.assertIn("queued for retry", result[0])
+        self.assertTrue(self.outbox.has_pending("token", 1))
+        self.assertTrue(self.outbox.has_pending("token", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_profiling import (
+    CallProfile,
+    NULL_PROFILE,
+    current_profile,
+    profile_call,
+    resolve_mode,
+    write_profile,
+)
+from telegram_nodes import SaveToTelegram, ChatRateLimiter, DeliveryTracker
+from telegram_outbox import Outbox
+
+
+class TestProfiling(unittest.TestCase):
+    """Test cases for per-phase timings and slow call capture"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch.dict(os.environ, {"TELEGRAM_PROFILE_DIR": self.directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def read_timings(self):
+        with open(
+            os.path.join(self.directory.name, "timings.jsonl"), encoding="utf-8"
+        ) as timings:
+            return [json.loads(line) for line in timings]
+
+    def test_phases_are_summed(self):
+        """Test that repeated phases accumulate wall time and a count"""
+        profile = CallProfile("Node")
+        with profile.phase("http"):
+            pass
+        profile.add("http", 1.0)
+        profile.add("wait", 2.0)
+        profile.wall = 4.0
+
+        self.assertEqual(profile.phases["http"]["count"], 2)
+        self.assertGreaterEqual(profile.phases["http"]["wall"], 1.0)
+        self.assertAlmostEqual(profile.busy, 4.0 - 2.0, places=3)
+
+    def test_mode_from_input_or_environment(self):
+        """Test that the node input wins and TELEGRAM_PROFILE applies otherwise"""
+        self.assertEqual(resolve_mode("cprofile"), "cprofile")
+        self.assertEqual(resolve_mode("off"), "off")
+        with patch.dict(os.environ, {"TELEGRAM_PROFILE": "1"}):
+            self.assertEqual(resolve_mode("off"), "timings")
+        with patch.dict(os.environ, {"TELEGRAM_PROFILE": "bogus"}):
+            self.assertEqual(resolve_mode("off"), "off")
+
+    def test_profile_is_current_only_inside_call(self):
+        """Test that code outside a profiled call sees the no-op profile"""
+        self.assertIs(current_profile(), NULL_PROFILE)
+        with profile_call("Node") as profile:
+            self.assertIs(current_profile(), profile)
+        self.assertIs(current_profile(), NULL_PROFILE)
+
+    def test_cprofile_written_for_slow_calls_only(self):
+        """Test that cProfile stats are dumped when a call is busy past the threshold"""
+        fast = CallProfile("Node", "cprofile", threshold=10)
+        fast.wall = 1.0
+        slow = CallProfile("Node", "cprofile", threshold=0.5)
+        slow.wall = 1.0
+        slow.correlate(chat_id=12345, update_id=7)
+
+        self.assertNotIn("cprofile", write_profile(fast))
+        record = write_profile(slow)
+
+        self.assertTrue(record["cprofile"].endswith("_Node_12345_7.prof"))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory.name, record["cprofile"]))
+        )
+        self.assertEqual(len(self.read_timings()), 2)
+
+    def test_sender_records_send_phases(self):
+        """Test that a profiled send records loop overhead and HTTP time per chat"""
+        sender = SaveToTelegram()
+        app = Mock()
+        app.bot.send_message = AsyncMock()
+        sender.applications["token"] = app
+
+        with patch("telegram_nodes.get_outbox", return_value=Outbox()), patch(
+            "telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)
+        ), patch("telegram_nodes._delivery_tracker", DeliveryTracker()):
+            result = sender.send_message("token", "12345", "hello", profile="timings")
+
+        self.assertIn("sent successfully", result[0])
+        record = self.read_timings()[-1]
+        self.assertEqual(record["node"], "SaveToTelegram")
+        self.assertEqual(record["chat_id"], 12345)
+        self.assertEqual(record["phases"]["http"]["count"], 1)
+        self.assertIn("loop_setup", record["phases"])
+        self.assertIn("loop_teardown", record["phases"])
+
+
+if __name__ == "__main__":
+    unittest.main()
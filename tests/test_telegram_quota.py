@@ -0,0 +1,219 @@
+import unittest
+import sys
+import os
+import asyncio
+import tempfile
+import time
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_quota import UsageLedger
+from telegram_commands import get_commands
+from telegram_context import ConversationStore
+from telegram_runtime import BotRuntime
+from telegram_nodes import (
+    TelegramListener,
+    SaveToTelegram,
+    ChatRateLimiter,
+    DeliveryTracker,
+)
+
+HOUR = 3600
+# An hour ago on a bucket boundary, so flushes at the real time keep the last hour
+NOW = (int(time.time()) // 60 - 60) * 60.0
+
+
+class TestUsageLedger(unittest.TestCase):
+    """Test cases for sliding-window usage counters"""
+
+    def test_request_quota_slides(self):
+        """Test that requests are refused at the limit until the window slides"""
+        ledger = UsageLedger()
+        self.assertIsNone(ledger.admit(1, max_requests=2, now=NOW))
+        self.assertIsNone(ledger.admit(1, max_requests=2, now=NOW + 600))
+
+        refusal = ledger.admit(1, max_requests=2, now=NOW + 1200)
+        self.assertIn("limit of 2 requests per hour", refusal)
+        self.assertIn("Try again in 40 min", refusal)
+        self.assertIsNone(ledger.admit(2, max_requests=2, now=NOW + 1200))
+
+        self.assertIsNone(ledger.admit(1, max_requests=2, now=NOW + HOUR))
+        self.assertEqual(ledger.usage(1, now=NOW + HOUR), (2, 0.0))
+
+    def test_generation_time_quota(self):
+        """Test that generation time from pickup to reply is charged and limited"""
+        ledger = UsageLedger()
+        ledger.admit(1, now=NOW)
+        ledger.begin("token", 10, 1, now=NOW)
+        self.assertEqual(ledger.finish("token", 10, now=NOW + 45), 45)
+        self.assertIsNone(ledger.finish("token", 10, now=NOW + 50))
+
+        self.assertIsNone(ledger.admit(1, max_seconds=60, now=NOW + 50))
+        ledger.begin("token", 10, 1, now=NOW + 50)
+        ledger.finish("token", 10, now=NOW + 70)
+
+        self.assertIn(
+            "60 seconds of generation time",
+            ledger.admit(1, max_seconds=60, now=NOW + 80),
+        )
+        self.assertEqual(ledger.usage(1, now=NOW + 80), (2, 65.0))
+
+    def test_next_request_finishes_previous(self):
+        """Test that an unanswered request is charged when the next one is picked up"""
+        ledger = UsageLedger()
+        ledger.begin("token", 10, 1, now=NOW)
+        ledger.begin("token", 20, 2, now=NOW + 30)
+        ledger.begin("other", 30, 3, now=NOW + 40)
+
+        self.assertEqual(ledger.usage(1, now=NOW + 40), (0, 30.0))
+        self.assertEqual(ledger.finish("token", 20, now=NOW + 50), 20)
+        self.assertEqual(ledger.finish("other", 30, now=NOW + 50), 10)
+
+    def test_flush_persists_and_compacts(self):
+        """Test that usage is stored, read back and dropped from the index once idle"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "usage.db")
+            ledger = UsageLedger(path)
+            ledger.admit(1, now=NOW)
+            ledger.admit(2, now=NOW)
+            ledger.flush(now=NOW)
+            ledger.admit(1, now=NOW + HOUR - 60)
+            ledger.flush(now=NOW + HOUR)
+
+            self.assertEqual(set(ledger._users), {1})
+            ledger.close()
+
+            restored = UsageLedger(path)
+            self.assertEqual(restored.usage(1, now=NOW + HOUR), (1, 0.0))
+            self.assertEqual(restored.usage(2, now=NOW + HOUR), (0, 0.0))
+            restored.close()
+
+    def test_periodic_flush(self):
+        """Test that changes are flushed once the flush interval has passed"""
+        ledger = UsageLedger(flush_interval=0)
+        ledger.admit(1)
+
+        self.assertEqual(ledger._dirty, set())
+        self.assertEqual(
+            ledger._db.execute("SELECT SUM(requests) FROM usage").fetchone()[0], 1
+        )
+
+
+class TestListenerQuota(unittest.TestCase):
+    """Test cases for enforcing quotas before messages are queued"""
+
+    def setUp(self):
+        self.ledger = UsageLedger()
+        self.token = "bot123456:ABC"
+        patches = [
+            patch("telegram_nodes.get_usage_ledger", return_value=self.ledger),
+            patch("telegram_commands.get_usage_ledger", return_value=self.ledger),
+            patch(
+                "telegram_nodes.get_conversation_store",
+                return_value=ConversationStore(),
+            ),
+            patch("telegram_nodes._chat_rate_limiter", ChatRateLimiter(min_interval=0)),
+            patch("telegram_nodes._delivery_tracker", DeliveryTracker()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def create_update(self, text, user_id=67890):
+        update = Mock()
+        update.message.text = text
+        update.message.chat_id = 12345
+        update.message.from_user.id = user_id
+        update.message.reply_text = AsyncMock()
+        return update
+
+    def test_refused_before_queueing(self):
+        """Test that a user over the limit is answered without reaching the workflow"""
+        listener = TelegramListener()
+        listener.quota = (1, 0)
+        first, second = self.create_update("a cat"), self.create_update("a dog")
+
+        asyncio.run(listener._handle_message(first, Mock()))
+        asyncio.run(listener._handle_message(second, Mock()))
+        asyncio.run(
+            listener._handle_message(self.create_update("a cow", user_id=1), Mock())
+        )
+
+        self.assertEqual(
+            [message["text"] for message in listener.message_queue.queue],
+            ["a cat", "a cow"],
+        )
+        first.message.reply_text.assert_not_called()
+        self.assertIn(
+            "limit of 1 requests per hour", second.message.reply_text.await_args[0][0]
+        )
+
+    def test_refused_album_answered_once(self):
+        """Test that a refused album is answered once, not once per photo"""
+        listener = TelegramListener()
+        listener.quota = (1, 0)
+        listener.album_window = 0.05
+        photos = [self.create_update("") for _ in range(3)]
+        for photo in photos:
+            photo.message.caption = None
+            photo.message.photo = [Mock(file_id="photo-id")]
+            photo.message.media_group_id = "album"
+
+        async def run():
+            await listener._handle_message(self.create_update("a cat"), Mock())
+            for photo in photos:
+                await listener._handle_message(photo, Mock())
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+
+        self.assertEqual(listener.message_queue.qsize(), 1)
+        self.assertEqual(
+            [photo.message.reply_text.await_count for photo in photos], [1, 0, 0]
+        )
+        self.assertEqual(listener.refused_albums, {})
+
+    def test_user_id_output_and_generation_time(self):
+        """Test that the user ID is output and the request is charged until the reply"""
+        listener = TelegramListener()
+        listener.is_running = True
+        listener.bot_token = self.token
+        listener.message_queue.put(
+            {"text": "a cat", "chat_id": 12345, "user_id": 67890}
+        )
+        sender = SaveToTelegram()
+        sender._send_text = Mock(return_value=1)
+
+        result = listener.listen_for_message(self.token, 5)
+        self.assertEqual(result[4], "67890")
+        self.assertIn(("bot123456:ABC", 12345), self.ledger._active)
+
+        sender.send_message(self.token, "12345", "here is a cat")
+        self.assertEqual(self.ledger._active, {})
+        self.assertGreaterEqual(self.ledger.usage(67890)[1], 0.0)
+
+    def test_usage_command(self):
+        """Test that /usage reports the user's usage in the window"""
+        self.ledger.admit(67890)
+        self.ledger.begin(self.token, 12345, 67890)
+        self.ledger.finish(self.token, 12345)
+        update = self.create_update("/usage")
+
+        asyncio.run(
+            get_commands().dispatch(BotRuntime(self.token, Mock(), None), update, None)
+        )
+
+        self.assertEqual(
+            update.message.reply_text.await_args[0][0],
+            "In the last hour: 1 request, 0s of generation time.",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,292 @@
+import unittest
+import sys
+import os
+import asyncio
+import threading
+import time
+import concurrent.futures
+from unittest.mock import Mock, AsyncMock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_runtime import RuntimeHub
+from telegram_nodes import TelegramListener
+
+
+def fake_application(token):
+    """Create an application stand-in that connects without any network access"""
+    application = Mock()
+    application.token = token
+    application.initialize = AsyncMock()
+    application.start = AsyncMock()
+    application.stop = AsyncMock()
+    application.shutdown = AsyncMock()
+    application.updater.start_polling = AsyncMock()
+    application.updater.stop = AsyncMock()
+    return application
+
+
+class TestRuntimeHub(unittest.TestCase):
+    """Test cases for hosting bot tokens on shared event loops"""
+    
+    def setUp(self):
+        """Create a hub with fake applications"""
+        self.hub = RuntimeHub(application_factory=fake_application)
+    
+    def tearDown(self):
+        """Shut the hub down"""
+        self.hub.shutdown()
+    
+    def test_acquire_starts_polling(self):
+        """Test that acquiring a token starts its application on the hub loop"""
+        configure = Mock()
+        
+        runtime = self.hub.acquire("token-a", configure)
+        
+        self.assertTrue(runtime.is_running)
+        runtime.application.initialize.assert_awaited_once()
+        runtime.application.updater.start_polling.assert_awaited_once()
+        runtime.application.start.assert_awaited_once()
+        configure.assert_called_once_with(runtime.application, runtime)
+        self.assertIs(self.hub.acquire("token-a"), runtime)
+        self.assertIs(self.hub.get("token-a"), runtime)
+    
+    def test_release_stops_polling(self):
+        """Test that releasing a token stops and shuts down its application"""
+        runtime = self.hub.acquire("token-a")
+        
+        self.hub.release("token-a")
+        
+        self.assertFalse(runtime.is_running)
+        runtime.application.updater.stop.assert_awaited_once()
+        runtime.application.stop.assert_awaited_once()
+        runtime.application.shutdown.assert_awaited_once()
+        self.assertIsNone(self.hub.get("token-a"))
+    
+    def test_failed_start_is_not_kept(self):
+        """Test that a token that fails to connect is not registered"""
+
+        def failing_application(token):
+            application = fake_application(token)
+            application.initialize.side_effect = RuntimeError("Unauthorized")
+            return application
+        
+        self.hub.application_factory = failing_application
+        
+        with self.assertRaises(RuntimeError):
+            self.hub.acquire("bad-token")
+        self.assertIsNone(self.hub.get("bad-token"))
+    
+    def test_updates_routed_to_per_token_queues(self):
+        """Test that each token's updates land in its own queue"""
+        runtimes = [self.hub.acquire(f"token-{index}") for index in range(3)]
+        for runtime in runtimes:
+
+            async def handler(update, context, runtime=runtime):
+                runtime.message_queue.put(
+                    {"text": update.text, "update_id": update.update_id}
+                )
+
+            runtime.handler = handler
+        
+        for index, runtime in enumerate(runtimes):
+            runtime.submit(
+                runtime.dispatch(Mock(text=f"hello {index}", update_id=index), Mock())
+            ).result(5)
+        
+        for index, runtime in enumerate(runtimes):
+            self.assertEqual(runtime.peek_update_id(), index)
+            self.assertEqual(
+                runtime.message_queue.get_nowait()["text"], f"hello {index}"
+            )
+    
+    def test_loop_pool_assignment(self):
+        """Test that tokens are spread over a fixed pool of loops"""
+        hub = RuntimeHub(loop_count=2, application_factory=fake_application)
+        try:
+            loops = {hub.acquire(f"token-{index}").loop for index in range(20)}
+            self.assertEqual(len(loops), 2)
+            self.assertEqual(len(hub.threads), 2)
+        finally:
+            hub.shutdown()
+    
+    def test_many_tokens_on_one_loop(self):
+        """Benchmark: 150 tokens share one loop and one thread"""
+        threads_before = threading.active_count()
+        started = time.perf_counter()
+        
+        runtimes = [self.hub.acquire(f"token-{index}") for index in range(150)]
+        elapsed = time.perf_counter() - started
+        
+        self.assertEqual(len({runtime.loop for runtime in runtimes}), 1)
+        self.assertEqual(threading.active_count() - threads_before, 1)
+        self.assertTrue(all(runtime.is_running for runtime in runtimes))
+        self.assertLess(elapsed, 5.0)
+        
+        # All tokens are served concurrently by the one loop
+        async def handler(update, context):
+            await asyncio.sleep(0.1)
+        
+        for runtime in runtimes:
+            runtime.handler = handler
+        started = time.perf_counter()
+        futures = [
+            runtime.submit(runtime.dispatch(Mock(), Mock())) for runtime in runtimes
+        ]
+        for future in futures:
+            future.result(5)
+        self.assertLess(time.perf_counter() - started, 2.0)
+    
+    def test_shutdown_stops_threads(self):
+        """Test that shutting down leaves no hub threads running"""
+        self.hub.acquire("token-a")
+        threads = self.hub.threads
+        
+        self.hub.shutdown()
+        
+        self.assertTrue(threads)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(self.hub.runtimes, {})
+
+
+class TestRuntimeLifecycle(unittest.TestCase):
+    """Test cases for stopping, restarting and swapping bot tokens"""
+    
+    def setUp(self):
+        """Create a hub with fake applications and short timeouts"""
+        self.hub = RuntimeHub(application_factory=fake_application, stop_timeout=1.0)
+    
+    def tearDown(self):
+        """Shut the hub down"""
+        self.hub.shutdown()
+    
+    def test_shared_runtime_stops_with_last_user(self):
+        """Test that a token keeps polling while any listener still uses it"""
+        runtime = self.hub.acquire("token-a")
+        self.assertIs(self.hub.acquire("token-a"), runtime)
+        
+        self.hub.release("token-a")
+        self.assertTrue(runtime.is_running)
+        self.hub.release("token-a")
+        self.assertFalse(runtime.is_running)
+        self.assertIsNone(self.hub.get("token-a"))
+    
+    def test_queued_messages_handed_to_next_runtime(self):
+        """Test that messages received before a restart are not lost"""
+        runtime = self.hub.acquire("token-a")
+        runtime.message_queue.put({"text": "hello", "update_id": 1})
+        
+        self.hub.release("token-a")
+        restarted = self.hub.acquire("token-a")
+        
+        self.assertIsNot(restarted, runtime)
+        self.assertEqual(restarted.peek_update_id(), 1)
+    
+    def test_stop_drains_in_flight_work(self):
+        """Test that the bot shuts down only after tracked work has finished"""
+        runtime = self.hub.acquire("token-a")
+        events = []
+        
+        async def download():
+            await asyncio.sleep(0.2)
+            events.append("download")
+        
+        async def shutdown():
+            events.append("shutdown")
+        
+        runtime.application.shutdown.side_effect = shutdown
+        runtime.submit(download())
+        
+        self.hub.release("token-a")
+        
+        self.assertEqual(events, ["download", "shutdown"])
+        self.assertEqual(runtime._inflight, set())
+    
+    def test_stop_is_bounded(self):
+        """Test that a hanging stop returns within the stop timeout"""
+        runtime = self.hub.acquire("token-a")
+        
+        async def hang():
+            await asyncio.sleep(30)
+        
+        runtime.application.updater.stop.side_effect = hang
+        started = time.perf_counter()
+        
+        self.hub.release("token-a")
+        
+        self.assertLess(time.perf_counter() - started, 2.5)
+        self.assertIsNone(self.hub.get("token-a"))
+    
+    def test_token_hot_swap_latency_and_threads(self):
+        """Benchmark: swapping tokens is fast and leaks no threads or pollers"""
+        listener = TelegramListener()
+        configure = patch("telegram_nodes._configure_application")
+        with patch("telegram_nodes.get_hub", return_value=self.hub), configure:
+            listener._switch_bot("token-0")
+            threads_before = threading.active_count()
+            latencies = []
+            for index in range(1, 21):
+                started = time.perf_counter()
+                listener._switch_bot(f"token-{index % 3}")
+                latencies.append(time.perf_counter() - started)
+            listener._stop_bot()
+        
+        self.assertLess(max(latencies), 0.5)
+        self.assertEqual(threading.active_count(), threads_before)
+        self.assertEqual(self.hub.runtimes, {})
+    
+    def test_same_token_restart_waits_for_stop(self):
+        """Test that a token is not polled twice while its previous runtime stops"""
+        runtime = self.hub.acquire("token-a")
+        
+        async def slow_stop():
+            await asyncio.sleep(0.3)
+        
+        runtime.application.updater.stop.side_effect = slow_stop
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            release = executor.submit(self.hub.release, "token-a")
+            time.sleep(0.05)
+            restarted = self.hub.acquire("token-a")
+            release.result(5)
+        
+        self.assertFalse(runtime.is_running)
+        runtime.application.shutdown.assert_awaited_once()
+        self.assertTrue(restarted.is_running)
+        self.assertIsNot(restarted, runtime)
+    
+    def test_slow_start_does_not_block_other_tokens(self):
+        """Test that a token that is slow to connect holds up only its own acquires"""
+
+        def slow_application(token):
+            application = fake_application(token)
+            if token == "token-slow":
+
+                async def slow_initialize():
+                    await asyncio.sleep(0.5)
+
+                application.initialize.side_effect = slow_initialize
+            return application
+        
+        self.hub.application_factory = slow_application
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            slow = [executor.submit(self.hub.acquire, "token-slow") for _ in range(2)]
+            time.sleep(0.05)
+            started = time.perf_counter()
+            self.hub.acquire("token-b")
+            self.hub.release("token-b")
+            elapsed = time.perf_counter() - started
+            runtimes = [future.result(5) for future in slow]
+        
+        self.assertLess(elapsed, 0.3)
+        self.assertIs(runtimes[0], runtimes[1])
+        self.assertEqual(runtimes[0].users, 2)
+        runtimes[0].application.initialize.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import time
+from unittest.mock import Mock, patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock telegram imports before importing our module
+sys.modules["telegram"] = Mock()
+sys.modules["telegram.ext"] = Mock()
+
+from telegram_cache import ResultCache
+from telegram_outbox import Outbox, SendStep
+from telegram_runtime import BotRuntime, RuntimeHub
+from telegram_status import StatusReporter, STATUS_EVENT, bot_id
+
+
+class RetryAfter(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"Flood control exceeded. Retry in {seconds} seconds")
+        self.retry_after = seconds
+
+
+class TestStatusReporter(unittest.TestCase):
+    """Test cases for the live status pushed to the frontend"""
+
+    def setUp(self):
+        """Create a hub with one running bot and a reporter sending to a mock"""
+        self.hub = RuntimeHub()
+        application = Mock()
+        application.updater.running = True
+        self.runtime = BotRuntime("123456:ABC", application, None)
+        self.runtime.is_running = True
+        self.hub.runtimes["123456:ABC"] = self.runtime
+        self.outbox = Outbox()
+        self.outbox.start = Mock()
+        self.send = Mock()
+        self.reporter = StatusReporter(self.send, min_interval=0.2, heartbeat=60)
+        self.cache = ResultCache()
+        patches = [
+            patch("telegram_status.get_hub", return_value=self.hub),
+            patch("telegram_status.get_outbox", return_value=self.outbox),
+            patch("telegram_status.get_result_cache", return_value=self.cache),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.reporter.stop)
+
+    def wait_for_pushes(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while self.send.call_count < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_bot_id(self):
+        """Test that only the public part of a token identifies the bot"""
+        self.assertEqual(bot_id("bot123456:ABC"), "123456")
+        self.assertEqual(bot_id(" 123456:ABC "), "123456")
+
+    def test_snapshot(self):
+        """Test that the snapshot reports connection, queue, age, backlog and errors"""
+        self.runtime.message_queue.put({"chat_id": 1})
+        self.runtime.last_update_at = time.time() - 30
+        self.outbox.defer("123456:ABC", 1, [SendStep("send_message", {"text": "a"})])
+        self.reporter.record_error("123456:ABC", RetryAfter(5))
+        self.reporter.record_error("123456:ABC", RuntimeError("Bad Gateway"))
+
+        status = self.reporter.snapshot()["bots"]["123456"]
+
+        self.assertTrue(status["connected"])
+        self.assertTrue(status["polling"])
+        self.assertEqual(status["queue"], 1)
+        self.assertAlmostEqual(status["last_message_age"], 30, delta=1)
+        self.assertEqual(status["backlog"], 1)
+        self.assertEqual(status["errors"], 2)
+        self.assertEqual(status["rate_limited"], 1)
+        self.assertEqual(status["last_error"], "Bad Gateway")
+
+    def test_snapshot_reports_cache_hits(self):
+        """Test that the snapshot reports how often the result cache answered"""
+        self.cache.put("a cat", {"text": "a cat"}, ttl=60)
+        for key in ("a cat", "a cat", "a cat", "a dog"):
+            self.cache.get(key)
+
+        cache = self.reporter.snapshot()["cache"]
+
+        self.assertEqual((cache["entries"], cache["hits"], cache["misses"]), (1, 3, 1))
+        self.assertEqual(cache["hit_rate"], 0.75)
+
+    def test_pushes_are_throttled(self):
+        """Test that a burst of changes results in at most one push per interval"""
+        for _ in range(20):
+            self.reporter.notify()
+        self.wait_for_pushes(1)
+        for _ in range(20):
+            self.reporter.notify()
+        self.wait_for_pushes(2)
+        time.sleep(0.3)
+
+        self.assertEqual(self.send.call_count, 2)
+        event, payload = self.send.call_args[0]
+        self.assertEqual(event, STATUS_EVENT)
+        self.assertIn("123456", payload["bots"])
+
+    def test_runtime_changes_notify_observers(self):
+        """Test that observers hear when a bot starts, stops or receives a message"""
+        observer = Mock()
+        self.hub.observers.append(observer)
+        self.runtime.on_change = self.hub._changed
+
+        self.runtime._changed()
+
+        observer.assert_called_once()
+
+    def test_no_push_outside_comfyui(self):
+        """Test that nothing is scheduled when there is no websocket to push to"""
+        reporter = StatusReporter()
+        reporter.notify()
+
+        self.assertIsNone(reporter._timer)
+
+
+if __name__ == "__main__":
+    unittest.main()
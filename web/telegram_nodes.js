@@ -1,8 +1,75 @@
 // ComfyUI Web UI for Telegram Bot Nodes
 
 import { app } from "/scripts/app.js";
+import { api } from "/scripts/api.js";
 import { ComfyWidgets } from "/scripts/widgets.js";
 
+// Latest runtime status pushed by the backend, keyed by bot id
+let telegramStatus = { bots: {}, receivedAt: 0 };
+
+// The public bot id is the part of the token before the colon
+function botId(token) {
+    return (token || "").trim().replace(/^bot/, "").split(":")[0];
+}
+
+function formatAge(seconds) {
+    if (seconds < 60) return `${Math.round(seconds)}s`;
+    if (seconds < 3600) return `${Math.round(seconds / 60)}m`;
+    return `${Math.round(seconds / 3600)}h`;
+}
+
+function botStatus(node) {
+    const token = node.widgets?.find((w) => w.name === "bot_token")?.value;
+    return token ? telegramStatus.bots[botId(token)] : undefined;
+}
+
+function errorText(status) {
+    if (!status.errors) return "";
+    const limited = status.rate_limited ? ` (${status.rate_limited} rate limited)` : "";
+    return ` · ${status.errors} errors${limited}`;
+}
+
+function listenerText(status) {
+    if (!status || status.connected === undefined) return "Not connected";
+    if (!status.connected) return "Stopped";
+    const elapsed = (Date.now() - telegramStatus.receivedAt) / 1000;
+    const state = status.polling ? "Polling" : "Connected, not polling";
+    const age = status.last_message_age == null
+        ? "no messages yet"
+        : `last message ${formatAge(status.last_message_age + elapsed)} ago`;
+    return `${state} · ${status.queue} queued · ${age}` + cacheText();
+}
+
+function cacheText() {
+    const cache = telegramStatus.cache;
+    if (!cache || !(cache.hits + cache.misses)) return "";
+    return ` · ${Math.round(cache.hit_rate * 100)}% from cache`;
+}
+
+function senderText(status) {
+    if (!status) return "Ready";
+    const backlog = status.backlog ? `${status.backlog} waiting to be resent` : "Ready";
+    return backlog + errorText(status);
+}
+
+// Render the status widget of every Telegram node on the canvas
+function refreshStatusWidgets() {
+    for (const node of app.graph?._nodes || []) {
+        const render = node.type === "TelegramListener" ? listenerText
+            : node.type === "SaveToTelegram" ? senderText : null;
+        const widget = node.widgets?.find((w) => w.name === "status");
+        if (!render || !widget) continue;
+        const remote = node.widgets?.find((w) => w.name === "remote_queue")?.value;
+        const value = render === listenerText && remote
+            ? "Reading the dispatcher queue"
+            : render(botStatus(node));
+        if (widget.value !== value) {
+            widget.value = value;
+            node.setDirtyCanvas(true, false);
+        }
+    }
+}
+
 // Register the Telegram Listener node
 app.registerExtension({
     name: "telegram.TelegramListener",
@@ -56,6 +123,14 @@ app.registerExtension({
 app.registerExtension({
     name: "telegram.utils",
     async setup() {
+        // Show the live bot status pushed over the websocket
+        api.addEventListener("telegram.status", ({ detail }) => {
+            telegramStatus = { ...detail, receivedAt: Date.now() };
+            refreshStatusWidgets();
+        });
+        // Keep the last message age ticking between pushes
+        setInterval(refreshStatusWidgets, 1000);
+        
         // Add telegram category to the node menu
         const origGetNodeMenuOptions = app.getNodeMenuOptions;
         app.getNodeMenuOptions = function(node) {